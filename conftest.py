@@ -0,0 +1,57 @@
+import os
+import sys
+import json
+import tempfile
+from pathlib import Path
+
+
+# the IP tests import the cores and their harness as `mcu_soc.design.ips.<module>`
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+
+# pytest options for the simulation harness in mcu_soc/design/ips/testing/sim.py; each one
+# sets the environment variable the harness reads.
+SIM_TRACE_OPTIONS = [
+    ("--sim-trace", "CHIPFLOW_SIM_TRACE", "write a compressed VCD trace for each simulation"),
+    ("--sim-trace-signals", "CHIPFLOW_SIM_TRACE_SIGNALS",
+     "comma-separated glob patterns of signals to trace (default: all)"),
+    ("--sim-trace-window", "CHIPFLOW_SIM_TRACE_WINDOW", "START:END range of clock cycles to trace"),
+    ("--sim-trace-dir", "CHIPFLOW_SIM_TRACE_DIR", "directory for traces (default: build/sim_traces)"),
+]
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup("sim", "Amaranth simulation")
+    for option, _, help in SIM_TRACE_OPTIONS:
+        if option == "--sim-trace":
+            group.addoption(option, action="store_true", default=None, help=help)
+        else:
+            group.addoption(option, default=None, help=help)
+
+
+def pytest_configure(config):
+    for option, variable, _ in SIM_TRACE_OPTIONS:
+        value = config.getoption(option)
+        if value is True:
+            os.environ[variable] = "1"
+        elif value is not None:
+            os.environ[variable] = value
+
+    fd, config._sim_report = tempfile.mkstemp(prefix="sim-report-", suffix=".jsonl")
+    os.close(fd)
+    os.environ["CHIPFLOW_SIM_REPORT"] = config._sim_report
+
+
+def pytest_terminal_summary(terminalreporter, config):
+    with open(config._sim_report) as f:
+        results = [json.loads(line) for line in f]
+    os.unlink(config._sim_report)
+    if not results:
+        return
+
+    terminalreporter.section("simulation throughput")
+    for result in results:
+        rate = result["cycles"] / result["seconds"] if result["seconds"] else float("inf")
+        trace = f"traced to {result['trace']}" if result["trace"] else "not traced"
+        terminalreporter.write_line(f"{result['name']:<24} {result['cycles']:>10} cycles "
+                                    f"{result['seconds']:>8.3f} s {rate:>12,.0f} cycles/s  {trace}")
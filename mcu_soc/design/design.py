@@ -1,7 +1,8 @@
 
+import os
 from pathlib import Path
 
-from amaranth import Module
+from amaranth import Module, Signal, Cat
 from amaranth.lib import wiring
 from amaranth.lib.wiring import Out, flipped, connect
 
@@ -20,12 +21,19 @@ from chipflow.platform import (
         )
 
 from .ips.pwm import PWMPins, PWMPeripheral
-# from .ips.pdm import PDMPeripheral
+from .ips.pwm_bank import PWMBank
+from .ips.pdm import PDMPeripheral
+from .ips.icache import ICache
+from .ips.crossbar import WishboneCrossbar
+from .ips.intc import InterruptController, register_bit
+from .ips.dma import DMAController
+from .ips.dedup import Deduplicator
+from .peripherals import FIXED_CSR_BASES, DMA_REQUESTS, load_peripheral_map
 
 __all__ = ["MySoC"]
 
 class MySoC(wiring.Component):
-    def __init__(self):
+    def __init__(self, *, peripherals=None, motor_count=None):
         # Top level interfaces
 
         interfaces = {
@@ -33,32 +41,58 @@ class MySoC(wiring.Component):
             "cpu_jtag": Out(JTAGSignature())
         }
 
-        self.user_spi_count = 3
-        self.i2c_count = 2
-        self.motor_count = 10
-        self.pdm_ao_count = 6
-        self.uart_count = 2
-
-        self.gpio_banks = 2
-        self.gpio_width = 8
-
-        for i in range(self.user_spi_count):
-            interfaces[f"user_spi_{i}"] = Out(SPISignature())
-
-        for i in range(self.i2c_count):
-            interfaces[f"i2c_{i}"] = Out(I2CSignature())
-
-        for i in range(self.motor_count):
-            interfaces[f"motor_pwm{i}"] = Out(PWMPins.Signature())
-
-#        for i in range(self.pdm_ao_count):
-#            interfaces[f"pdm_ao_{i}"] = Out(PDMPins.Signature())
-
-        for i in range(self.uart_count):
-            interfaces[f"uart_{i}"] = Out(UARTSignature())
-
-        for i in range(self.gpio_banks):
-            interfaces[f"gpio_{i}"] = Out(GPIOSignature(pin_count=self.gpio_width))
+        # Register bus width of the motor and PDM peripherals, 8 or 32 (CHIPFLOW_CSR_DATA_WIDTH).
+        # The 8-bit ones sit behind the Wishbone-CSR bridge, which takes one CSR transaction per
+        # byte of every access; the 32-bit ones are Wishbone targets of their own and answer in
+        # a single bus cycle. The other peripherals always have an 8-bit CSR bus.
+        self.csr_data_width = int(os.environ.get("CHIPFLOW_CSR_DATA_WIDTH", 8))
+        assert self.csr_data_width in (8, 32), "CSR data width must be 8 or 32"
+
+        # Instruction cache between the CPU and flash, 0 (none), 1 (direct-mapped) or 2 (two-way
+        # set associative) ways (CHIPFLOW_ICACHE_WAYS)
+        self.icache_ways = int(os.environ.get("CHIPFLOW_ICACHE_WAYS", 0))
+        assert self.icache_ways in (0, 1, 2), "icache ways must be 0, 1 or 2"
+        self.icache_sets = 64
+
+        # Connect the initiators (CPU instruction and data buses, debug module) to the targets
+        # through a crossbar (CHIPFLOW_CROSSBAR=1), so that e.g. a data access to SRAM needn't
+        # wait for an instruction fetch from flash, instead of through one shared arbiter
+        self.crossbar = os.environ.get("CHIPFLOW_CROSSBAR", "0") == "1"
+
+        self.dma_channels = 4
+
+        # Elaborate each distinct configuration of the repeated peripherals (motor drivers,
+        # UARTs, SPIs, I2Cs, GPIO banks) once and instantiate it for every copy
+        # (CHIPFLOW_DEDUP=1), so that the netlist and the time spent elaborating and
+        # simulating it grow with the number of configurations rather than of peripherals.
+        # Only with a platform that takes extra files, such as the simulation one.
+        self.dedup = os.environ.get("CHIPFLOW_DEDUP", "0") == "1"
+
+        # The repeated peripherals (SPIs, I2Cs, motor drivers, PDM outputs, UARTs and GPIO
+        # banks), their interfaces and register addresses, from [chipflow.peripherals] in
+        # chipflow.toml unless given; motor_count overrides the number of motor drivers
+        if peripherals is None:
+            counts = {} if motor_count is None else {"motor_pwm": motor_count}
+            peripherals = load_peripheral_map(csr_data_width=self.csr_data_width, counts=counts)
+        assert peripherals.csr_data_width == self.csr_data_width, \
+            "peripheral map is for a different CSR data width"
+        self.peripherals = peripherals
+
+        # Drive all motors from one PWMBank instead of a PWMPeripheral per motor (see
+        # chipflow.toml)
+        self.motor_bank = peripherals.options["motor_pwm"].get("bank", False)
+        self.gpio_width = peripherals.options["gpio"].get("width", 8)
+
+        signatures = {
+            "user_spi":  lambda: SPISignature(),
+            "i2c":       lambda: I2CSignature(),
+            "motor_pwm": lambda: PWMPins.Signature(),
+            "pdm_ao":    lambda: PDMPeripheral.WiringSignature,
+            "uart":      lambda: UARTSignature(),
+            "gpio":      lambda: GPIOSignature(pin_count=self.gpio_width),
+        }
+        for periph in peripherals:
+            interfaces[periph.interface] = Out(signatures[periph.kind]())
 
         super().__init__(interfaces)
 
@@ -69,51 +103,69 @@ class MySoC(wiring.Component):
         # Debug region
         self.debug_base        = 0xa0000000
 
-        # CSR regions:
+        # CSR regions (those of the repeated peripherals are in self.peripherals); with a
+        # 32-bit CSR data width, the 8-bit CSR window ends at 0xb8000000
+        fixed_bases = FIXED_CSR_BASES[self.csr_data_width]
         self.csr_base          = 0xb0000000
-        self.csr_spiflash_base = 0xb0000000
-
-        self.csr_gpio_base     = 0xb1000000
-        self.csr_uart_base     = 0xb2000000
-        self.csr_soc_id_base   = 0xb4000000
-
-        self.csr_user_spi_base = 0xb5000000
-        self.csr_i2c_base      = 0xb6000000
-        self.csr_motor_base    = 0xb7000000
-        self.csr_pdm_ao_base   = 0xb8000000
-
-        self.periph_offset     = 0x00100000
-        self.motor_offset      = 0x00000100
-        self.pdm_ao_offset     = 0x00000010
-
-        self.sram_size  = 0x800 # 2KiB
+        self.csr_spiflash_base = fixed_bases["spiflash"]
+        self.csr_icache_base   = fixed_bases["icache"]
+        self.csr_soc_id_base   = fixed_bases["soc_id"]
+        self.csr_intc_base     = fixed_bases["intc"]
+        self.csr_dma_base      = fixed_bases["dma"]
+
+        # SRAM holds the data, stack and any functions copied to RAM at boot (see
+        # software/ramfunc.h); CHIPFLOW_SRAM_SIZE overrides the default of 2KiB
+        self.sram_size  = int(os.environ.get("CHIPFLOW_SRAM_SIZE", "0x800"), 0)
+        assert self.sram_size & (self.sram_size - 1) == 0, "SRAM size must be a power of 2"
         self.bios_start = 0x100000 # 1MiB into spiflash to make room for a bitstream
 
     def elaborate(self, platform):
         m = Module()
 
-        wb_arbiter  = wishbone.Arbiter(addr_width=30, data_width=32, granularity=8)
-        wb_decoder  = wishbone.Decoder(addr_width=30, data_width=32, granularity=8)
-        csr_decoder = csr.Decoder(addr_width=28, data_width=8)
-
-        m.submodules.wb_arbiter  = wb_arbiter
-        m.submodules.wb_decoder  = wb_decoder
+        dedup = Deduplicator(platform, enabled=self.dedup)
+
+        if self.crossbar:
+            wb_crossbar = WishboneCrossbar(addr_width=30, data_width=32, granularity=8)
+            m.submodules.wb_crossbar = wb_crossbar
+            add_initiator, add_target = wb_crossbar.add_initiator, wb_crossbar.add
+        else:
+            wb_arbiter  = wishbone.Arbiter(addr_width=30, data_width=32, granularity=8)
+            wb_decoder  = wishbone.Decoder(addr_width=30, data_width=32, granularity=8)
+            m.submodules.wb_arbiter  = wb_arbiter
+            m.submodules.wb_decoder  = wb_decoder
+            connect(m, wb_arbiter.bus, wb_decoder.bus)
+            add_initiator, add_target = wb_arbiter.add, wb_decoder.add
+
+        csr_decoder = csr.Decoder(addr_width=28 if self.csr_data_width == 8 else 27, data_width=8)
         m.submodules.csr_decoder = csr_decoder
 
-        connect(m, wb_arbiter.bus, wb_decoder.bus)
+        def add_csr_peripheral(bus, name, addr):
+            if self.csr_data_width == 8:
+                csr_decoder.add(bus, name=name, addr=addr - self.csr_base)
+            else:
+                add_target(bus, name=name, addr=addr)
 
         # CPU
 
         cpu = CV32E40P(config="default", reset_vector=self.bios_start, dm_haltaddress=self.debug_base+0x800)
-        wb_arbiter.add(cpu.ibus)
-        wb_arbiter.add(cpu.dbus)
+        if self.icache_ways:
+            icache = ICache(base=self.mem_spiflash_base, size=1 << 24, ways=self.icache_ways,
+                            sets=self.icache_sets, features=cpu.ibus.signature.features,
+                            data_width=self.csr_data_width)
+            connect(m, cpu.ibus, icache.bus)
+            add_initiator(icache.mem)
+            add_csr_peripheral(icache.csr_bus, "icache", self.csr_icache_base)
+            m.submodules.icache = icache
+        else:
+            add_initiator(cpu.ibus)
+        add_initiator(cpu.dbus)
 
         m.submodules.cpu = cpu
 
         # Debug
         debug = OBIDebugModule()
-        wb_arbiter.add(debug.initiator)
-        wb_decoder.add(debug.target, name="debug", addr=self.debug_base)
+        add_initiator(debug.initiator)
+        add_target(debug.target, name="debug", addr=self.debug_base)
         m.d.comb += cpu.debug_req.eq(debug.debug_req)
 
         m.d.comb += [
@@ -129,7 +181,7 @@ class MySoC(wiring.Component):
         # SPI flash
 
         spiflash = QSPIFlash(addr_width=24, data_width=32)
-        wb_decoder.add(spiflash.wb_bus, name="spiflash", addr=self.mem_spiflash_base)
+        add_target(spiflash.wb_bus, name="spiflash", addr=self.mem_spiflash_base)
         csr_decoder.add(spiflash.csr_bus, name="spiflash", addr=self.csr_spiflash_base - self.csr_base)
         m.submodules.spiflash = spiflash
 
@@ -138,72 +190,134 @@ class MySoC(wiring.Component):
         # SRAM
 
         sram = WishboneSRAM(size=self.sram_size, data_width=32, granularity=8)
-        wb_decoder.add(sram.wb_bus, name="sram", addr=self.mem_sram_base)
+        add_target(sram.wb_bus, name="sram", addr=self.mem_sram_base)
 
         m.submodules.sram = sram
 
         # User SPI
-        for i in range(self.user_spi_count):
+        spi_irqs = []
+        spi_reqs = []
+        for periph in self.peripherals["user_spi"]:
             user_spi = SPIPeripheral()
 
-            base_addr = self.csr_user_spi_base + i * self.periph_offset
-            csr_decoder.add(user_spi.bus, name=f"user_spi_{i}", addr=base_addr  - self.csr_base)
+            csr_decoder.add(user_spi.bus, name=periph.csr, addr=periph.addr - self.csr_base)
 
             # FIXME: These assignments will disappear once we have a relevant peripheral available
-            pins = getattr(self, f"user_spi_{i}")
+            pins = getattr(self, periph.interface)
             connect(m, flipped(pins), user_spi.spi_pins)
-
-            setattr(m.submodules, f"user_spi_{i}", user_spi)
+            taps = dedup.add(m, periph.csr, user_spi, key=SPIPeripheral, taps={
+                "done": lambda spi: register_bit(spi.bus, "status", 0),
+            })
+            spi_irqs.append(taps["done"]) # transfer done
+            spi_reqs.append(spi_irqs[-1])
 
         # GPIOs
-        for i in range(self.gpio_banks):
+        for periph in self.peripherals["gpio"]:
             gpio = GPIOPeripheral(pin_count=self.gpio_width)
-            base_addr = self.csr_gpio_base + i * self.periph_offset
-            csr_decoder.add(gpio.bus, name=f"gpio_{i}", addr=base_addr - self.csr_base)
+            csr_decoder.add(gpio.bus, name=periph.csr, addr=periph.addr - self.csr_base)
 
-            pins = getattr(self, f"gpio_{i}")
+            pins = getattr(self, periph.interface)
             connect(m, flipped(pins), gpio.pins)
-            setattr(m.submodules, f"gpio_{i}", gpio)
+            dedup.add(m, periph.csr, gpio, key=(GPIOPeripheral, self.gpio_width))
 
         # UART
-        for i in range(self.uart_count):
-            uart = UARTPeripheral(init_divisor=int(25e6//115200), addr_width=5)
-            base_addr = self.csr_uart_base + i * self.periph_offset
-            csr_decoder.add(uart.bus, name=f"uart_{i}", addr=base_addr - self.csr_base)
-
-            pins = getattr(self, f"uart_{i}")
+        uart_irqs = []
+        uart_reqs = []
+        for periph in self.peripherals["uart"]:
+            uart_divisor = int(25e6//115200)
+            uart = UARTPeripheral(init_divisor=uart_divisor, addr_width=5)
+            csr_decoder.add(uart.bus, name=periph.csr, addr=periph.addr - self.csr_base)
+
+            pins = getattr(self, periph.interface)
             connect(m, flipped(pins), uart.pins)
-            setattr(m.submodules, f"uart_{i}", uart)
+            taps = dedup.add(m, periph.csr, uart, key=(UARTPeripheral, uart_divisor, 5), taps={
+                "rx_ready": lambda uart: register_bit(uart.bus, "rx.status", 0),
+                "tx_ready": lambda uart: register_bit(uart.bus, "tx.status", 0),
+            })
+            uart_irqs.append(taps["rx_ready"]) # received data ready
+            uart_reqs += [taps["tx_ready"], taps["rx_ready"]]
 
         # I2Cs
-        for i in range(self.i2c_count):
+        i2c_irqs = []
+        for periph in self.peripherals["i2c"]:
             # TODO: create a I2C peripheral and replace this GPIO
             i2c = I2CPeripheral()
 
-            base_addr = self.csr_i2c_base + i * self.periph_offset
-            csr_decoder.add(i2c.bus, name=f"i2c_{i}", addr=base_addr - self.csr_base)
+            csr_decoder.add(i2c.bus, name=periph.csr, addr=periph.addr - self.csr_base)
 
-            i2c_pins = getattr(self, f"i2c_{i}")
+            i2c_pins = getattr(self, periph.interface)
             connect(m, flipped(i2c_pins), i2c.i2c_pins)
-
-            setattr(m.submodules, f"i2c_{i}", i2c)
+            taps = dedup.add(m, periph.csr, i2c, key=I2CPeripheral, taps={
+                "busy": lambda i2c: register_bit(i2c.bus, "status", 0),
+            })
+            # busy stays low for as long as the controller is idle: interrupt on its falling
+            # edge instead
+            i2c_busy = Signal(name=f"{periph.csr}_busy")
+            m.d.sync += i2c_busy.eq(taps["busy"])
+            i2c_irqs.append(i2c_busy & ~taps["busy"]) # transfer done
 
         # Motor drivers
-        for i in range(self.motor_count):
-            motor_pwm = PWMPeripheral(pins=getattr(self, f"motor_pwm{i}"))
-            base_addr = self.csr_motor_base + i * self.motor_offset
-            csr_decoder.add(motor_pwm.bus, name=f"motor_pwm{i}", addr=base_addr - self.csr_base)
-
-            setattr(m.submodules, f"motor_pwm{i}", motor_pwm)
-
-        # # pdm_ao
-        # for i in range(self.pdm_ao_count):
-        #     pdm = PDMPeripheral(bitwidth=10)
-        #     base_addr = self.csr_pdm_ao_base + i * self.pdm_ao_offset
-        #     csr_decoder.add(pdm.bus, name=f"pdm{i}", addr=base_addr  - self.csr_base)
-        # 
-        #     setattr(m.submodules, f"pdm{i}", pdm)
-        #     m.d.comb += getattr(self, f"pdm_ao_{i}").eq(pdm.pdm_ao)
+        if self.motor_bank:
+            motor_pwm = PWMBank(pins=[getattr(self, periph.interface)
+                                      for periph in self.peripherals["motor_pwm"]],
+                                data_width=self.csr_data_width)
+            add_csr_peripheral(motor_pwm.bus, "motor_pwm_bank", self.peripherals.base("motor_pwm"))
+            motor_irqs = [motor_pwm.irq]
+
+            m.submodules.motor_pwm_bank = motor_pwm
+        else:
+            motor_irqs = []
+            for periph in self.peripherals["motor_pwm"]:
+                pins = getattr(self, periph.interface)
+                motor_pwm = PWMPeripheral(pins=pins, data_width=self.csr_data_width)
+                add_csr_peripheral(motor_pwm.bus, periph.csr, periph.addr)
+                motor_irqs.append(motor_pwm.irq)
+
+                dedup.add(m, periph.csr, motor_pwm, interfaces={"pins": pins},
+                          key=(PWMPeripheral, self.csr_data_width))
+
+        # pdm_ao
+        for periph in self.peripherals["pdm_ao"]:
+            pdm = PDMPeripheral(bitwidth=10, order=2, fifo_depth=16, data_width=self.csr_data_width)
+            add_csr_peripheral(pdm.bus, periph.csr, periph.addr)
+
+            m.submodules[periph.csr] = pdm
+            connect(m, flipped(getattr(self, periph.interface)), pdm.pdm)
+
+        # DMA, an initiator of its own. Its request lines are numbered in the order of
+        # DMA_REQUESTS (see peripherals.h), and are the status flags a driver would poll before
+        # each data register access. Neither interconnect, nor any target, has `err`, so bus
+        # errors are not reported: DMA_STATUS_ERROR is never set in this SoC.
+
+        dma_reqs = {"uart": uart_reqs, "user_spi": spi_reqs}
+        dma_reqs = [req for kind in DMA_REQUESTS for req in dma_reqs[kind]]
+        dma = DMAController(channels=self.dma_channels, requests=len(dma_reqs),
+                            data_width=self.csr_data_width)
+        add_initiator(dma.initiator)
+        add_csr_peripheral(dma.bus, "dma", self.csr_dma_base)
+        m.d.comb += dma.req.eq(Cat(dma_reqs))
+
+        m.submodules.dma = dma
+
+        # Interrupt controller, on the CPU's machine external interrupt. Sources are numbered
+        # as laid out by the peripheral map (see peripherals.h); where a peripheral has no
+        # interrupt output, the status flag its driver polls is used instead.
+
+        irqs = {"uart": uart_irqs, "user_spi": spi_irqs, "i2c": i2c_irqs, "dma": [dma.irq],
+                "motor_pwm": motor_irqs}
+        irq_sources = []
+        for kind, (_, count) in self.peripherals.irq_layout().items():
+            if len(irqs[kind]) > count:
+                irqs[kind] = [Cat(irqs[kind]).any()] # too many for a source each
+            irq_sources += irqs[kind]
+        intc = InterruptController(sources=len(irq_sources), data_width=self.csr_data_width)
+        add_csr_peripheral(intc.bus, "intc", self.csr_intc_base)
+        m.d.comb += [
+            intc.src.eq(Cat(irq_sources)),
+            cpu.irq[11].eq(intc.irq),
+        ]
+
+        m.submodules.intc = intc
 
         # SoC ID
 
@@ -215,7 +329,7 @@ class MySoC(wiring.Component):
         # Wishbone-CSR bridge
 
         wb_to_csr = WishboneCSRBridge(csr_decoder.bus, data_width=32)
-        wb_decoder.add(wb_to_csr.wb_bus, name="csr", addr=self.csr_base, sparse=False)
+        add_target(wb_to_csr.wb_bus, name="csr", addr=self.csr_base, sparse=False)
 
         m.submodules.wb_to_csr = wb_to_csr
 
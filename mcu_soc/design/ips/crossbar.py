@@ -0,0 +1,102 @@
+from amaranth import *
+from amaranth import Module
+from amaranth.utils import exact_log2
+
+from amaranth_soc.memory import MemoryMap
+
+
+__all__ = ["WishboneCrossbar"]
+
+
+class WishboneCrossbar(Elaboratable):
+    """Wishbone interconnect with a decoder per initiator and an arbiter per target.
+
+    This replaces a ``wishbone.Arbiter`` feeding a ``wishbone.Decoder``, where one initiator
+    waiting on a slow target (e.g. an instruction fetch from flash) holds up the others.
+    Here, initiators accessing different targets proceed in parallel; only those accessing the
+    same target are arbitrated, round-robin, with the grant held for as long as the granted
+    initiator keeps its cycle open. A target that is only accessed by one initiator therefore
+    adds no latency.
+
+    Initiators are added with :meth:`add_initiator` and targets with :meth:`add`, which takes
+    the same arguments as ``wishbone.Decoder.add``. Every bus must have the data width and
+    granularity of the crossbar, and ``memory_map`` describes the targets as the decoder's
+    would. Optional signals (``cti``, ``bte``, ``lock``, ``err``, ``rty``) are forwarded where
+    both sides have them.
+    """
+    def __init__(self, *, addr_width, data_width, granularity=None):
+        self.addr_width = addr_width
+        self.data_width = data_width
+        self.granularity = data_width if granularity is None else granularity
+        self._initiators = []
+        self._targets = []
+        self.memory_map = MemoryMap(addr_width=addr_width + exact_log2(data_width // self.granularity),
+                                    data_width=self.granularity)
+
+    def _check(self, bus):
+        assert len(bus.dat_w) == self.data_width, \
+            f"bus data width must be {self.data_width}, not {len(bus.dat_w)}"
+        assert len(bus.dat_w) // len(bus.sel) == self.granularity, \
+            f"bus granularity must be {self.granularity}"
+
+    def add_initiator(self, bus):
+        self._check(bus)
+        assert len(bus.adr) == self.addr_width, f"initiator address width must be {self.addr_width}"
+        self._initiators.append(bus)
+
+    def add(self, sub_bus, *, name=None, addr=None, sparse=None):
+        self._check(sub_bus)
+        start, end, ratio = self.memory_map.add_window(sub_bus.memory_map, name=name, addr=addr,
+                                                       sparse=sparse)
+        word_start = start // (self.data_width // self.granularity)
+        assert word_start % (1 << len(sub_bus.adr)) == 0, f"target {name} must be aligned to its size"
+        self._targets.append((sub_bus, word_start))
+        return start, end, ratio
+
+    def elaborate(self, platform):
+        m = Module()
+
+        # selects[i][t]: initiator i addresses target t
+        selects = []
+        for intr in self._initiators:
+            selects.append([intr.adr[len(sub.adr):] == (start >> len(sub.adr))
+                            for sub, start in self._targets])
+
+        for t, (sub, _) in enumerate(self._targets):
+            requests = Cat(intr.cyc & selects[i][t] for i, intr in enumerate(self._initiators))
+            grant = Signal(range(max(len(self._initiators), 2)), name=f"grant_{t}")
+
+            # when the granted initiator is done, pass the grant on to the next one requesting
+            n = len(self._initiators)
+            with m.Switch(grant):
+                for g in range(n):
+                    with m.Case(g):
+                        with m.If(~requests[g]):
+                            for k in reversed(range(1, n)):
+                                with m.If(requests[(g + k) % n]):
+                                    m.d.sync += grant.eq((g + k) % n)
+
+            for i, intr in enumerate(self._initiators):
+                granted = (grant == i) & requests[i]
+                with m.If(grant == i):
+                    m.d.comb += [
+                        sub.adr.eq(intr.adr),
+                        sub.dat_w.eq(intr.dat_w),
+                        sub.sel.eq(intr.sel),
+                        sub.we.eq(intr.we),
+                        sub.cyc.eq(requests[i]),
+                        sub.stb.eq(intr.stb & requests[i]),
+                    ]
+                    for name in ("cti", "bte", "lock"):
+                        if hasattr(sub, name) and hasattr(intr, name):
+                            m.d.comb += getattr(sub, name).eq(getattr(intr, name))
+                with m.If(granted):
+                    m.d.comb += [
+                        intr.dat_r.eq(sub.dat_r),
+                        intr.ack.eq(sub.ack),
+                    ]
+                    for name in ("err", "rty"):
+                        if hasattr(sub, name) and hasattr(intr, name):
+                            m.d.comb += getattr(intr, name).eq(getattr(sub, name))
+
+        return m
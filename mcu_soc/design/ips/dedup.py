@@ -0,0 +1,116 @@
+import warnings
+
+from amaranth import *
+from amaranth import Module
+from amaranth.back import rtlil
+from amaranth.hdl import UnusedElaboratable
+from amaranth.lib.wiring import Out
+
+
+__all__ = ["Deduplicator"]
+
+
+def _port_name(path):
+    return "__".join(str(part) for part in path)
+
+
+class _Template(Elaboratable):
+    def __init__(self, component, taps, domains):
+        self.component = component
+        self.taps = {name: (Signal.like(value, name=f"tap__{name}"), value)
+                     for name, value in taps.items()}
+        self.clocks = {domain: (Signal(name=f"{domain}__clk"), Signal(name=f"{domain}__rst"))
+                       for domain in domains}
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.component = self.component
+        for domain, (clk, rst) in self.clocks.items():
+            cd = ClockDomain(domain)
+            m.domains += cd
+            m.d.comb += [
+                cd.clk.eq(clk),
+                cd.rst.eq(rst),
+            ]
+        for signal, value in self.taps.values():
+            m.d.comb += signal.eq(value)
+        return m
+
+
+class Deduplicator:
+    """Elaborates each distinct configuration of a repeated component once.
+
+    :meth:`add` adds a component to a module. When enabled, the first component added with a
+    given ``key`` is converted to RTLIL on its own, and the result is added to ``platform``
+    with ``add_file``; that component and every later one with the same key are then
+    replaced by an ``Instance`` of this module, connected to their ports. The netlist, and
+    the time spent elaborating it and processing it downstream, then grow with the number of
+    distinct keys rather than the number of components. When disabled, or if the platform
+    cannot take extra files, components are added as submodules as usual.
+
+    ``key`` must capture everything that makes two components differ, i.e. their class and
+    constructor arguments. ``modules`` counts the components added under each module name.
+
+    A component replaced by an instance is never elaborated, nor are the elaboratables it
+    created itself (e.g. its register bridge), so when enabled, ``UnusedElaboratable``
+    warnings are ignored.
+    """
+    def __init__(self, platform, *, enabled=True):
+        self._platform = platform
+        self.enabled = enabled and hasattr(platform, "add_file")
+        self._names = {}
+        self.modules = {}
+        if self.enabled:
+            warnings.filterwarnings("ignore", category=UnusedElaboratable)
+
+    def add(self, m, name, component, *, key, interfaces=None, taps=None, domains=("sync",)):
+        """Add ``component`` to ``m`` as ``name``.
+
+        The ports are the members of the component's signature and of ``interfaces``, a dict
+        of other interfaces it drives or reads (e.g. ``{"pins": pins}``), along with the clock
+        and reset of each of its ``domains``. ``taps`` maps names to functions that take the
+        component and return a value inside it (e.g. a status bit, see :func:`register_bit`);
+        they are brought out as extra ports, and returned as a dict of values by name.
+        """
+        taps = {} if taps is None else taps
+        if not self.enabled:
+            m.submodules[name] = component
+            return {tap: function(component) for tap, function in taps.items()}
+
+        ports = {}
+        for path, member, value in component.signature.flatten(component):
+            ports[_port_name(path)] = (value, member.flow == Out)
+        for prefix, interface in ({} if interfaces is None else interfaces).items():
+            for path, member, value in interface.signature.flatten(interface):
+                ports[_port_name((prefix, *path))] = (value, member.flow == Out)
+        tap_values = {tap: function(component) for tap, function in taps.items()}
+
+        if key not in self._names:
+            module_name = f"{type(component).__name__}_{len(self._names)}"
+            template = _Template(component, tap_values, domains)
+            template_ports = {port: (value, None) for port, (value, _) in ports.items()}
+            for tap, (signal, _) in template.taps.items():
+                template_ports[signal.name] = (signal, None)
+            for domain, (clk, rst) in template.clocks.items():
+                template_ports[clk.name] = (clk, None)
+                template_ports[rst.name] = (rst, None)
+            self._platform.add_file(f"{module_name}.il",
+                                    rtlil.convert(template, name=module_name, ports=template_ports,
+                                                  platform=self._platform))
+            self._names[key] = module_name
+            self.modules[module_name] = 0
+        module_name = self._names[key]
+        self.modules[module_name] += 1
+
+        connections = {}
+        for port, (value, output) in ports.items():
+            connections[f"{'o' if output else 'i'}_{port}"] = value
+        for domain in domains:
+            connections[f"i_{domain}__clk"] = ClockSignal(domain)
+            connections[f"i_{domain}__rst"] = ResetSignal(domain)
+        tap_signals = {}
+        for tap, value in tap_values.items():
+            tap_signals[tap] = Signal.like(value, name=f"{name}__{tap}")
+            connections[f"o_tap__{tap}"] = tap_signals[tap]
+        m.submodules[name] = Instance(module_name, **connections)
+        return tap_signals
@@ -0,0 +1,279 @@
+from amaranth import *
+from amaranth import Module
+
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In, Out, flipped, connect
+from amaranth_soc import csr, wishbone
+
+from .wishbone_regs import WishboneRegisterBridge
+
+from chipflow.platform import SoftwareDriverSignature
+
+
+__all__ = ["DMAController"]
+
+
+class DMAController(wiring.Component):
+    class Addr(csr.Register, access="rw"):
+        """Byte address"""
+        val: csr.Field(csr.action.RW, unsigned(32))
+
+    class Count(csr.Register, access="rw"):
+        """Number of elements to transfer"""
+        val: csr.Field(csr.action.RW, unsigned(16))
+
+    class Ctrl(csr.Register, access="rw"):
+        """Channel control register: writing 1 to ``start`` starts the channel with the
+        programmed descriptor
+        """
+        start: csr.Field(csr.action.W, unsigned(1))
+        src_inc: csr.Field(csr.action.RW, unsigned(1))
+        dst_inc: csr.Field(csr.action.RW, unsigned(1))
+        size: csr.Field(csr.action.RW, unsigned(2))
+        req_en: csr.Field(csr.action.RW, unsigned(1))
+        ie: csr.Field(csr.action.RW, unsigned(1))
+        req_sel: csr.Field(csr.action.RW, unsigned(5))
+
+    class Status(csr.Register, access="rw"):
+        """Channel status register"""
+        busy: csr.Field(csr.action.R, unsigned(1))
+        done: csr.Field(csr.action.RW1C, unsigned(1))
+        error: csr.Field(csr.action.RW1C, unsigned(1))
+
+    class Remaining(csr.Register, access="r"):
+        """Elements left in the current descriptor"""
+        val: csr.Field(csr.action.R, unsigned(16))
+
+    """Multi-channel DMA controller, a Wishbone initiator (``initiator``) moving data between
+    memory and peripherals.
+
+    Each channel is programmed with a descriptor: ``src`` and ``dst`` byte addresses, a
+    ``count`` of elements of ``ctrl.size`` (0: byte, 1: half word, 2: word), whether each
+    address is incremented after every element (``ctrl.src_inc``, ``ctrl.dst_inc``), and the
+    address of the ``next`` descriptor in memory, or 0. A descriptor in memory is laid out as
+    the first five registers: src, dst, count, next and ctrl. Writing 1 to
+    ``ctrl.start`` runs the chain, after which ``status.done`` is set, and ``irq`` is raised
+    while it is set for any channel with ``ctrl.ie`` set. A bus error (``initiator.err``) stops
+    the channel and sets ``status.error`` (and ``status.done``); this needs an interconnect that
+    carries ``err`` back from its targets, which that of ``MySoC`` does not.
+
+    With ``ctrl.req_en`` set, each element waits for the peripheral request line
+    ``req[ctrl.req_sel]``, which a peripheral holds high while it can take (or provide) an
+    element, e.g. a transmitter's ready flag. After each such element, the line is ignored for
+    ``req_holdoff`` cycles to give it time to fall.
+
+    Channels take turns, one element at a time, in round-robin order.
+
+    ``data_width`` is the width of the register bus. With 8, ``bus`` is a CSR bus, to be placed
+    behind a ``csr.Decoder`` and ``WishboneCSRBridge``; with 32, it is a Wishbone target that
+    accesses any register in a single bus cycle (see :class:`WishboneRegisterBridge`). The
+    register offsets are the same either way.
+    """
+    def __init__(self, *, channels=4, requests=1, req_holdoff=2, data_width=8):
+        assert 1 <= channels <= 8, "DMAController supports 1 to 8 channels"
+        assert 1 <= requests <= 32, "DMAController supports 1 to 32 request lines"
+        assert data_width in (8, 32), "data_width must be 8 or 32"
+        self._channels = channels
+        self._requests = requests
+        self._req_holdoff = req_holdoff
+
+        regs = csr.Builder(addr_width=(0x20 * channels - 1).bit_length(), data_width=8)
+
+        self._ch = []
+        for i in range(channels):
+            base = 0x20 * i
+            self._ch.append({
+                "src": regs.add(f"ch{i}_src", self.Addr(), offset=base + 0x00),
+                "dst": regs.add(f"ch{i}_dst", self.Addr(), offset=base + 0x04),
+                "count": regs.add(f"ch{i}_count", self.Count(), offset=base + 0x08),
+                "next": regs.add(f"ch{i}_next", self.Addr(), offset=base + 0x0C),
+                "ctrl": regs.add(f"ch{i}_ctrl", self.Ctrl(), offset=base + 0x10),
+                "status": regs.add(f"ch{i}_status", self.Status(), offset=base + 0x14),
+                "remaining": regs.add(f"ch{i}_remaining", self.Remaining(), offset=base + 0x18),
+            })
+
+        if data_width == 8:
+            self._bridge = csr.Bridge(regs.as_memory_map())
+            bus_signature = csr.Signature(addr_width=regs.addr_width, data_width=regs.data_width)
+        else:
+            self._bridge = WishboneRegisterBridge(regs.as_memory_map(), data_width=data_width)
+            bus_signature = wishbone.Signature(addr_width=regs.addr_width - 2, data_width=data_width,
+                                               granularity=regs.data_width)
+
+        super().__init__(
+            SoftwareDriverSignature(
+                members={
+                    "bus": In(bus_signature),
+                    "initiator": Out(wishbone.Signature(addr_width=30, data_width=32, granularity=8,
+                                                        features={"err"})),
+                    "req": In(requests),
+                    "irq": Out(1),
+                },
+                component=self,
+                regs_struct='dma_regs_t',
+                h_files=['drivers/dma.h'])
+            )
+
+        self.bus.memory_map = self._bridge.bus.memory_map
+
+    @property
+    def channels(self):
+        return self._channels
+
+    @property
+    def requests(self):
+        return self._requests
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.bridge = self._bridge
+        connect(m, flipped(self.bus), self._bridge.bus)
+
+        n = self._channels
+
+        # working copy of each channel's current descriptor; flags are ctrl without start,
+        # i.e. src_inc, dst_inc, size, req_en, ie and req_sel from bit 0
+        active = Signal(n)
+        src = Array(Signal(32, name=f"src{i}") for i in range(n))
+        dst = Array(Signal(32, name=f"dst{i}") for i in range(n))
+        remaining = Array(Signal(16, name=f"remaining{i}") for i in range(n))
+        next_desc = Array(Signal(32, name=f"next{i}") for i in range(n))
+        flags = Array(Signal(11, name=f"flags{i}") for i in range(n))
+
+        done_set = Signal(n)
+        error_set = Signal(n)
+        irq = []
+        for i, ch in enumerate(self._ch):
+            ctrl = ch["ctrl"].f
+            with m.If(ctrl.start.w_stb & ctrl.start.w_data & ~active[i]):
+                m.d.sync += [
+                    active[i].eq(1),
+                    src[i].eq(ch["src"].f.val.data),
+                    dst[i].eq(ch["dst"].f.val.data),
+                    remaining[i].eq(ch["count"].f.val.data),
+                    next_desc[i].eq(ch["next"].f.val.data),
+                    flags[i].eq(Cat(ctrl.src_inc.data, ctrl.dst_inc.data, ctrl.size.data,
+                                    ctrl.req_en.data, ctrl.ie.data, ctrl.req_sel.data)),
+                ]
+            m.d.comb += [
+                ch["status"].f.busy.r_data.eq(active[i]),
+                ch["status"].f.done.set.eq(done_set[i] | error_set[i]),
+                ch["status"].f.error.set.eq(error_set[i]),
+                ch["remaining"].f.val.r_data.eq(remaining[i]),
+            ]
+            irq.append(ch["status"].f.done.data & ctrl.ie.data)
+        m.d.comb += self.irq.eq(Cat(irq).any())
+
+        # a channel is ready for its next element when its request line (if used) is high
+        holdoff = Signal(range(self._req_holdoff + 1))
+        with m.If(holdoff != 0):
+            m.d.sync += holdoff.eq(holdoff - 1)
+        ready = Signal(n)
+        for i in range(n):
+            requested = (holdoff == 0) & self.req.bit_select(flags[i][6:11], 1)
+            m.d.comb += ready[i].eq(active[i] & ((remaining[i] == 0) | ~flags[i][4] | requested))
+
+        # round-robin choice of the next channel, starting after the last one served
+        last = Signal(range(max(n, 2)))
+        chosen = Signal(range(max(n, 2)))
+        with m.Switch(last):
+            for g in range(n):
+                with m.Case(g):
+                    for k in reversed(range(1, n + 1)):
+                        with m.If(ready[(g + k) % n]):
+                            m.d.comb += chosen.eq((g + k) % n)
+
+        ch = Signal(range(max(n, 2)))
+        size = flags[ch][2:4]
+        step = Mux(size == 0, 1, Mux(size == 1, 2, 4))
+        lanes = Mux(size == 0, 0b0001, Mux(size == 1, 0b0011, 0b1111))
+        element = Signal(32)
+        desc_addr = Signal(30)
+        desc_word = Signal(range(5))
+        bus = self.initiator
+
+        with m.FSM():
+            with m.State("IDLE"):
+                with m.If(ready.any()):
+                    m.d.sync += [
+                        ch.eq(chosen),
+                        last.eq(chosen),
+                    ]
+                    with m.If(remaining[chosen] != 0):
+                        m.next = "READ"
+                    with m.Elif(next_desc[chosen] != 0):
+                        m.d.sync += [
+                            desc_addr.eq(next_desc[chosen][2:]),
+                            desc_word.eq(0),
+                        ]
+                        m.next = "DESCRIPTOR"
+                    with m.Else():
+                        m.d.sync += active.bit_select(chosen, 1).eq(0)
+                        m.d.comb += done_set.bit_select(chosen, 1).eq(1)
+
+            with m.State("READ"):
+                m.d.comb += [
+                    bus.adr.eq(src[ch][2:]),
+                    bus.sel.eq(lanes << src[ch][:2]),
+                    bus.cyc.eq(1),
+                    bus.stb.eq(1),
+                ]
+                with m.If(bus.ack):
+                    m.d.sync += element.eq(bus.dat_r >> Cat(C(0, 3), src[ch][:2]))
+                    m.next = "WRITE"
+                with m.Elif(bus.err):
+                    m.next = "ERROR"
+
+            with m.State("WRITE"):
+                m.d.comb += [
+                    bus.adr.eq(dst[ch][2:]),
+                    bus.sel.eq(lanes << dst[ch][:2]),
+                    bus.dat_w.eq(Mux(size == 0, element[:8].replicate(4),
+                                     Mux(size == 1, element[:16].replicate(2), element))),
+                    bus.we.eq(1),
+                    bus.cyc.eq(1),
+                    bus.stb.eq(1),
+                ]
+                with m.If(bus.ack):
+                    m.d.sync += [
+                        src[ch].eq(src[ch] + Mux(flags[ch][0], step, 0)),
+                        dst[ch].eq(dst[ch] + Mux(flags[ch][1], step, 0)),
+                        remaining[ch].eq(remaining[ch] - 1),
+                    ]
+                    with m.If(flags[ch][4]):
+                        m.d.sync += holdoff.eq(self._req_holdoff)
+                    m.next = "IDLE"
+                with m.Elif(bus.err):
+                    m.next = "ERROR"
+
+            with m.State("DESCRIPTOR"):
+                # fetch src, dst, count, next and ctrl in turn
+                m.d.comb += [
+                    bus.adr.eq(desc_addr + desc_word),
+                    bus.sel.eq(0b1111),
+                    bus.cyc.eq(1),
+                    bus.stb.eq(1),
+                ]
+                with m.If(bus.ack):
+                    with m.Switch(desc_word):
+                        with m.Case(0):
+                            m.d.sync += src[ch].eq(bus.dat_r)
+                        with m.Case(1):
+                            m.d.sync += dst[ch].eq(bus.dat_r)
+                        with m.Case(2):
+                            m.d.sync += remaining[ch].eq(bus.dat_r)
+                        with m.Case(3):
+                            m.d.sync += next_desc[ch].eq(bus.dat_r)
+                        with m.Case(4):
+                            m.d.sync += flags[ch].eq(bus.dat_r[1:])
+                            m.next = "IDLE"
+                    m.d.sync += desc_word.eq(desc_word + 1)
+                with m.Elif(bus.err):
+                    m.next = "ERROR"
+
+            with m.State("ERROR"):
+                m.d.sync += active.bit_select(ch, 1).eq(0)
+                m.d.comb += error_set.bit_select(ch, 1).eq(1)
+                m.next = "IDLE"
+
+        return m
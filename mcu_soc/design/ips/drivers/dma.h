@@ -0,0 +1,55 @@
+/* SPDX-License-Identifier: BSD-2-Clause */
+#ifndef DMA_H
+#define DMA_H
+
+#include <stdint.h>
+
+#define DMA_CTRL_START          0x1     // write 1 to run the channel's descriptor chain
+#define DMA_CTRL_SRC_INC        0x2
+#define DMA_CTRL_DST_INC        0x4
+#define DMA_CTRL_BYTE           (0x0 << 3)
+#define DMA_CTRL_HALF           (0x1 << 3)
+#define DMA_CTRL_WORD           (0x2 << 3)
+#define DMA_CTRL_REQ_EN         0x20    // wait for the request line before each element
+#define DMA_CTRL_IE             0x40
+#define DMA_CTRL_REQ_SEL(n)     ((n) << 7)
+
+#define DMA_STATUS_BUSY         0x1
+#define DMA_STATUS_DONE         0x2     // write 1 to clear
+#define DMA_STATUS_ERROR        0x4     // write 1 to clear; never set in MySoC, see design.py
+
+typedef struct {
+    uint32_t src;
+    uint32_t dst;
+    uint32_t count;         // elements
+    uint32_t next;          // next dma_desc_t, or 0
+    uint32_t ctrl;
+    uint32_t status;
+    uint32_t remaining;     // elements left in the current descriptor
+    uint32_t reserved;
+} dma_regs_t;             // one per channel: DMA[ch]
+
+// A descriptor in memory, word aligned, laid out as the channel registers; DMA_CTRL_START is
+// ignored
+typedef struct {
+    uint32_t src;
+    uint32_t dst;
+    uint32_t count;
+    uint32_t next;
+    uint32_t ctrl;
+} dma_desc_t;
+
+static inline void dma_start(volatile dma_regs_t *dma, unsigned ch, const volatile void *src,
+                             volatile void *dst, uint32_t count, uint32_t ctrl) {
+    dma[ch].src = (uint32_t)src;
+    dma[ch].dst = (uint32_t)dst;
+    dma[ch].count = count;
+    dma[ch].next = 0;
+    dma[ch].ctrl = ctrl | DMA_CTRL_START;
+}
+
+static inline int dma_busy(volatile dma_regs_t *dma, unsigned ch) {
+    return dma[ch].status & DMA_STATUS_BUSY;
+}
+
+#endif
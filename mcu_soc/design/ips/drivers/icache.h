@@ -0,0 +1,17 @@
+/* SPDX-License-Identifier: BSD-2-Clause */
+#ifndef ICACHE_H
+#define ICACHE_H
+
+#include <stdint.h>
+
+#define ICACHE_CTRL_EN      0x1
+#define ICACHE_CTRL_FLUSH   0x2 // write 1 to invalidate every line
+#define ICACHE_CTRL_CLEAR   0x4 // write 1 to reset the counters
+
+typedef struct {
+    uint32_t ctrl;
+    uint32_t hits;
+    uint32_t misses;
+} icache_regs_t;
+
+#endif
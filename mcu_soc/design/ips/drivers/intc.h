@@ -0,0 +1,19 @@
+/* SPDX-License-Identifier: BSD-2-Clause */
+#ifndef INTC_H
+#define INTC_H
+
+#include <stdint.h>
+
+#define INTC_CLAIM_SOURCE   0xFF
+#define INTC_CLAIM_VALID    0x100
+
+typedef struct {
+    uint32_t pending;       // one bit per source, write 1 to clear
+    uint32_t enable;        // one bit per source
+    uint32_t threshold;     // only priorities above this are signalled
+    uint32_t claim;         // INTC_CLAIM_VALID | highest priority source
+    uint32_t reserved[4];
+    uint32_t priority[];    // one per source, 0 (never signalled) to 15
+} intc_regs_t;
+
+#endif
@@ -4,13 +4,30 @@
 
 #include <stdint.h>
 
+#define MOTOR_PWM_CONF_EN           0x1
+#define MOTOR_PWM_CONF_DIR          0x2
+#define MOTOR_PWM_CONF_STREAM       0x4
+#define MOTOR_PWM_CONF_STOP_IE      0x8
+
+#define MOTOR_PWM_FIFO_CONF_LOW_IE  0x100
+
+#define MOTOR_PWM_FIFO_INT_LOW      0x1
+#define MOTOR_PWM_FIFO_INT_UNDERRUN 0x2
+
 typedef struct {
     uint32_t numr;
     uint32_t denom;
     uint32_t conf;
     uint32_t stop_int;
     uint32_t status;
+    // only present when the peripheral is built with a FIFO
+    uint32_t fifo;          // write a duty cycle numerator
+    uint32_t fifo_status;   // number of entries in the FIFO
+    uint32_t fifo_conf;     // watermark in bits 7:0, MOTOR_PWM_FIFO_CONF_LOW_IE
+    uint32_t fifo_int;      // MOTOR_PWM_FIFO_INT_*, write 1 to clear
+    uint32_t prescale;      // the counter advances every prescale + 1 cycles
+    // only present when the peripheral has complementary outputs
+    uint32_t deadtime;      // cycles both outputs are low after each edge
 } motor_pwm_regs_t;
 
 #endif
-
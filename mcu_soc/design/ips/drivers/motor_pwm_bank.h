@@ -0,0 +1,24 @@
+/* SPDX-License-Identifier: BSD-2-Clause */
+#ifndef MOTOR_PWM_BANK_H
+#define MOTOR_PWM_BANK_H
+
+#include <stdint.h>
+
+#define MOTOR_PWM_BANK_CONF_EN      0x1
+#define MOTOR_PWM_BANK_CONF_STOP_IE 0x2
+
+#define MOTOR_PWM_BANK_COMMIT   0x1
+#define MOTOR_PWM_BANK_PENDING  0x2
+
+typedef struct {
+    uint32_t denom;     // shadow, latched by commit
+    uint32_t conf;
+    uint32_t commit;    // write MOTOR_PWM_BANK_COMMIT, reads MOTOR_PWM_BANK_PENDING until latched
+    uint32_t dir;       // shadow, one bit per channel
+    uint32_t stop_int;  // one bit per channel, write 1 to clear
+    uint32_t status;    // stop pin, one bit per channel
+    uint32_t reserved[2];
+    uint32_t duty[];    // shadow, one per channel
+} motor_pwm_bank_regs_t;
+
+#endif
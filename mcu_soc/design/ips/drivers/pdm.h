@@ -4,10 +4,19 @@
 
 #include <stdint.h>
 
+#define PDM_CONF_EN             0x1
+#define PDM_CONF_STREAM         0x2
+
+#define PDM_FIFO_INT_UNDERRUN   0x1
+
 typedef struct {
     uint32_t outval;
     uint32_t conf;
+    // only present when the peripheral is built with a FIFO
+    uint32_t divider;       // sample period minus one, in clock cycles
+    uint32_t fifo;          // write a sample
+    uint32_t fifo_status;   // number of entries in the FIFO
+    uint32_t fifo_int;      // PDM_FIFO_INT_UNDERRUN, write 1 to clear
 } pdm_regs_t;
 
 #endif
-
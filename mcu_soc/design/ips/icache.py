@@ -0,0 +1,254 @@
+from amaranth import *
+from amaranth import Module
+from amaranth.utils import exact_log2
+
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In, Out, flipped, connect
+from amaranth.lib.memory import Memory
+from amaranth_soc import csr, wishbone
+
+from .wishbone_regs import WishboneRegisterBridge
+
+from chipflow.platform import SoftwareDriverSignature
+
+
+__all__ = ["ICache"]
+
+
+class ICache(wiring.Component):
+    class Ctrl(csr.Register, access="rw"):
+        """Control register: ``en`` enables the cache, writing 1 to ``flush`` invalidates every
+        line, and writing 1 to ``clear`` resets the counters
+        """
+        en: csr.Field(csr.action.RW, unsigned(1), init=1)
+        flush: csr.Field(csr.action.W, unsigned(1))
+        clear: csr.Field(csr.action.W, unsigned(1))
+
+    class Counter(csr.Register, access="r"):
+        """Event counter
+        """
+        count: csr.Field(csr.action.R, unsigned(32))
+
+    """Read-only instruction cache, to be placed between a CPU instruction bus (``bus``) and the
+    interconnect (``mem``).
+
+    Reads within the ``size`` bytes at ``base`` (the flash) are cached in ``ways`` (1 for
+    direct-mapped, 2 for two-way set associative with LRU replacement) of ``sets`` lines of
+    ``line_words`` 32-bit words. A hit is acknowledged on the cycle after the request. A miss
+    fetches the whole line from ``mem``, one word at a time, and then completes as a hit. Other
+    accesses, and all accesses while ``ctrl.en`` is clear, are passed through unchanged.
+
+    ``hits`` and ``misses`` count cached reads. A flush is carried out at the next cycle in
+    which no uncached access is in progress, and takes ``sets`` cycles.
+
+    ``features`` are the optional Wishbone signals of the CPU bus, which are passed through for
+    uncached accesses. ``data_width`` is the width of the register bus (``csr_bus``), as for the
+    other peripherals.
+    """
+    def __init__(self, *, base, size, ways=1, sets=64, line_words=4, features=frozenset(),
+                 data_width=8):
+        assert ways in (1, 2), "ways must be 1 or 2"
+        assert base % size == 0, "base must be aligned to size"
+        assert data_width in (8, 32), "data_width must be 8 or 32"
+        self._base = base
+        self._size = size
+        self._ways = ways
+        self._sets = sets
+        self._line_words = line_words
+        self._features = frozenset(features)
+        # checks that these are powers of 2
+        self._offset_bits = exact_log2(line_words)
+        self._index_bits = exact_log2(sets)
+        self._region_bits = exact_log2(size // 4)
+        assert self._region_bits > self._offset_bits + self._index_bits, \
+            "size must be larger than the cache"
+
+        regs = csr.Builder(addr_width=4, data_width=8)
+
+        self._ctrl = regs.add("ctrl", self.Ctrl(), offset=0x0)
+        self._hits = regs.add("hits", self.Counter(), offset=0x4)
+        self._misses = regs.add("misses", self.Counter(), offset=0x8)
+
+        if data_width == 8:
+            self._bridge = csr.Bridge(regs.as_memory_map())
+            csr_signature = csr.Signature(addr_width=regs.addr_width, data_width=regs.data_width)
+        else:
+            self._bridge = WishboneRegisterBridge(regs.as_memory_map(), data_width=data_width)
+            csr_signature = wishbone.Signature(addr_width=regs.addr_width - 2, data_width=data_width,
+                                               granularity=regs.data_width)
+
+        bus_signature = wishbone.Signature(addr_width=30, data_width=32, granularity=8,
+                                           features=self._features)
+
+        super().__init__(
+            SoftwareDriverSignature(
+                members={
+                    "bus": In(bus_signature),
+                    "mem": Out(bus_signature),
+                    "csr_bus": In(csr_signature),
+                },
+                component=self,
+                regs_struct='icache_regs_t',
+                h_files=['drivers/icache.h'])
+            )
+
+        self.csr_bus.memory_map = self._bridge.bus.memory_map
+
+    @property
+    def ways(self):
+        return self._ways
+
+    @property
+    def sets(self):
+        return self._sets
+
+    @property
+    def line_words(self):
+        return self._line_words
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.bridge = self._bridge
+        connect(m, flipped(self.csr_bus), self._bridge.bus)
+
+        tag_bits = self._region_bits - self._index_bits - self._offset_bits
+        offset = self.bus.adr[:self._offset_bits]
+        index = self.bus.adr[self._offset_bits:self._offset_bits + self._index_bits]
+        tag = self.bus.adr[self._offset_bits + self._index_bits:self._region_bits]
+        line = self.bus.adr[self._offset_bits:]
+
+        request = self.bus.cyc & self.bus.stb
+        cacheable = ((self.bus.adr[self._region_bits:] == self._base // self._size) &
+                     ~self.bus.we & (self._ctrl.f.en.data == 1))
+
+        # per way: data words, and tags with a valid bit on top
+        data_rd, data_wr, tags_rd, tags_wr = [], [], [], []
+        for way in range(self._ways):
+            data = Memory(shape=32, depth=self._sets * self._line_words, init=[])
+            tags = Memory(shape=tag_bits + 1, depth=self._sets, init=[])
+            m.submodules[f"data{way}"] = data
+            m.submodules[f"tags{way}"] = tags
+            data_rd.append(data.read_port())
+            data_wr.append(data.write_port())
+            tags_rd.append(tags.read_port())
+            tags_wr.append(tags.write_port())
+            m.d.comb += [
+                data_rd[way].addr.eq(Cat(offset, index)),
+                tags_rd[way].addr.eq(index),
+            ]
+
+        # `lookup` is set while the memories hold the line of the pending request
+        lookup = Signal()
+        match = Signal(self._ways)
+        m.d.comb += match.eq(Cat(port.data == Cat(tag, 1) for port in tags_rd))
+        hit_way = match[1] if self._ways == 2 else C(0)
+        hit_data = Mux(hit_way, data_rd[-1].data, data_rd[0].data)
+
+        # way to replace next in each set
+        lru = Signal(self._sets)
+        victim = Signal(range(self._ways))
+        fill = Signal(range(self._line_words))
+        flush_index = Signal(range(self._sets))
+        flush_pending = Signal()
+
+        hits = Signal(32)
+        misses = Signal(32)
+        m.d.comb += [
+            self._hits.f.count.r_data.eq(hits),
+            self._misses.f.count.r_data.eq(misses),
+        ]
+        with m.If(self._ctrl.f.clear.w_stb & self._ctrl.f.clear.w_data):
+            m.d.sync += [
+                hits.eq(0),
+                misses.eq(0),
+            ]
+        with m.If(self._ctrl.f.flush.w_stb & self._ctrl.f.flush.w_data):
+            m.d.sync += flush_pending.eq(1)
+
+        with m.FSM():
+            with m.State("LOOKUP"):
+                with m.If(request & ~cacheable):
+                    m.d.comb += [
+                        self.mem.adr.eq(self.bus.adr),
+                        self.mem.dat_w.eq(self.bus.dat_w),
+                        self.mem.sel.eq(self.bus.sel),
+                        self.mem.we.eq(self.bus.we),
+                        self.mem.cyc.eq(1),
+                        self.mem.stb.eq(1),
+                        self.bus.dat_r.eq(self.mem.dat_r),
+                        self.bus.ack.eq(self.mem.ack),
+                    ]
+                    for name in ("cti", "bte", "lock"):
+                        if name in self._features:
+                            m.d.comb += getattr(self.mem, name).eq(getattr(self.bus, name))
+                    for name in ("err", "rty", "stall"):
+                        if name in self._features:
+                            m.d.comb += getattr(self.bus, name).eq(getattr(self.mem, name))
+                    m.d.sync += lookup.eq(0)
+                with m.Elif(lookup):
+                    m.d.sync += lookup.eq(0)
+                    with m.If(match.any()):
+                        m.d.comb += [
+                            self.bus.dat_r.eq(hit_data),
+                            self.bus.ack.eq(1),
+                        ]
+                        m.d.sync += [
+                            hits.eq(hits + 1),
+                            lru.bit_select(index, 1).eq(~hit_way),
+                        ]
+                    with m.Else():
+                        valid = [port.data[-1] for port in tags_rd]
+                        if self._ways == 2:
+                            m.d.sync += victim.eq(Mux(~valid[0], 0, Mux(~valid[1], 1,
+                                                                         lru.bit_select(index, 1))))
+                        m.d.sync += [
+                            misses.eq(misses + 1),
+                            fill.eq(0),
+                        ]
+                        m.next = "REFILL"
+                with m.Elif(flush_pending):
+                    m.d.sync += flush_index.eq(0)
+                    m.next = "FLUSH"
+                with m.Elif(request):
+                    m.d.sync += lookup.eq(1)
+
+            with m.State("REFILL"):
+                m.d.comb += [
+                    self.mem.adr.eq(Cat(fill, line)),
+                    self.mem.sel.eq(0b1111),
+                    self.mem.cyc.eq(1),
+                    self.mem.stb.eq(1),
+                ]
+                for way in range(self._ways):
+                    m.d.comb += [
+                        data_wr[way].addr.eq(Cat(fill, index)),
+                        data_wr[way].data.eq(self.mem.dat_r),
+                        data_wr[way].en.eq(self.mem.ack & (victim == way)),
+                        tags_wr[way].addr.eq(index),
+                        tags_wr[way].data.eq(Cat(tag, 1)),
+                        tags_wr[way].en.eq(self.mem.ack & (victim == way) &
+                                           (fill == self._line_words - 1)),
+                    ]
+                with m.If(self.mem.ack):
+                    m.d.sync += fill.eq(fill + 1)
+                    with m.If(fill == self._line_words - 1):
+                        m.d.sync += lru.bit_select(index, 1).eq(~victim)
+                        m.next = "LOOKUP"
+                if "err" in self._features:
+                    with m.If(self.mem.err):
+                        m.d.comb += self.bus.err.eq(1)
+                        m.next = "LOOKUP"
+
+            with m.State("FLUSH"):
+                for way in range(self._ways):
+                    m.d.comb += [
+                        tags_wr[way].addr.eq(flush_index),
+                        tags_wr[way].data.eq(0),
+                        tags_wr[way].en.eq(1),
+                    ]
+                m.d.sync += flush_index.eq(flush_index + 1)
+                with m.If(flush_index == self._sets - 1):
+                    m.d.sync += flush_pending.eq(0)
+                    m.next = "LOOKUP"
+
+        return m
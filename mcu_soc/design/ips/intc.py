@@ -0,0 +1,142 @@
+from amaranth import *
+from amaranth import Module
+
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In, Out, flipped, connect
+from amaranth_soc import csr, wishbone
+
+from .wishbone_regs import WishboneRegisterBridge
+
+from chipflow.platform import SoftwareDriverSignature
+
+
+__all__ = ["InterruptController", "register_bit"]
+
+
+def _register_name(path):
+    return ".".join("_".join(str(part) for part in name) if isinstance(name, tuple) else str(name)
+                    for name in path)
+
+
+def register_bit(bus, name, bit):
+    """Return bit ``bit`` of register ``name`` (e.g. ``"rx.status"``) in the memory map of a
+    peripheral's ``bus``, as the peripheral presents it to a read.
+
+    This lets a status flag that firmware would otherwise poll be used as an interrupt source,
+    for peripherals without an interrupt output of their own.
+    """
+    for info in bus.memory_map.all_resources():
+        if _register_name(info.path) != name:
+            continue
+        offset = 0
+        for _, action in info.resource:
+            width = Shape.cast(action.port.shape).width
+            if offset <= bit < offset + width:
+                return action.port.r_data[bit - offset]
+            offset += width
+        raise ValueError(f"Register {name} has no bit {bit}")
+    raise ValueError(f"No register {name} in the memory map")
+
+
+class InterruptController(wiring.Component):
+    class Claim(csr.Register, access="r"):
+        """Highest priority interrupt: ``valid`` is set if there is one, ``source`` is its index
+        """
+        source: csr.Field(csr.action.R, unsigned(8))
+        valid: csr.Field(csr.action.R, unsigned(1))
+
+    class Threshold(csr.Register, access="rw"):
+        """Only interrupts with a priority above this are signalled
+        """
+        val: csr.Field(csr.action.RW, unsigned(4))
+
+    class Priority(csr.Register, access="rw"):
+        """Priority of one source, 0 (never signalled) to 15
+        """
+        val: csr.Field(csr.action.RW, unsigned(4), init=1)
+
+    """Interrupt aggregation for ``sources`` interrupt sources.
+
+    Each bit of ``src`` is an active-high, level-sensitive source. While it is high, its bit in
+    ``pending`` is set; writing 1 clears it, so a source that pulses is latched until firmware
+    has seen it. ``irq`` is raised, one cycle later, while any source is pending, enabled (in
+    ``enable``) and has a priority (``priority<n>``) above ``threshold``. ``claim`` gives the
+    highest priority such source, the lowest numbered one among equals.
+
+    Firmware handles an interrupt by reading ``claim``, dealing with the source's condition
+    in the peripheral, and then clearing its ``pending`` bit.
+
+    ``data_width`` is the width of the register bus. With 8, ``bus`` is a CSR bus, to be placed
+    behind a ``csr.Decoder`` and ``WishboneCSRBridge``; with 32, it is a Wishbone target that
+    accesses any register in a single bus cycle (see :class:`WishboneRegisterBridge`). The
+    register offsets are the same either way.
+    """
+    def __init__(self, *, sources, data_width=8):
+        assert 1 <= sources <= 32, "InterruptController supports 1 to 32 sources"
+        assert data_width in (8, 32), "data_width must be 8 or 32"
+        self._sources = sources
+
+        regs = csr.Builder(addr_width=(0x20 + 4 * sources - 1).bit_length(), data_width=8)
+
+        self._pending = regs.add("pending", csr.Register({
+            "val": csr.Field(csr.action.RW1C, unsigned(sources))
+        }, access="rw"), offset=0x0)
+        self._enable = regs.add("enable", csr.Register({
+            "val": csr.Field(csr.action.RW, unsigned(sources))
+        }, access="rw"), offset=0x4)
+        self._threshold = regs.add("threshold", self.Threshold(), offset=0x8)
+        self._claim = regs.add("claim", self.Claim(), offset=0xC)
+        self._priority = [regs.add(f"priority{i}", self.Priority(), offset=0x20 + 4 * i)
+                          for i in range(sources)]
+
+        if data_width == 8:
+            self._bridge = csr.Bridge(regs.as_memory_map())
+            bus_signature = csr.Signature(addr_width=regs.addr_width, data_width=regs.data_width)
+        else:
+            self._bridge = WishboneRegisterBridge(regs.as_memory_map(), data_width=data_width)
+            bus_signature = wishbone.Signature(addr_width=regs.addr_width - 2, data_width=data_width,
+                                               granularity=regs.data_width)
+
+        super().__init__(
+            SoftwareDriverSignature(
+                members={
+                    "bus": In(bus_signature),
+                    "src": In(sources),
+                    "irq": Out(1),
+                },
+                component=self,
+                regs_struct='intc_regs_t',
+                h_files=['drivers/intc.h'])
+            )
+
+        self.bus.memory_map = self._bridge.bus.memory_map
+
+    @property
+    def sources(self):
+        return self._sources
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.bridge = self._bridge
+        connect(m, flipped(self.bus), self._bridge.bus)
+
+        m.d.comb += self._pending.f.val.set.eq(self.src)
+
+        # pick the highest priority eligible source, scanning from the highest numbered so
+        # that the lowest numbered one wins a tie
+        active = self._pending.f.val.data & self._enable.f.val.data
+        best, best_priority = C(0, range(self._sources)), C(0, 4)
+        for i in reversed(range(self._sources)):
+            priority = self._priority[i].f.val.data
+            take = active[i] & (priority != 0) & (priority >= best_priority)
+            best = Mux(take, i, best)
+            best_priority = Mux(take, priority, best_priority)
+
+        valid = best_priority > self._threshold.f.val.data
+        m.d.comb += [
+            self._claim.f.source.r_data.eq(Mux(valid, best, 0)),
+            self._claim.f.valid.r_data.eq(valid),
+        ]
+        m.d.sync += self.irq.eq(valid)
+
+        return m
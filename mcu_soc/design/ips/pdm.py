@@ -3,7 +3,10 @@ from amaranth import Module
 
 from amaranth.lib import wiring
 from amaranth.lib.wiring import In, Out, flipped, connect
-from amaranth_soc import csr
+from amaranth.lib.fifo import SyncFIFOBuffered
+from amaranth_soc import csr, wishbone
+
+from .wishbone_regs import WishboneRegisterBridge
 
 from chipflow.platform import OutputIOSignature, SoftwareDriverSignature
 
@@ -19,26 +22,70 @@ class PDMPeripheral(wiring.Component):
     class Conf(csr.Register, access="rw"):
         """Configuration register """
         en: csr.Field(csr.action.RW, unsigned(1))
+        stream: csr.Field(csr.action.RW, unsigned(1))
+
+    class Divider(csr.Register, access="rw"):
+        """Sample period minus one, in clock cycles"""
+        val: csr.Field(csr.action.RW, unsigned(16))
+
+    class Fifo(csr.Register, access="w"):
+        """Sample FIFO"""
+        data: csr.Field(csr.action.W, unsigned(16))
+
+    class Fifo_int(csr.Register, access="rw"):
+        """FIFO interrupt register"""
+        underrun: csr.Field(csr.action.RW1C, unsigned(1))
 
     WiringSignature = OutputIOSignature(1)
 
-    def __init__(self, *, bitwidth):
+    """Pulse density modulator.
+
+    ``order`` selects the modulator: 1 is a first-order sigma-delta, 2 a second-order one
+    with noise shaping of (1 - z^-1)^2, which pushes quantisation noise out of the signal band
+    and gives a much higher in-band SNR for oversampled signals.
+
+    With ``fifo_depth`` > 0, setting ``conf.stream`` takes samples from a FIFO instead of
+    ``outval``, one every ``divider + 1`` cycles. If the FIFO is empty when a sample is due,
+    the current one is held and ``fifo_int.underrun`` is set.
+
+    ``data_width`` is the width of the register bus. With 8, ``bus`` is a CSR bus, to be placed
+    behind a ``csr.Decoder`` and ``WishboneCSRBridge``; with 32, it is a Wishbone target that
+    accesses any register in a single bus cycle (see :class:`WishboneRegisterBridge`). The
+    register offsets are the same either way.
+    """
+    def __init__(self, *, bitwidth, order=1, fifo_depth=0, data_width=8):
+        assert data_width in (8, 32), "data_width must be 8 or 32"
+        assert order in (1, 2), "order must be 1 or 2"
         self._bitwidth = bitwidth
+        self._order = order
+        self._fifo_depth = fifo_depth
 
-        addr_width=3
-        data_width=8
+        addr_width=3 if fifo_depth == 0 else 5
 
-        regs = csr.Builder(addr_width=addr_width, data_width=data_width)
+        regs = csr.Builder(addr_width=addr_width, data_width=8)
 
         self._outval = regs.add("outval", self.OutVal(), offset=0x0)
         self._conf = regs.add("conf", self.Conf(), offset=0x4)
-
-        self._bridge = csr.Bridge(regs.as_memory_map())
+        if fifo_depth > 0:
+            self._divider = regs.add("divider", self.Divider(), offset=0x8)
+            self._fifo = regs.add("fifo", self.Fifo(), offset=0xC)
+            self._fifo_status = regs.add("fifo_status", csr.Register({
+                "level": csr.Field(csr.action.R, range(fifo_depth + 1)),
+            }, access="r"), offset=0x10)
+            self._fifo_int = regs.add("fifo_int", self.Fifo_int(), offset=0x14)
+
+        if data_width == 8:
+            self._bridge = csr.Bridge(regs.as_memory_map())
+            bus_signature = csr.Signature(addr_width=regs.addr_width, data_width=regs.data_width)
+        else:
+            self._bridge = WishboneRegisterBridge(regs.as_memory_map(), data_width=data_width)
+            bus_signature = wishbone.Signature(addr_width=regs.addr_width - 2, data_width=data_width,
+                                               granularity=regs.data_width)
 
         super().__init__(
             SoftwareDriverSignature(
                 members={
-                    "bus": In(csr.Signature(addr_width=addr_width, data_width=data_width)),
+                    "bus": In(bus_signature),
                     "pdm": Out(self.WiringSignature)
                 },
                 component=self,
@@ -52,28 +99,104 @@ class PDMPeripheral(wiring.Component):
     def bitwidth(self):
         return self._bitwidth
 
+    @property
+    def order(self):
+        return self._order
+
+    @property
+    def fifo_depth(self):
+        return self._fifo_depth
+
     def elaborate(self, platform):
         m = Module()
         m.submodules.bridge = self._bridge
-        maxval = Const(int((2**self._bitwidth)-1), unsigned(self._bitwidth))
-        error = Signal(unsigned(self._bitwidth), init=0x0)
-        error_0 = Signal(unsigned(self._bitwidth), init=0x0)
-        error_1 = Signal(unsigned(self._bitwidth), init=0x0)
-        pdm_ao = Signal()
         connect(m, flipped(self.bus), self._bridge.bus)
-        m.d.sync += [
-            error_1.eq(error + maxval - self._outval.f.val.data),
-            error_0.eq(error - self._outval.f.val.data),
-        ]
-        with m.If(self._outval.f.val.data >= error):
+
+        sample = Signal(unsigned(16))
+        if self._fifo_depth > 0:
+            m.submodules.fifo = fifo = SyncFIFOBuffered(width=16, depth=self._fifo_depth)
+            m.d.comb += [
+                fifo.w_data.eq(self._fifo.f.data.w_data),
+                fifo.w_en.eq(self._fifo.f.data.w_stb),
+                self._fifo_status.f.level.r_data.eq(fifo.level),
+            ]
+
+            # the first sample is loaded as soon as it is available, later ones every
+            # `divider + 1` cycles
+            stream_sample = Signal(unsigned(16))
+            stream_valid = Signal()
+            div_count = Signal(unsigned(16))
+            running = (self._conf.f.en.data == 1) & (self._conf.f.stream.data == 1)
+            sample_due = running & (div_count >= self._divider.f.val.data)
+            with m.If(running & ~sample_due):
+                m.d.sync += div_count.eq(div_count + 1)
+            with m.Else():
+                m.d.sync += div_count.eq(0)
+
+            with m.If(self._conf.f.stream.data == 0):
+                m.d.sync += stream_valid.eq(0)
+            with m.Elif(~stream_valid | sample_due):
+                with m.If(fifo.r_rdy):
+                    m.d.comb += fifo.r_en.eq(1)
+                    m.d.sync += [
+                        stream_sample.eq(fifo.r_data),
+                        stream_valid.eq(1),
+                    ]
+                with m.Elif(stream_valid):
+                    m.d.comb += self._fifo_int.f.underrun.set.eq(1)
+
+            # until the first sample of a stream is loaded, `stream_sample` is that of the
+            # previous stream, if any; the modulator is fed 0 instead
+            m.d.comb += sample.eq(Mux(self._conf.f.stream.data,
+                                      Mux(stream_valid, stream_sample, 0),
+                                      self._outval.f.val.data))
+        else:
+            m.d.comb += sample.eq(self._outval.f.val.data)
+
+        pdm_ao = Signal()
+        if self._order == 1:
+            maxval = Const(int((2**self._bitwidth)-1), unsigned(self._bitwidth))
+            error = Signal(unsigned(self._bitwidth), init=0x0)
+            error_0 = Signal(unsigned(self._bitwidth), init=0x0)
+            error_1 = Signal(unsigned(self._bitwidth), init=0x0)
             m.d.sync += [
-                pdm_ao.eq(1),
-                error.eq(error_1),
+                error_1.eq(error + maxval - sample),
+                error_0.eq(error - sample),
             ]
-        with m.Else():
+            with m.If(sample >= error):
+                m.d.sync += [
+                    pdm_ao.eq(1),
+                    error.eq(error_1),
+                ]
+            with m.Else():
+                m.d.sync += [
+                    pdm_ao.eq(0),
+                    error.eq(error_0),
+                ]
+        else:
+            # Two saturating integrators around a 1-bit quantiser, in the form
+            #   i2' = i2 + i1 - 2 * fb
+            #   i1' = i1 + x - fb
+            # with x and fb centred on half scale. The output is the sign of i2 (high when
+            # i2 >= 0), and a code of `val` gives a density of val / 2**bitwidth.
+            half = 2**(self._bitwidth - 1)
+            limit_1 = 2**(self._bitwidth + 1)
+            limit_2 = 2**(self._bitwidth + 2)
+            integ_1 = Signal(signed(self._bitwidth + 3))
+            integ_2 = Signal(signed(self._bitwidth + 4))
+
+            x = Signal(signed(self._bitwidth + 1))
+            code = Mux(sample > 2**self._bitwidth - 1, 2**self._bitwidth - 1, sample)
+            m.d.comb += x.eq(code - half)
+            fb = Mux(pdm_ao, half, -half)
+
+            def saturate(value, limit):
+                return Mux(value >= limit, limit - 1, Mux(value < -limit, -limit, value))
+
+            m.d.comb += pdm_ao.eq(integ_2 >= 0)
             m.d.sync += [
-                pdm_ao.eq(0),
-                error.eq(error_0),
+                integ_2.eq(saturate(integ_2 + integ_1 - 2 * fb, limit_2)),
+                integ_1.eq(saturate(integ_1 + x - fb, limit_1)),
             ]
 
         with m.If(self._conf.f.en.data == 1):
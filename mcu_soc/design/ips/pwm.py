@@ -4,7 +4,10 @@ from amaranth import Module
 from amaranth.lib import wiring
 from amaranth.lib.wiring import In, Out, flipped, connect
 from amaranth.lib.cdc import FFSynchronizer
-from amaranth_soc import csr
+from amaranth.lib.fifo import SyncFIFOBuffered
+from amaranth_soc import csr, wishbone
+
+from .wishbone_regs import WishboneRegisterBridge
 
 from chipflow.platform import OutputIOSignature, InputIOSignature, SoftwareDriverSignature
 
@@ -13,18 +16,24 @@ __all__ = ["PWMPeripheral", "PWMPins"]
 
 class PWMPins(wiring.PureInterface):
     class Signature(wiring.Signature):
-        def __init__(self):
-            super().__init__({
+        """``complementary`` adds ``pwm_n``, the low-side output of a half bridge"""
+        def __init__(self, *, complementary=False):
+            self.complementary = complementary
+            members = {
                 "pwm":  Out(OutputIOSignature(1)),
                 "dir":  Out(OutputIOSignature(1)),
                 "stop":  In(InputIOSignature(1)),
-            })
+            }
+            if complementary:
+                members["pwm_n"] = Out(OutputIOSignature(1))
+            super().__init__(members)
 
         def create(self, *, path=(), src_loc_at=0):
-            return PWMPins(path=path, src_loc_at=1 + src_loc_at)
+            return PWMPins(complementary=self.complementary, path=path, src_loc_at=1 + src_loc_at)
 
-    def __init__(self, *, path=(), src_loc_at=0):
-        super().__init__(self.Signature(), path=path, src_loc_at=1 + src_loc_at)
+    def __init__(self, *, complementary=False, path=(), src_loc_at=0):
+        super().__init__(self.Signature(complementary=complementary), path=path,
+                         src_loc_at=1 + src_loc_at)
 
 
 class PWMPeripheral(wiring.Component):
@@ -42,6 +51,8 @@ class PWMPeripheral(wiring.Component):
         """
         en: csr.Field(csr.action.RW, unsigned(1))
         dir: csr.Field(csr.action.RW, unsigned(1))
+        stream: csr.Field(csr.action.RW, unsigned(1))
+        stop_ie: csr.Field(csr.action.RW, unsigned(1))
 
     class Stop_int(csr.Register, access="rw"):
         """Stop_int register
@@ -53,24 +64,104 @@ class PWMPeripheral(wiring.Component):
         """
         stop_pin: csr.Field(csr.action.R, unsigned(1))
 
-    """pwm peripheral."""
-    def __init__(self, *, pins):
+    class Fifo(csr.Register, access="w"):
+        """Duty cycle FIFO, consumed one entry per period in streaming mode
+        """
+        data: csr.Field(csr.action.W, unsigned(16))
+
+    class Fifo_conf(csr.Register, access="rw"):
+        """FIFO configuration register
+        """
+        watermark: csr.Field(csr.action.RW, unsigned(8))
+        low_ie: csr.Field(csr.action.RW, unsigned(1))
+
+    class Fifo_int(csr.Register, access="rw"):
+        """FIFO interrupt register
+        """
+        low: csr.Field(csr.action.RW1C, unsigned(1))
+        underrun: csr.Field(csr.action.RW1C, unsigned(1))
+
+    class Prescale(csr.Register, access="rw"):
+        """Counter prescaler: the counter advances every ``val`` + 1 cycles
+        """
+        val: csr.Field(csr.action.RW, unsigned(16))
+
+    class Deadtime(csr.Register, access="rw"):
+        """Cycles both outputs are held low after each edge of the PWM signal
+        """
+        val: csr.Field(csr.action.RW, unsigned(8))
+
+    """pwm peripheral.
+
+    The counter runs from 0 to ``denom``, advancing every ``prescale`` + 1 cycles of the
+    ``domain`` clock, and the output is high while it is at most ``numr`` (and ``numr`` is
+    non-zero). A ``domain`` other than ``sync``, e.g. a faster clock for finer duty resolution
+    at a given switching frequency, must be provided by the parent; the registers stay in
+    ``sync``, and each value is passed over through an ``FFSynchronizer``, taking effect once
+    it has been stable for a cycle (a stop likewise reaches the outputs a few cycles of
+    ``domain`` later). Streaming from the FIFO requires ``sync``.
+
+    With ``pins`` built ``complementary``, the PWM signal drives ``pins.pwm`` (high side) and
+    its inverse ``pins.pwm_n`` (low side), with both held low for ``deadtime`` cycles of the
+    ``domain`` clock after each edge, so that the two switches of a half bridge are never on
+    together. Pulses no longer than the dead time are suppressed. Both outputs are low while
+    the peripheral is disabled or stopped.
+
+    A stop input latches ``stop_int.stopped``, which holds the output low until it is cleared,
+    and raises ``irq`` if ``conf.stop_ie`` is set.
+
+    With ``fifo_depth`` > 0, setting ``conf.stream`` takes the duty cycle numerator from a
+    FIFO instead of ``numr``: one entry is loaded ahead of time, and the next one is consumed
+    at the end of each period. If the FIFO is empty then, the current duty cycle is held and
+    ``fifo_int.underrun`` is set. ``fifo_int.low`` is set when the number of entries left
+    falls to ``fifo_conf.watermark`` or below, and raises ``irq`` if ``fifo_conf.low_ie`` is
+    set.
+
+    ``data_width`` is the width of the register bus. With 8, ``bus`` is a CSR bus, to be placed
+    behind a ``csr.Decoder`` and ``WishboneCSRBridge``; with 32, it is a Wishbone target that
+    accesses any register in a single bus cycle (see :class:`WishboneRegisterBridge`). The
+    register offsets are the same either way.
+    """
+    def __init__(self, *, pins, fifo_depth=0, data_width=8, domain="sync"):
+        assert data_width in (8, 32), "data_width must be 8 or 32"
+        assert 0 <= fifo_depth < 256, "fifo_depth must be less than 256"
+        assert domain == "sync" or fifo_depth == 0, "streaming requires the sync domain"
         self.pins = pins
+        self._fifo_depth = fifo_depth
+        self._domain = domain
+        self._complementary = hasattr(pins, "pwm_n")
 
-        regs = csr.Builder(addr_width=5, data_width=8)
+        regs = csr.Builder(addr_width=6, data_width=8)
 
         self._numr = regs.add("numr", self.Numr(), offset=0x0)
         self._denom = regs.add("denom", self.Denom(), offset=0x4)
         self._conf = regs.add("conf", self.Conf(), offset=0x8)
         self._stop_int = regs.add("stop_int", self.Stop_int(), offset=0xC)
         self._status = regs.add("status", self.Status(), offset=0x10)
+        if fifo_depth > 0:
+            self._fifo = regs.add("fifo", self.Fifo(), offset=0x14)
+            self._fifo_status = regs.add("fifo_status", csr.Register({
+                "level": csr.Field(csr.action.R, range(fifo_depth + 1)),
+            }, access="r"), offset=0x18)
+            self._fifo_conf = regs.add("fifo_conf", self.Fifo_conf(), offset=0x1C)
+            self._fifo_int = regs.add("fifo_int", self.Fifo_int(), offset=0x20)
+        self._prescale = regs.add("prescale", self.Prescale(), offset=0x24)
+        if self._complementary:
+            self._deadtime = regs.add("deadtime", self.Deadtime(), offset=0x28)
 
-        self._bridge = csr.Bridge(regs.as_memory_map())
+        if data_width == 8:
+            self._bridge = csr.Bridge(regs.as_memory_map())
+            bus_signature = csr.Signature(addr_width=regs.addr_width, data_width=regs.data_width)
+        else:
+            self._bridge = WishboneRegisterBridge(regs.as_memory_map(), data_width=data_width)
+            bus_signature = wishbone.Signature(addr_width=regs.addr_width - 2, data_width=data_width,
+                                               granularity=regs.data_width)
 
         super().__init__(
             SoftwareDriverSignature(
                 members={
-                    "bus": In(csr.Signature(addr_width=regs.addr_width, data_width=regs.data_width)),
+                    "bus": In(bus_signature),
+                    "irq": Out(1),
                 },
                 component=self,
                 regs_struct='motor_pwm_regs_t',
@@ -79,10 +170,30 @@ class PWMPeripheral(wiring.Component):
 
         self.bus.memory_map = self._bridge.bus.memory_map
 
+    @property
+    def fifo_depth(self):
+        return self._fifo_depth
+
+    @property
+    def domain(self):
+        return self._domain
+
+    def _synchronize(self, m, value, name):
+        """``value`` in the PWM domain"""
+        if self._domain == "sync":
+            return value
+        synced = Signal.like(value, name=f"{name}_synced")
+        prev = Signal.like(value, name=f"{name}_prev")
+        stable = Signal.like(value, name=name)
+        m.submodules[f"{name}_sync"] = FFSynchronizer(value, synced, o_domain=self._domain)
+        m.d[self._domain] += prev.eq(synced)
+        with m.If(prev == synced):
+            m.d[self._domain] += stable.eq(synced)
+        return stable
+
     def elaborate(self, platform):
         m = Module()
         m.submodules.bridge = self._bridge
-        count = Signal(unsigned(16), init=0x0)
         connect(m, flipped(self.bus), self._bridge.bus)
 
         #synchronizer
@@ -90,20 +201,99 @@ class PWMPeripheral(wiring.Component):
         m.submodules += FFSynchronizer(i=self.pins.stop.i, o=stop)
         m.d.comb += self._stop_int.f.stopped.set.eq(stop)
 
-        with m.If((self._conf.f.en.data == 1) & (self._stop_int.f.stopped.data == 0) ):
-            m.d.sync += count.eq(count+1)
-        with m.Else():
-            m.d.sync += count.eq(0)
+        running = Signal()
+        m.d.comb += running.eq((self._conf.f.en.data == 1) & (self._stop_int.f.stopped.data == 0))
 
-        with m.If((self._numr.f.val.data > 0) & (count <= self._numr.f.val.data) & (self._conf.f.en.data == 1) & (self._stop_int.f.stopped.data == 0 )):
-            m.d.comb += self.pins.pwm.o.eq(1)
+        # the counter, in the PWM domain; `tick` is set in the cycles it advances
+        pwm = m.d[self._domain]
+        pwm_running = self._synchronize(m, running, "running")
+        denom = self._synchronize(m, self._denom.f.val.data, "denom")
+        prescale = self._synchronize(m, self._prescale.f.val.data, "prescale")
+        count = Signal(unsigned(16), init=0x0)
+        prescale_count = Signal(unsigned(16))
+        tick = Signal()
+        m.d.comb += tick.eq(prescale_count >= prescale)
+        with m.If(~pwm_running):
+            pwm += [
+                count.eq(0),
+                prescale_count.eq(0),
+            ]
+        with m.Elif(tick):
+            pwm += prescale_count.eq(0)
+            with m.If(count >= denom):
+                pwm += count.eq(0)
+            with m.Else():
+                pwm += count.eq(count + 1)
         with m.Else():
-            m.d.comb += self.pins.pwm.o.eq(0)
+            pwm += prescale_count.eq(prescale_count + 1)
+
+        numr = Signal(unsigned(16))
+        fifo_irq = Signal()
+        if self._fifo_depth > 0:
+            m.submodules.fifo = fifo = SyncFIFOBuffered(width=16, depth=self._fifo_depth)
+            m.d.comb += [
+                fifo.w_data.eq(self._fifo.f.data.w_data),
+                fifo.w_en.eq(self._fifo.f.data.w_stb),
+                self._fifo_status.f.level.r_data.eq(fifo.level),
+            ]
+
+            # `stream_numr` holds the duty cycle of the current period; the first entry is
+            # loaded as soon as it is available, later ones at the end of each period
+            stream_numr = Signal(unsigned(16))
+            stream_valid = Signal()
+            period_end = running & tick & (count >= denom)
+            with m.If(self._conf.f.stream.data == 0):
+                m.d.sync += stream_valid.eq(0)
+            with m.Elif(~stream_valid | period_end):
+                with m.If(fifo.r_rdy):
+                    m.d.comb += fifo.r_en.eq(1)
+                    m.d.sync += [
+                        stream_numr.eq(fifo.r_data),
+                        stream_valid.eq(1),
+                    ]
+                with m.Elif(stream_valid):
+                    m.d.comb += self._fifo_int.f.underrun.set.eq(1)
+
+            low = Signal()
+            low_prev = Signal()
+            m.d.comb += low.eq((self._conf.f.stream.data == 1) & (fifo.level <= self._fifo_conf.f.watermark.data))
+            m.d.sync += low_prev.eq(low)
+            m.d.comb += [
+                self._fifo_int.f.low.set.eq(low & ~low_prev),
+                fifo_irq.eq(self._fifo_int.f.low.data & self._fifo_conf.f.low_ie.data),
+            ]
+
+            # until the first entry of a stream is loaded, `stream_numr` is that of the previous
+            # stream, if any; the output stays low instead
+            m.d.comb += numr.eq(Mux(self._conf.f.stream.data,
+                                    Mux(stream_valid, stream_numr, 0),
+                                    self._numr.f.val.data))
+        else:
+            m.d.comb += numr.eq(self._numr.f.val.data)
+
+        pwm_numr = self._synchronize(m, numr, "numr")
+        pulse = Signal()
+        m.d.comb += pulse.eq((pwm_numr > 0) & (count <= pwm_numr) & pwm_running)
 
-        with m.If(count >= self._denom.f.val.data):
-            m.d.sync += count.eq(0)
+        if self._complementary:
+            deadtime = self._synchronize(m, self._deadtime.f.val.data, "deadtime")
+            # `held` counts the cycles `pulse` has had its current value, this one included
+            pulse_prev = Signal()
+            held_prev = Signal(range(257))
+            held = Mux(pulse == pulse_prev, Mux(held_prev == 256, 256, held_prev + 1), 1)
+            pwm += [
+                pulse_prev.eq(pulse),
+                held_prev.eq(held),
+            ]
+            m.d.comb += [
+                self.pins.pwm.o.eq(pulse & (held > deadtime)),
+                self.pins.pwm_n.o.eq(~pulse & pwm_running & (held > deadtime)),
+            ]
+        else:
+            m.d.comb += self.pins.pwm.o.eq(pulse)
 
         m.d.comb += self.pins.dir.o.eq(self._conf.f.dir.data)
         m.d.comb += self._status.f.stop_pin.r_data.eq(stop)
+        m.d.comb += self.irq.eq(fifo_irq | (self._stop_int.f.stopped.data & self._conf.f.stop_ie.data))
 
         return m
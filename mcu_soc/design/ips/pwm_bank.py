@@ -0,0 +1,150 @@
+from amaranth import *
+from amaranth import Module
+
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In, Out, flipped, connect
+from amaranth.lib.cdc import FFSynchronizer
+from amaranth_soc import csr, wishbone
+
+from .wishbone_regs import WishboneRegisterBridge
+
+from chipflow.platform import SoftwareDriverSignature
+
+__all__ = ["PWMBank"]
+
+
+class PWMBank(wiring.Component):
+    """Bank of PWM channels sharing one counter.
+
+    ``pins`` is a list of :class:`PWMPins`, one per channel. Period (``denom``), per-channel
+    duty (``duty<n>``) and direction (``dir``) are double buffered: firmware writes the shadow
+    registers, then ``commit``, and every channel switches to the new values on the same period
+    boundary. Each channel has its own stop input, which forces that channel's output low until
+    its ``stop_int`` bit is cleared. While any ``stop_int`` bit is set, ``irq`` is raised if
+    ``conf.stop_ie`` is set.
+
+    The register layout matches ``motor_pwm_bank_regs_t`` in drivers/motor_pwm_bank.h.
+
+    ``data_width`` is the width of the register bus. With 8, ``bus`` is a CSR bus, to be placed
+    behind a ``csr.Decoder`` and ``WishboneCSRBridge``; with 32, it is a Wishbone target that
+    accesses any register in a single bus cycle (see :class:`WishboneRegisterBridge`). The
+    register offsets are the same either way.
+    """
+    class Denom(csr.Register, access="rw"):
+        """Shadow period: the shared counter runs from 0 to ``val``
+        """
+        val: csr.Field(csr.action.RW, unsigned(16))
+
+    class Conf(csr.Register, access="rw"):
+        """Enable register
+        """
+        en: csr.Field(csr.action.RW, unsigned(1))
+        stop_ie: csr.Field(csr.action.RW, unsigned(1))
+
+    class Commit(csr.Register, access="rw"):
+        """Writing 1 to ``commit`` latches the shadow registers at the next period boundary
+        (immediately while disabled); ``pending`` reads 1 until they have been latched.
+        """
+        commit: csr.Field(csr.action.W, unsigned(1))
+        pending: csr.Field(csr.action.R, unsigned(1))
+
+    class Duty(csr.Register, access="rw"):
+        """Shadow duty cycle numerator of one channel
+        """
+        val: csr.Field(csr.action.RW, unsigned(16))
+
+    def __init__(self, *, pins, data_width=8):
+        assert data_width in (8, 32), "data_width must be 8 or 32"
+        self.pins = list(pins)
+        self.channels = len(self.pins)
+        assert 1 <= self.channels <= 32, "PWMBank supports 1 to 32 channels"
+
+        regs = csr.Builder(addr_width=(0x20 + 4 * self.channels - 1).bit_length(), data_width=8)
+
+        self._denom = regs.add("denom", self.Denom(), offset=0x0)
+        self._conf = regs.add("conf", self.Conf(), offset=0x4)
+        self._commit = regs.add("commit", self.Commit(), offset=0x8)
+        self._dir = regs.add("dir", csr.Register({
+            "val": csr.Field(csr.action.RW, unsigned(self.channels))
+        }, access="rw"), offset=0xC)
+        self._stop_int = regs.add("stop_int", csr.Register({
+            "stopped": csr.Field(csr.action.RW1C, unsigned(self.channels))
+        }, access="rw"), offset=0x10)
+        self._status = regs.add("status", csr.Register({
+            "stop_pin": csr.Field(csr.action.R, unsigned(self.channels))
+        }, access="r"), offset=0x14)
+        self._duty = [regs.add(f"duty{i}", self.Duty(), offset=0x20 + 4 * i)
+                      for i in range(self.channels)]
+
+        if data_width == 8:
+            self._bridge = csr.Bridge(regs.as_memory_map())
+            bus_signature = csr.Signature(addr_width=regs.addr_width, data_width=regs.data_width)
+        else:
+            self._bridge = WishboneRegisterBridge(regs.as_memory_map(), data_width=data_width)
+            bus_signature = wishbone.Signature(addr_width=regs.addr_width - 2, data_width=data_width,
+                                               granularity=regs.data_width)
+
+        super().__init__(
+            SoftwareDriverSignature(
+                members={
+                    "bus": In(bus_signature),
+                    "irq": Out(1),
+                },
+                component=self,
+                regs_struct='motor_pwm_bank_regs_t',
+                h_files=['drivers/motor_pwm_bank.h'])
+            )
+
+        self.bus.memory_map = self._bridge.bus.memory_map
+
+    def elaborate(self, platform):
+        m = Module()
+        m.submodules.bridge = self._bridge
+        connect(m, flipped(self.bus), self._bridge.bus)
+
+        count = Signal(unsigned(16), init=0x0)
+        denom = Signal(unsigned(16), init=0x0)
+        duty = [Signal(unsigned(16), init=0x0, name=f"duty{i}") for i in range(self.channels)]
+        direction = Signal(self.channels, init=0x0)
+        pending = Signal()
+
+        en = self._conf.f.en.data == 1
+
+        #synchronizers
+        stop = Signal(self.channels)
+        for i, pins in enumerate(self.pins):
+            m.submodules[f"stop_sync{i}"] = FFSynchronizer(i=pins.stop.i, o=stop[i])
+        m.d.comb += self._stop_int.f.stopped.set.eq(stop)
+        m.d.comb += self._status.f.stop_pin.r_data.eq(stop)
+        m.d.comb += self.irq.eq(self._stop_int.f.stopped.data.any() & self._conf.f.stop_ie.data)
+
+        # shared timebase
+        with m.If(en):
+            m.d.sync += count.eq(count+1)
+        with m.Else():
+            m.d.sync += count.eq(0)
+
+        boundary = ~en | (count >= denom)
+        with m.If(count >= denom):
+            m.d.sync += count.eq(0)
+
+        # double buffering
+        m.d.comb += self._commit.f.pending.r_data.eq(pending)
+        with m.If(self._commit.f.commit.w_stb & self._commit.f.commit.w_data):
+            m.d.sync += pending.eq(1)
+        with m.Elif(pending & boundary):
+            m.d.sync += [
+                pending.eq(0),
+                denom.eq(self._denom.f.val.data),
+                direction.eq(self._dir.f.val.data),
+            ]
+            m.d.sync += [duty[i].eq(self._duty[i].f.val.data) for i in range(self.channels)]
+
+        for i, pins in enumerate(self.pins):
+            with m.If((duty[i] > 0) & (count <= duty[i]) & en & ~self._stop_int.f.stopped.data[i]):
+                m.d.comb += pins.pwm.o.eq(1)
+            with m.Else():
+                m.d.comb += pins.pwm.o.eq(0)
+            m.d.comb += pins.dir.o.eq(direction[i])
+
+        return m
@@ -0,0 +1,111 @@
+from amaranth import *
+from amaranth_soc import wishbone
+from amaranth_soc.memory import MemoryMap
+
+from mcu_soc.design.ips.crossbar import WishboneCrossbar
+from mcu_soc.design.ips.testing import WishboneMemory, run_simulation
+import unittest
+
+
+def target(addr_width):
+    bus = wishbone.Signature(addr_width=addr_width, data_width=32, granularity=8).create()
+    bus.memory_map = MemoryMap(addr_width=addr_width + 2, data_width=8)
+    return bus
+
+
+async def access(ctx, bus, addr, value=None):
+    """Issue one Wishbone cycle, returning the data read and the cycles it took."""
+    ctx.set(bus.adr, addr)
+    ctx.set(bus.sel, 0b1111)
+    ctx.set(bus.we, value is not None)
+    ctx.set(bus.dat_w, value or 0)
+    ctx.set(bus.cyc, 1)
+    ctx.set(bus.stb, 1)
+    cycles = 1
+    await ctx.tick()
+    while not ctx.get(bus.ack):
+        cycles += 1
+        await ctx.tick()
+    data = ctx.get(bus.dat_r)
+    ctx.set(bus.cyc, 0)
+    ctx.set(bus.stb, 0)
+    await ctx.tick()
+    return data, cycles
+
+
+class TestWishboneCrossbar(unittest.TestCase):
+
+    def setUp(self):
+        self.dut = WishboneCrossbar(addr_width=30, data_width=32, granularity=8)
+        self.initiators = [wishbone.Signature(addr_width=30, data_width=32, granularity=8).create()
+                           for _ in range(2)]
+        for bus in self.initiators:
+            self.dut.add_initiator(bus)
+        # a slow "flash" at 0 and a fast "sram" at 0x10000000
+        self.flash = target(16)
+        self.sram = target(10)
+        self.windows = {
+            "flash": self.dut.add(self.flash, name="flash", addr=0x00000000),
+            "sram": self.dut.add(self.sram, name="sram", addr=0x10000000),
+        }
+        self.flash_model = WishboneMemory(self.flash, default=lambda addr: addr | 0xF000, latency=40)
+        self.sram_model = WishboneMemory(self.sram, latency=1)
+
+    def test_memory_map(self):
+        self.assertEqual(self.windows["flash"], (0x00000000, 0x00040000, 1))
+        self.assertEqual(self.windows["sram"], (0x10000000, 0x10001000, 1))
+        with self.assertRaises(Exception):
+            self.dut.add(target(10), name="overlap", addr=0x10000400)
+        self.run_sim(name="crossbar_memory_map_test")
+
+    def run_sim(self, *testbenches, name):
+        run_simulation(self.dut, *testbenches, name=name,
+                       background=[self.flash_model.serve, self.sram_model.serve])
+
+    def test_parallel(self):
+        # a slow fetch on one initiator doesn't hold up accesses by the other to another target
+        ibus, dbus = self.initiators
+        results = {}
+        async def fetch(ctx):
+            results["fetch"] = await access(ctx, ibus, 0x123)
+        async def data(ctx):
+            await ctx.tick()
+            for i in range(4):
+                await access(ctx, dbus, 0x04000000 + i, i + 1)
+            results["data"] = [(await access(ctx, dbus, 0x04000000 + i))[0] for i in range(4)]
+            results["data_done_first"] = "fetch" not in results
+        self.run_sim(fetch, data, name="crossbar_parallel_test")
+        self.assertEqual(results["fetch"][0], 0xF123)
+        self.assertEqual(results["data"], [1, 2, 3, 4])
+        # all the data accesses completed while the fetch was still in progress
+        self.assertTrue(results["data_done_first"])
+
+    def test_conflict(self):
+        # both initiators on the same target are served in turn, each getting its own data
+        ibus, dbus = self.initiators
+        results = {"ibus": [], "dbus": []}
+        async def ibus_tb(ctx):
+            for i in range(4):
+                results["ibus"].append((await access(ctx, ibus, i))[0])
+        async def dbus_tb(ctx):
+            for i in range(4):
+                results["dbus"].append((await access(ctx, dbus, 0x100 + i))[0])
+        self.run_sim(ibus_tb, dbus_tb, name="crossbar_conflict_test")
+        self.assertEqual(results["ibus"], [i | 0xF000 for i in range(4)])
+        self.assertEqual(results["dbus"], [(0x100 + i) | 0xF000 for i in range(4)])
+        self.assertEqual(len(self.flash_model.accesses), 8)
+
+    def test_unconflicted_latency(self):
+        # with no other initiator on the target, the crossbar adds no cycles once the grant
+        # has moved to this initiator
+        _, dbus = self.initiators
+        cycles = []
+        async def testbench(ctx):
+            for i in range(4):
+                cycles.append((await access(ctx, dbus, 0x04000000 + i))[1])
+        self.run_sim(testbench, name="crossbar_latency_test")
+        self.assertEqual(cycles, [2, 1, 1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
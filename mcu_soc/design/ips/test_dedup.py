@@ -0,0 +1,95 @@
+from amaranth import *
+from amaranth.back import rtlil
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In, Out
+
+from mcu_soc.design.ips.dedup import Deduplicator
+from mcu_soc.design.ips.testing import run_simulation
+import unittest
+
+
+class Counter(wiring.Component):
+    en: In(1)
+    value: Out(8)
+
+    def __init__(self, step=1):
+        self.step = step
+        super().__init__()
+
+    def elaborate(self, platform):
+        m = Module()
+        with m.If(self.en):
+            m.d.sync += self.value.eq(self.value + self.step)
+        return m
+
+
+class Counters(wiring.Component):
+    """Three counters, the middle one disabled, with bit 0 of each tapped"""
+    lsbs: Out(3)
+
+    def __init__(self, *, steps=(1, 1, 1), enabled=True):
+        self.steps = steps
+        self.enabled = enabled
+        super().__init__()
+
+    def elaborate(self, platform):
+        m = Module()
+        self.dedup = Deduplicator(platform, enabled=self.enabled)
+        lsbs = []
+        for i, step in enumerate(self.steps):
+            counter = Counter(step)
+            m.d.comb += counter.en.eq(i != 1)
+            taps = self.dedup.add(m, f"counter{i}", counter, key=(Counter, step), taps={
+                "lsb": lambda counter: counter.value[0],
+            })
+            lsbs.append(taps["lsb"])
+        m.d.comb += self.lsbs.eq(Cat(lsbs))
+        return m
+
+
+class FilePlatform:
+    def __init__(self):
+        self.files = {}
+
+    def add_file(self, filename, content):
+        self.files[filename] = content
+
+
+class TestDeduplicator(unittest.TestCase):
+
+    def test_instances(self):
+        dut = Counters()
+        platform = FilePlatform()
+        top = rtlil.convert(dut, name="top", platform=platform)
+        self.assertEqual(dut.dedup.modules, {"Counter_0": 3})
+        self.assertEqual(list(platform.files), ["Counter_0.il"])
+        self.assertIn("module \\Counter_0\n", platform.files["Counter_0.il"])
+        self.assertEqual(top.count("cell \\Counter_0 "), 3)
+        self.assertNotIn("$add", top)
+        for port in ("en", "value", "sync__clk", "sync__rst", "tap__lsb"):
+            self.assertIn(f"connect \\{port} ", top)
+
+    def test_keys(self):
+        dut = Counters(steps=(1, 2, 1))
+        platform = FilePlatform()
+        rtlil.convert(dut, name="top", platform=platform)
+        self.assertEqual(dut.dedup.modules, {"Counter_0": 2, "Counter_1": 1})
+        self.assertEqual(sorted(platform.files), ["Counter_0.il", "Counter_1.il"])
+
+    def test_fallback(self):
+        # no add_file: the counters are elaborated as usual
+        dut = Counters()
+        top = rtlil.convert(dut, name="top", platform=None)
+        self.assertFalse(dut.dedup.enabled)
+        self.assertNotIn("Counter_0", top)
+        self.assertEqual(top.count("$add"), 3)
+
+    def test_disabled(self):
+        dut = Counters(enabled=False)
+        async def testbench(ctx):
+            await ctx.tick().repeat(3)
+            self.assertEqual(ctx.get(dut.lsbs), 0b101)
+        run_simulation(dut, testbench, name="dedup_disabled_test")
+
+if __name__ == "__main__":
+    unittest.main()
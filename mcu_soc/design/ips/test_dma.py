@@ -0,0 +1,113 @@
+from amaranth import *
+
+from mcu_soc.design.ips.dma import DMAController
+from mcu_soc.design.ips.testing import CSRDriver, WishboneMemory, wait_for, run_simulation
+import unittest
+
+
+CTRL_START   = 0x1
+CTRL_SRC_INC = 0x2
+CTRL_DST_INC = 0x4
+CTRL_WORD    = 0x2 << 3
+CTRL_REQ_EN  = 0x20
+CTRL_IE      = 0x40
+
+def ctrl_req_sel(n):
+    return n << 7
+
+
+class TestDMAController(unittest.TestCase):
+
+    async def start(self, ctx, regs, ch, src, dst, count, ctrl, next=0):
+        await regs.write(ctx, f"ch{ch}_src", src)
+        await regs.write(ctx, f"ch{ch}_dst", dst)
+        await regs.write(ctx, f"ch{ch}_count", count)
+        await regs.write(ctx, f"ch{ch}_next", next)
+        await regs.write(ctx, f"ch{ch}_ctrl", ctrl | CTRL_START)
+
+    async def wait_done(self, ctx, regs, ch):
+        for _ in range(100):
+            status = await regs.read(ctx, f"ch{ch}_status")
+            if status & 0b10:
+                return status
+        self.fail(f"channel {ch} did not complete")
+
+    def test_mem_to_mem(self):
+        dut = DMAController(channels=2)
+        regs = CSRDriver(dut)
+        mem = WishboneMemory(dut.initiator, {0x100: 0x44332211, 0x101: 0x88776655})
+        async def testbench(ctx):
+            # bytes, from and to unaligned addresses
+            await self.start(ctx, regs, 0, 0x401, 0x801, 6, CTRL_SRC_INC | CTRL_DST_INC | CTRL_IE)
+            self.assertEqual(await self.wait_done(ctx, regs, 0), 0b010)
+            self.assertEqual(mem.read(0x200), 0x44332200)
+            self.assertEqual(mem.read(0x201), 0x00776655)
+            self.assertEqual(ctx.get(dut.irq), 1)
+            await regs.write(ctx, "ch0_status", 0b010)
+            self.assertEqual(ctx.get(dut.irq), 0)
+            # words
+            await self.start(ctx, regs, 1, 0x400, 0xC00, 2,
+                             CTRL_SRC_INC | CTRL_DST_INC | CTRL_WORD)
+            await self.wait_done(ctx, regs, 1)
+            self.assertEqual(mem.read(0x300), 0x44332211)
+            self.assertEqual(mem.read(0x301), 0x88776655)
+            self.assertEqual(ctx.get(dut.irq), 0) # not enabled
+        run_simulation(dut, testbench, name="dma_mem_to_mem_test", background=[mem.serve])
+
+    def test_descriptors(self):
+        dut = DMAController(channels=1)
+        regs = CSRDriver(dut)
+        ctrl = CTRL_SRC_INC | CTRL_DST_INC | CTRL_WORD
+        mem = WishboneMemory(dut.initiator, {
+            0x100: 0x11111111, 0x101: 0x22222222, 0x102: 0x33333333,
+            # src, dst, count, next, ctrl
+            0x200: 0x404, 0x201: 0x604, 0x202: 2, 0x203: 0x820, 0x204: ctrl,
+            0x208: 0x400, 0x209: 0x700, 0x20A: 1, 0x20B: 0, 0x20C: ctrl,
+        })
+        async def testbench(ctx):
+            await self.start(ctx, regs, 0, 0x400, 0x600, 1, ctrl, next=0x800)
+            await self.wait_done(ctx, regs, 0)
+            self.assertEqual([mem.read(addr) for addr in (0x180, 0x181, 0x182, 0x1C0)],
+                             [0x11111111, 0x22222222, 0x33333333, 0x11111111])
+            self.assertEqual(await regs.read(ctx, "ch0_status"), 0b010) # not busy
+        run_simulation(dut, testbench, name="dma_descriptors_test", background=[mem.serve])
+
+    def test_request(self):
+        dut = DMAController(channels=2, requests=2)
+        regs = CSRDriver(dut)
+        mem = WishboneMemory(dut.initiator, {0x100: 0x44332211, 0x101: 0x88776655})
+        async def testbench(ctx):
+            # paced by request line 1, to a fixed address
+            await self.start(ctx, regs, 0, 0x400, 0xA00, 4,
+                             CTRL_SRC_INC | CTRL_REQ_EN | ctrl_req_sel(1))
+            await ctx.tick().repeat(20)
+            self.assertEqual(await regs.read(ctx, "ch0_remaining"), 4)
+            self.assertEqual(await regs.read(ctx, "ch0_status"), 0b001) # busy
+            # the other channel is not held up
+            await self.start(ctx, regs, 1, 0x404, 0xB00, 4, CTRL_SRC_INC | CTRL_DST_INC)
+            await self.wait_done(ctx, regs, 1)
+            self.assertEqual(mem.read(0x2C0), 0x88776655)
+            # one element per request
+            for i, value in enumerate((0x11, 0x22, 0x33, 0x44)):
+                ctx.set(dut.req, 0b10)
+                await wait_for(ctx, dut.initiator.we, 1, timeout=10)
+                ctx.set(dut.req, 0)
+                await ctx.tick().repeat(10)
+                self.assertEqual(await regs.read(ctx, "ch0_remaining"), 3 - i)
+                self.assertEqual(mem.read(0x280) & 0xFF, value)
+            await self.wait_done(ctx, regs, 0)
+        run_simulation(dut, testbench, name="dma_request_test", background=[mem.serve])
+
+    def test_regs_wishbone(self):
+        dut = DMAController(channels=1, data_width=32)
+        regs = CSRDriver(dut)
+        mem = WishboneMemory(dut.initiator, {0x100: 0x12345678})
+        async def testbench(ctx):
+            await self.start(ctx, regs, 0, 0x400, 0x500, 1, CTRL_WORD)
+            await self.wait_done(ctx, regs, 0)
+            self.assertEqual(mem.read(0x140), 0x12345678)
+            self.assertEqual(await regs.read(ctx, "ch0_ctrl"), CTRL_WORD)
+        run_simulation(dut, testbench, name="dma_regs_wishbone_test", background=[mem.serve])
+
+if __name__ == "__main__":
+    unittest.main()
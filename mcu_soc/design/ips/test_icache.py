@@ -0,0 +1,122 @@
+from amaranth import *
+
+from mcu_soc.design.ips.icache import ICache
+from mcu_soc.design.ips.testing import CSRDriver, WishboneMemory, wait_for, run_simulation
+import unittest
+
+
+FLASH_SIZE = 1 << 16
+
+
+def word(addr):
+    return (addr * 0x9E3779B1) & 0xFFFFFFFF
+
+
+class TestICache(unittest.TestCase):
+
+    def simulate(self, dut, addrs, name, *, setup=None, latency=3):
+        """Fetch each word address in ``addrs`` through the cache, checking the data, and
+        return the number of cycles each fetch took and the memory model."""
+        mem = WishboneMemory(dut.mem, default=word, latency=latency)
+        cycles = []
+        async def testbench(ctx):
+            if setup is not None:
+                await setup(ctx)
+            for addr in addrs:
+                ctx.set(dut.bus.adr, addr)
+                ctx.set(dut.bus.sel, 0b1111)
+                ctx.set(dut.bus.cyc, 1)
+                ctx.set(dut.bus.stb, 1)
+                count = 1
+                await ctx.tick()
+                while not ctx.get(dut.bus.ack):
+                    count += 1
+                    await ctx.tick()
+                self.assertEqual(ctx.get(dut.bus.dat_r), word(addr))
+                cycles.append(count)
+                ctx.set(dut.bus.cyc, 0)
+                ctx.set(dut.bus.stb, 0)
+                await ctx.tick()
+        run_simulation(dut, testbench, name=name, background=[mem.serve])
+        return cycles, mem
+
+    def test_hits(self):
+        dut = ICache(base=0, size=FLASH_SIZE, sets=4)
+        cycles, mem = self.simulate(dut, list(range(8)) * 2, "icache_hits_test")
+        # one refill per line, after which every fetch is a hit acknowledged on the next cycle
+        self.assertEqual([addr for addr, _ in mem.accesses], list(range(8)))
+        self.assertEqual(cycles[8:], [1] * 8)
+        self.assertGreater(cycles[0], 4 * 3)
+        self.assertGreater(cycles[4], 4 * 3)
+
+    def test_counters(self):
+        dut = ICache(base=0, size=FLASH_SIZE, sets=4)
+        regs = CSRDriver(dut, bus=dut.csr_bus)
+        mem = WishboneMemory(dut.mem, default=word)
+        async def fetch(ctx, addr):
+            ctx.set(dut.bus.adr, addr)
+            ctx.set(dut.bus.sel, 0b1111)
+            ctx.set(dut.bus.cyc, 1)
+            ctx.set(dut.bus.stb, 1)
+            await ctx.tick()
+            while not ctx.get(dut.bus.ack):
+                await ctx.tick()
+            ctx.set(dut.bus.cyc, 0)
+            ctx.set(dut.bus.stb, 0)
+            await ctx.tick()
+        async def testbench(ctx):
+            for addr in [0, 1, 2, 3, 4, 0]:
+                await fetch(ctx, addr)
+            self.assertEqual(await regs.read(ctx, "hits"), 4)
+            self.assertEqual(await regs.read(ctx, "misses"), 2)
+            await regs.write(ctx, "ctrl", 0x5) # clear, and stay enabled
+            self.assertEqual(await regs.read(ctx, "hits"), 0)
+            self.assertEqual(await regs.read(ctx, "misses"), 0)
+            # a flush invalidates the lines fetched so far
+            await regs.write(ctx, "ctrl", 0x3)
+            await fetch(ctx, 0)
+            self.assertEqual(await regs.read(ctx, "misses"), 1)
+        run_simulation(dut, testbench, name="icache_counters_test", background=[mem.serve])
+
+    def test_conflict(self):
+        # word addresses 0 and 16 map to the same set
+        addrs = [0, 16] * 4
+        _, direct = self.simulate(ICache(base=0, size=FLASH_SIZE, sets=4), addrs,
+                                  "icache_direct_conflict_test")
+        _, two_way = self.simulate(ICache(base=0, size=FLASH_SIZE, ways=2, sets=4), addrs,
+                                   "icache_2way_conflict_test")
+        self.assertEqual(len(direct.accesses), 4 * len(addrs))
+        self.assertEqual(len(two_way.accesses), 4 * 2)
+
+    def test_lru(self):
+        # three lines in one set of a two-way cache: the least recently used one is replaced
+        dut = ICache(base=0, size=FLASH_SIZE, ways=2, sets=4)
+        _, mem = self.simulate(dut, [0, 16, 0, 32, 0, 16], "icache_lru_test")
+        self.assertEqual([addr for addr, _ in mem.accesses][::4], [0, 16, 32, 16])
+
+    def test_passthrough(self):
+        # disabled: every fetch goes to memory
+        dut = ICache(base=0, size=FLASH_SIZE, sets=4)
+        regs = CSRDriver(dut, bus=dut.csr_bus)
+        async def disable(ctx):
+            await regs.write(ctx, "ctrl", 0x0)
+            await wait_for(ctx, regs.value("ctrl"), 0x0)
+        _, mem = self.simulate(dut, [0, 1, 0, 1], "icache_disabled_test", setup=disable)
+        self.assertEqual(mem.accesses, [(0, None), (1, None), (0, None), (1, None)])
+
+        # outside the cached region
+        dut = ICache(base=0, size=FLASH_SIZE, sets=4)
+        outside = FLASH_SIZE // 4
+        _, mem = self.simulate(dut, [outside, outside + 1, outside], "icache_uncached_test")
+        self.assertEqual(len(mem.accesses), 3)
+
+    def test_regs_wishbone(self):
+        dut = ICache(base=0, size=FLASH_SIZE, sets=4, data_width=32)
+        regs = CSRDriver(dut, bus=dut.csr_bus)
+        async def setup(ctx):
+            self.assertEqual(await regs.read(ctx, "ctrl"), 0x1)
+        self.simulate(dut, [0, 0], "icache_regs_wishbone_test", setup=setup)
+
+
+if __name__ == "__main__":
+    unittest.main()
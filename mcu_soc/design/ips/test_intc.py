@@ -0,0 +1,86 @@
+from amaranth import *
+
+from mcu_soc.design.ips.intc import InterruptController
+from mcu_soc.design.ips.testing import CSRDriver, wait_for, run_simulation
+import unittest
+
+class TestInterruptController(unittest.TestCase):
+
+    def test_irq(self):
+        dut = InterruptController(sources=4)
+        regs = CSRDriver(dut)
+        async def testbench(ctx):
+            ctx.set(dut.src, 0b0100)
+            await ctx.tick().repeat(4)
+            self.assertEqual(await regs.read(ctx, "pending"), 0b0100)
+            self.assertEqual(ctx.get(dut.irq), 0) # not enabled
+            await regs.write(ctx, "enable", 0b0100)
+            await wait_for(ctx, dut.irq, 1, timeout=2)
+            self.assertEqual(await regs.read(ctx, "claim"), 0x100 | 2)
+            # a level source stays pending while it is high
+            await regs.write(ctx, "pending", 0b0100)
+            self.assertEqual(await regs.read(ctx, "pending"), 0b0100)
+            ctx.set(dut.src, 0)
+            await regs.write(ctx, "pending", 0b0100)
+            await wait_for(ctx, dut.irq, 0, timeout=2)
+            self.assertEqual(await regs.read(ctx, "claim"), 0)
+        run_simulation(dut, testbench, name="intc_irq_test")
+
+    def test_pulse(self):
+        dut = InterruptController(sources=2)
+        regs = CSRDriver(dut, backdoor=True)
+        async def testbench(ctx):
+            await regs.write(ctx, "enable", 0b11)
+            ctx.set(dut.src, 0b10)
+            await ctx.tick()
+            ctx.set(dut.src, 0)
+            await ctx.tick().repeat(10)
+            self.assertEqual(ctx.get(dut.irq), 1) # latched
+            await regs.write(ctx, "pending", 0b10)
+            await wait_for(ctx, dut.irq, 0, timeout=2)
+        run_simulation(dut, testbench, name="intc_pulse_test")
+
+    def test_priority(self):
+        dut = InterruptController(sources=4)
+        regs = CSRDriver(dut, backdoor=True)
+        async def claim(ctx):
+            await ctx.tick().repeat(4)
+            value = await regs.read(ctx, "claim")
+            return value & 0xFF if value & 0x100 else None
+        async def testbench(ctx):
+            await regs.write(ctx, "enable", 0b1111)
+            ctx.set(dut.src, 0b1011)
+            self.assertEqual(await claim(ctx), 0) # equal priorities: lowest numbered
+            await regs.write(ctx, "priority3", 5)
+            self.assertEqual(await claim(ctx), 3)
+            await regs.write(ctx, "priority1", 7)
+            self.assertEqual(await claim(ctx), 1)
+            # priority 0 is never signalled
+            await regs.write(ctx, "priority1", 0)
+            await regs.write(ctx, "priority3", 0)
+            self.assertEqual(await claim(ctx), 0)
+            # nor is anything at or below the threshold
+            await regs.write(ctx, "priority3", 5)
+            await regs.write(ctx, "threshold", 5)
+            self.assertEqual(await claim(ctx), None)
+            self.assertEqual(ctx.get(dut.irq), 0)
+            await regs.write(ctx, "threshold", 4)
+            self.assertEqual(await claim(ctx), 3)
+            self.assertEqual(ctx.get(dut.irq), 1)
+        run_simulation(dut, testbench, name="intc_priority_test")
+
+    def test_regs_wishbone(self):
+        dut = InterruptController(sources=8, data_width=32)
+        regs = CSRDriver(dut)
+        async def testbench(ctx):
+            await regs.write(ctx, "enable", 0xFF)
+            await regs.write(ctx, "priority7", 9)
+            self.assertEqual(await regs.read(ctx, "priority7"), 9)
+            self.assertEqual(await regs.read(ctx, "priority0"), 1)
+            ctx.set(dut.src, 0x81)
+            await ctx.tick().repeat(2)
+            self.assertEqual(await regs.read(ctx, "claim"), 0x100 | 7)
+        run_simulation(dut, testbench, name="intc_regs_wishbone_test")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,11 @@
 from amaranth import *
-from amaranth.sim import Simulator, Tick
+from amaranth.sim import Tick
 
-from pwm import PWMPeripheral, PWMPins
+from mcu_soc.design.ips.pwm import PWMPeripheral, PWMPins
+from mcu_soc.design.ips.testing import CSRDriver, wait_for, run_simulation
+from mcu_soc.design.ips.testing.stream import (pwm_model, deadtime_model, pack_words, capture,
+                                               first_mismatch)
+import numpy as np
 import unittest
 
 class TestPwmPeripheral(unittest.TestCase):
@@ -46,11 +50,7 @@ class TestPwmPeripheral(unittest.TestCase):
             yield Tick()
             self.assertEqual((yield dut.pins.pwm.o), 1) # assert start of the next pulse
             for i in range(1000): yield Tick()
-        sim = Simulator(dut)
-        sim.add_clock(2e-6)
-        sim.add_testbench(testbench)
-        with sim.write_vcd("pwm_o_test.vcd", "pwm_o_test.gtkw"):
-            sim.run()
+        run_simulation(dut, testbench, name="pwm_o_test")
 
     def test_conf(self):
         dut = PWMPeripheral(pins=PWMPins())
@@ -60,11 +60,7 @@ class TestPwmPeripheral(unittest.TestCase):
             yield from self._write_reg(dut, self.REG_CONF, 0x0, 4)
             self.assertEqual((yield dut.pins.pwm.o), 0) # assert pwm_o to remain '0', when not enabled
             for i in range(1000): yield Tick()
-        sim = Simulator(dut)
-        sim.add_clock(2e-6)
-        sim.add_testbench(testbench)
-        with sim.write_vcd("pwm_conf_test.vcd", "pwm_conf_test.gtkw"):
-            sim.run()
+        run_simulation(dut, testbench, name="pwm_conf_test")
 
     def test_dir(self):
         dut = PWMPeripheral(pins=PWMPins())
@@ -76,12 +72,301 @@ class TestPwmPeripheral(unittest.TestCase):
             for i in range(10): yield Tick()
             yield from self._write_reg(dut, self.REG_CONF, 0x01, 4)
             self.assertEqual((yield dut.pins.dir.o), 0) # assert direction to be '0'
-        sim = Simulator(dut)
-        sim.add_clock(2e-6)
-        sim.add_testbench(testbench)
-        with sim.write_vcd("pwm_dir_test.vcd", "pwm_dir_test.gtkw"):
-            sim.run()
+        run_simulation(dut, testbench, name="pwm_dir_test")
+
+    def test_pwm_o_driver(self):
+        dut = PWMPeripheral(pins=PWMPins())
+        regs = CSRDriver(dut)
+        async def testbench(ctx):
+            await regs.write(ctx, "numr", 0x1F)
+            await regs.write(ctx, "denom", 0xFF)
+            await regs.write(ctx, "conf", 0x03)
+            await wait_for(ctx, dut.pins.pwm.o, 1)
+            for i in range(32): # assert 32 cycles of logic '1'
+                self.assertEqual(ctx.get(dut.pins.pwm.o), 1)
+                await ctx.tick()
+            for i in range(224): # assert 224 cycles of logic '0'
+                self.assertEqual(ctx.get(dut.pins.pwm.o), 0)
+                await ctx.tick()
+            self.assertEqual(ctx.get(dut.pins.pwm.o), 1) # assert start of the next pulse
+            await ctx.tick().repeat(1000)
+        run_simulation(dut, testbench, name="pwm_o_driver_test")
+
+    def test_conf_driver(self):
+        dut = PWMPeripheral(pins=PWMPins())
+        regs = CSRDriver(dut)
+        async def testbench(ctx):
+            await regs.write(ctx, "numr", 0x1F)
+            await regs.write(ctx, "denom", 0xFF)
+            await regs.write(ctx, "conf", 0x0)
+            for i in range(1000): # assert pwm_o to remain '0', when not enabled
+                self.assertEqual(ctx.get(dut.pins.pwm.o), 0)
+                await ctx.tick()
+        run_simulation(dut, testbench, name="pwm_conf_driver_test")
+
+    def test_dir_driver(self):
+        dut = PWMPeripheral(pins=PWMPins())
+        regs = CSRDriver(dut)
+        async def testbench(ctx):
+            await regs.write(ctx, "numr", 0x1F)
+            await regs.write(ctx, "denom", 0xFF)
+            await regs.write(ctx, "conf", 0x03)
+            await wait_for(ctx, dut.pins.dir.o, 1, timeout=3) # assert direction to be '1'
+            await ctx.tick().repeat(10)
+            await regs.write(ctx, "conf", 0x01)
+            await wait_for(ctx, dut.pins.dir.o, 0, timeout=3) # assert direction to be '0'
+        run_simulation(dut, testbench, name="pwm_dir_driver_test")
+
+    def test_stop_irq(self):
+        dut = PWMPeripheral(pins=PWMPins())
+        regs = CSRDriver(dut)
+        async def testbench(ctx):
+            await regs.write(ctx, "conf", 0x9) # enabled, stop interrupt enabled
+            ctx.set(dut.pins.stop.i, 1)
+            await wait_for(ctx, dut.irq, 1, timeout=4)
+            ctx.set(dut.pins.stop.i, 0)
+            await ctx.tick().repeat(4)
+            self.assertEqual(ctx.get(dut.irq), 1) # latched until cleared
+            await regs.write(ctx, "stop_int", 0x1)
+            await wait_for(ctx, dut.irq, 0, timeout=2)
+            # masked
+            await regs.write(ctx, "conf", 0x1)
+            ctx.set(dut.pins.stop.i, 1)
+            await wait_for(ctx, regs.register("stop_int").f.stopped.data, 1, timeout=4)
+            self.assertEqual(ctx.get(dut.irq), 0)
+        run_simulation(dut, testbench, name="pwm_stop_irq_test")
+
+    def test_regs(self):
+        dut = PWMPeripheral(pins=PWMPins())
+        regs = CSRDriver(dut)
+        async def testbench(ctx):
+            await regs.write(ctx, "numr", 0x1234)
+            await regs.write(ctx, "denom", 0xABCD)
+            self.assertEqual(await regs.read(ctx, "numr"), 0x1234)
+            self.assertEqual(await regs.read(ctx, "numr", backdoor=True), 0x1234)
+            self.assertEqual(await regs.read(ctx, "denom"), 0xABCD)
+        run_simulation(dut, testbench, name="pwm_regs_test")
+
+    def test_regs_wishbone(self):
+        dut = PWMPeripheral(pins=PWMPins(), fifo_depth=8, data_width=32)
+        regs = CSRDriver(dut)
+        async def testbench(ctx):
+            # one bus cycle per register, acknowledged on the next
+            ctx.set(dut.bus.adr, 0x4 // 4)
+            ctx.set(dut.bus.sel, 0b1111)
+            ctx.set(dut.bus.we, 1)
+            ctx.set(dut.bus.dat_w, 0xABCD)
+            ctx.set(dut.bus.cyc, 1)
+            ctx.set(dut.bus.stb, 1)
+            await ctx.tick()
+            self.assertEqual(ctx.get(dut.bus.ack), 1)
+            ctx.set(dut.bus.cyc, 0)
+            ctx.set(dut.bus.stb, 0)
+            await ctx.tick()
+            self.assertEqual(await regs.read(ctx, "denom", backdoor=True), 0xABCD)
+
+            await regs.write(ctx, "numr", 0x1234)
+            self.assertEqual(await regs.read(ctx, "numr"), 0x1234)
+            for sample in range(3):
+                await regs.write(ctx, "fifo", sample)
+            await ctx.tick()
+            self.assertEqual(await regs.read(ctx, "fifo_status"), 3)
+            await regs.write(ctx, "fifo_conf", 2 | (1 << 8))
+            self.assertEqual(await regs.read(ctx, "fifo_conf"), 2 | (1 << 8))
+        run_simulation(dut, testbench, name="pwm_regs_wishbone_test")
+
+    def test_fifo_stream(self):
+        dut = PWMPeripheral(pins=PWMPins(), fifo_depth=8)
+        regs = CSRDriver(dut, backdoor=True)
+        samples = [1, 3, 5, 7, 9]
+        async def testbench(ctx):
+            await regs.write(ctx, "denom", 9)
+            await regs.write(ctx, "fifo_conf", 2 | (1 << 8)) # watermark 2, interrupt enabled
+            await regs.write(ctx, "conf", 0x4) # streaming, disabled
+            for sample in samples:
+                await regs.write(ctx, "fifo", sample)
+            await ctx.tick().repeat(4)
+            self.assertEqual(await regs.read(ctx, "fifo_status"), 4) # one entry preloaded
+            self.assertEqual(ctx.get(dut.irq), 1) # the FIFO started out empty
+            await regs.write(ctx, "fifo_int", 0b01)
+            await wait_for(ctx, dut.irq, 0, timeout=3)
+
+            await regs.write(ctx, "conf", 0x5) # streaming, enabled
+            await wait_for(ctx, regs.value("conf"), 0x5)
+            stream = await capture(ctx, dut.pins.pwm.o, 60)
+            # one sample per period, then the last one is held
+            expected = np.concatenate([pwm_model([numr], [9], 10) for numr in samples + [9]])
+            self.assertIsNone(first_mismatch(stream, pack_words(expected)))
+            self.assertEqual(await regs.read(ctx, "fifo_status"), 0)
+            self.assertEqual(await regs.read(ctx, "fifo_int"), 0b11) # low and underrun
+            self.assertEqual(ctx.get(dut.irq), 1)
+        run_simulation(dut, testbench, name="pwm_fifo_stream_test")
+
+    def test_fifo_watermark(self):
+        dut = PWMPeripheral(pins=PWMPins(), fifo_depth=8)
+        regs = CSRDriver(dut, backdoor=True)
+        async def testbench(ctx):
+            await regs.write(ctx, "denom", 9)
+            await regs.write(ctx, "fifo_conf", 2 | (1 << 8)) # watermark 2, interrupt enabled
+            for sample in range(1, 7):
+                await regs.write(ctx, "fifo", sample)
+            await regs.write(ctx, "conf", 0x4) # streaming, disabled
+            await wait_for(ctx, regs.value("conf"), 0x4)
+            await ctx.tick().repeat(4)
+            self.assertEqual(await regs.read(ctx, "fifo_status"), 5)
+            self.assertEqual(ctx.get(dut.irq), 0)
+
+            await regs.write(ctx, "conf", 0x5) # streaming, enabled
+            await wait_for(ctx, regs.value("conf"), 0x5)
+            # the level drops to the watermark at the end of the third period
+            cycles = await wait_for(ctx, dut.irq, 1, timeout=40)
+            self.assertEqual(cycles, 31)
+            self.assertEqual(await regs.read(ctx, "fifo_status"), 2)
+            self.assertEqual(await regs.read(ctx, "fifo_int"), 0b01)
+        run_simulation(dut, testbench, name="pwm_fifo_watermark_test")
+
+    def test_fifo_restream(self):
+        dut = PWMPeripheral(pins=PWMPins(), fifo_depth=8)
+        regs = CSRDriver(dut, backdoor=True)
+        async def testbench(ctx):
+            await regs.write(ctx, "denom", 9)
+            await regs.write(ctx, "conf", 0x4) # streaming, disabled
+            await regs.write(ctx, "fifo", 7)
+            await regs.write(ctx, "conf", 0x5) # streaming, enabled
+            stream = await capture(ctx, dut.pins.pwm.o, 30)
+            self.assertGreater(int(stream.sum()), 0)
+            self.assertEqual(await regs.read(ctx, "fifo_status"), 0)
+
+            await regs.write(ctx, "conf", 0x0) # not streaming, disabled
+            await regs.write(ctx, "conf", 0x5) # streaming again, with nothing in the FIFO
+            stream = await capture(ctx, dut.pins.pwm.o, 40)
+            self.assertEqual(int(stream.sum()), 0) # not the duty cycle of the last stream
+        run_simulation(dut, testbench, name="pwm_fifo_restream_test")
+
+    def test_pwm_stream(self):
+        # (numr, denom) per channel, including the degenerate settings
+        config = [(0x1F, 0xFF), (0, 10), (5, 0), (0, 0), (7, 7), (9, 3), (1, 1), (2, 1),
+                  (1, 2), (300, 1000), (999, 1000), (1000, 999), (100, 65535), (65535, 65535),
+                  (0x1234, 0x4321), (0xFFFE, 0xFFFF)]
+        cycles = 1 << 16
+        m = Module()
+        channels = []
+        for index in range(len(config)):
+            channels.append(PWMPeripheral(pins=PWMPins()))
+            m.submodules[f"pwm{index}"] = channels[-1]
+        pwm_o = Cat(channel.pins.pwm.o for channel in channels)
+        # one testbench per channel, in lockstep, so that all of them are enabled on the same edge
+        def setup(channel, numr, denom):
+            async def testbench(ctx):
+                regs = CSRDriver(channel)
+                await regs.write(ctx, "numr", numr)
+                await regs.write(ctx, "denom", denom)
+                await regs.write(ctx, "conf", 0x01)
+            return testbench
+        captured = None
+        async def testbench(ctx):
+            nonlocal captured
+            await wait_for(ctx, CSRDriver(channels[0]).value("conf"), 0x01)
+            captured = await capture(ctx, pwm_o, cycles)
+        setups = [setup(channel, *settings) for channel, settings in zip(channels, config)]
+        run_simulation(m, testbench, *setups, name="pwm_stream_test")
+        expected = pack_words(pwm_model(*zip(*config), cycles))
+        self.assertIsNone(first_mismatch(captured, expected)) # (cycle, channel) of the first difference
+
+    def test_prescale_stream(self):
+        # (numr, denom, prescale) per channel, over the range of each
+        config = [(0x1F, 0xFF, 0), (0x1F, 0xFF, 1), (1, 2, 2), (3, 7, 7), (0, 3, 5), (5, 0, 3),
+                  (2, 1, 0xFF), (9, 9, 0x100), (100, 1000, 3), (999, 1000, 1), (0xFFFF, 0xFFFF, 1),
+                  (1, 1, 0x7FFF), (0, 0, 0xFFFF), (1, 0, 0xFFFF), (7, 9, 0xFFFE), (0x1234, 0x4321, 2)]
+        cycles = 1 << 16
+        m = Module()
+        channels = []
+        for index in range(len(config)):
+            channels.append(PWMPeripheral(pins=PWMPins()))
+            m.submodules[f"pwm{index}"] = channels[-1]
+        pwm_o = Cat(channel.pins.pwm.o for channel in channels)
+        def setup(channel, numr, denom, prescale):
+            async def testbench(ctx):
+                regs = CSRDriver(channel)
+                await regs.write(ctx, "numr", numr)
+                await regs.write(ctx, "denom", denom)
+                await regs.write(ctx, "prescale", prescale)
+                await regs.write(ctx, "conf", 0x01)
+            return testbench
+        captured = None
+        async def testbench(ctx):
+            nonlocal captured
+            await wait_for(ctx, CSRDriver(channels[0]).value("conf"), 0x01)
+            captured = await capture(ctx, pwm_o, cycles)
+        setups = [setup(channel, *settings) for channel, settings in zip(channels, config)]
+        run_simulation(m, testbench, *setups, name="pwm_prescale_stream_test")
+        expected = pack_words(pwm_model(*zip(*config), cycles))
+        self.assertIsNone(first_mismatch(captured, expected))
+
+    def test_fast_domain(self):
+        # the counter runs on a clock 4 times faster than the registers
+        dut = PWMPeripheral(pins=PWMPins(), domain="pwm")
+        m = Module()
+        m.domains.pwm = ClockDomain()
+        m.submodules.dut = dut
+        regs = CSRDriver(dut, backdoor=True)
+        async def testbench(ctx):
+            await regs.write(ctx, "numr", 5)
+            await regs.write(ctx, "denom", 11)
+            await regs.write(ctx, "prescale", 1)
+            await regs.write(ctx, "conf", 0x01)
+            await wait_for(ctx, regs.value("conf"), 0x01)
+            stream = await capture(ctx, dut.pins.pwm.o, 480, domain="pwm")
+            start = int(np.flatnonzero(stream)[0])
+            self.assertLess(start, 8) # synchronizer latency
+            expected = pack_words(pwm_model([5], [11], len(stream) - start, prescale=1))
+            self.assertIsNone(first_mismatch(stream[start:], expected))
+            # a new duty cycle takes effect within a period
+            await regs.write(ctx, "numr", 2)
+            await wait_for(ctx, regs.value("numr"), 2)
+            stream = await capture(ctx, dut.pins.pwm.o, 24 * 11, domain="pwm")
+            self.assertEqual(int(stream[24:].sum()), 6 * 10)
+            # as does disabling
+            await regs.write(ctx, "conf", 0x00)
+            await wait_for(ctx, regs.value("conf"), 0x00)
+            await ctx.tick("pwm").repeat(8)
+            self.assertEqual(ctx.get(dut.pins.pwm.o), 0)
+        run_simulation(m, testbench, name="pwm_fast_domain_test", clocks={"pwm": 0.5e-6})
+
+    def test_deadtime(self):
+        # (numr, denom, deadtime) per channel
+        config = [(3, 7, 0), (3, 7, 1), (3, 7, 3), (3, 7, 4), (0x1F, 0xFF, 10), (0, 9, 2),
+                  (9, 9, 2), (1, 1, 0), (1, 2, 1), (200, 255, 255)]
+        cycles = 4096
+        m = Module()
+        channels = []
+        for index in range(len(config)):
+            channels.append(PWMPeripheral(pins=PWMPins(complementary=True)))
+            m.submodules[f"pwm{index}"] = channels[-1]
+        outputs = Cat(*(channel.pins.pwm.o for channel in channels),
+                      *(channel.pins.pwm_n.o for channel in channels))
+        def setup(channel, numr, denom, deadtime):
+            async def testbench(ctx):
+                regs = CSRDriver(channel)
+                await regs.write(ctx, "numr", numr)
+                await regs.write(ctx, "denom", denom)
+                await regs.write(ctx, "deadtime", deadtime)
+                await ctx.tick().repeat(300)
+                await regs.write(ctx, "conf", 0x01)
+            return testbench
+        captured = None
+        async def testbench(ctx):
+            nonlocal captured
+            await ctx.tick().repeat(300)
+            self.assertEqual(ctx.get(outputs), 0) # both sides off while disabled
+            await wait_for(ctx, CSRDriver(channels[0]).value("conf"), 0x01)
+            captured = await capture(ctx, outputs, cycles)
+        setups = [setup(channel, *settings) for channel, settings in zip(channels, config)]
+        run_simulation(m, testbench, *setups, name="pwm_deadtime_test")
+        numr, denom, deadtime = zip(*config)
+        high, low = deadtime_model(pwm_model(numr, denom, cycles), deadtime)
+        self.assertFalse((high & low).any())
+        self.assertIsNone(first_mismatch(captured, pack_words(np.hstack([high, low]))))
 
 if __name__ == "__main__":
     unittest.main()
-
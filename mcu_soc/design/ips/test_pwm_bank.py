@@ -0,0 +1,112 @@
+from amaranth import *
+
+from mcu_soc.design.ips.pwm import PWMPins
+from mcu_soc.design.ips.pwm_bank import PWMBank
+from mcu_soc.design.ips.testing import CSRDriver, wait_for, run_simulation
+from mcu_soc.design.ips.testing.stream import pwm_model, pack_words, capture, first_mismatch
+import numpy as np
+import unittest
+
+class TestPwmBank(unittest.TestCase):
+
+    def test_commit(self):
+        dut = PWMBank(pins=[PWMPins() for _ in range(4)])
+        regs = CSRDriver(dut, backdoor=True)
+        pwm_o = Cat(pins.pwm.o for pins in dut.pins)
+        dir_o = Cat(pins.dir.o for pins in dut.pins)
+        old_duty, new_duty = [10, 20, 30, 40], [50, 0, 99, 5]
+        async def testbench(ctx):
+            await regs.write(ctx, "denom", 99)
+            for i, duty in enumerate(old_duty):
+                await regs.write(ctx, f"duty{i}", duty)
+            await regs.write(ctx, "dir", 0b0101)
+            await regs.write(ctx, "conf", 0x1)
+            self.assertEqual(ctx.get(pwm_o), 0) # nothing latched yet
+            await regs.write(ctx, "commit", 0x1)
+
+            # align to the start of a period
+            await wait_for(ctx, pwm_o, 0b1111)
+            self.assertEqual(ctx.get(dir_o), 0b0101)
+            self.assertEqual(await regs.read(ctx, "commit"), 0) # not pending
+            old = await capture(ctx, pwm_o, 100)
+            self.assertIsNone(first_mismatch(old, pack_words(pwm_model(old_duty, [99] * 4, 100))))
+
+            # update all channels 20 cycles into a period
+            await ctx.tick().repeat(20)
+            await regs.write(ctx, "denom", 199)
+            for i, duty in enumerate(new_duty):
+                await regs.write(ctx, f"duty{i}", duty)
+            await regs.write(ctx, "dir", 0b1010)
+            await regs.write(ctx, "commit", 0x1)
+            pending = regs.register("commit").f.pending.r_data
+            await wait_for(ctx, pending, 1, timeout=3)
+            self.assertEqual(ctx.get(dir_o), 0b0101)
+
+            # the current period completes with the old settings, then every channel switches
+            # on the cycle `pending` clears
+            words = await capture(ctx, Cat(pwm_o, pending), 500)
+            switch = int(np.flatnonzero((words & 0x10) == 0)[0])
+            self.assertLess(switch, 80) # at least 20 cycles into the period
+            expected = pack_words(pwm_model(old_duty, [99] * 4, 100)[100 - switch:])
+            self.assertIsNone(first_mismatch(words[:switch] & 0xF, expected))
+            expected = pack_words(pwm_model(new_duty, [199] * 4, 500 - switch))
+            self.assertIsNone(first_mismatch(words[switch:] & 0xF, expected))
+            self.assertEqual(ctx.get(dir_o), 0b1010)
+        run_simulation(dut, testbench, name="pwm_bank_commit_test")
+
+    def test_commit_disabled(self):
+        dut = PWMBank(pins=[PWMPins() for _ in range(2)])
+        regs = CSRDriver(dut)
+        async def testbench(ctx):
+            await regs.write(ctx, "dir", 0b11)
+            await regs.write(ctx, "commit", 0x1)
+            # with the counter stopped, every cycle is a period boundary
+            await wait_for(ctx, dut.pins[1].dir.o, 1, timeout=5)
+            self.assertEqual(await regs.read(ctx, "commit"), 0)
+        run_simulation(dut, testbench, name="pwm_bank_commit_disabled_test")
+
+    def test_stop(self):
+        dut = PWMBank(pins=[PWMPins() for _ in range(3)])
+        regs = CSRDriver(dut, backdoor=True)
+        pwm_o = Cat(pins.pwm.o for pins in dut.pins)
+        async def testbench(ctx):
+            await regs.write(ctx, "denom", 9)
+            for i in range(3):
+                await regs.write(ctx, f"duty{i}", 4)
+            await regs.write(ctx, "conf", 0x1)
+            await regs.write(ctx, "commit", 0x1)
+            await wait_for(ctx, pwm_o, 0b111)
+
+            ctx.set(dut.pins[1].stop.i, 1)
+            await wait_for(ctx, regs.register("stop_int").f.stopped.data, 0b010, timeout=4)
+            self.assertEqual(await regs.read(ctx, "status"), 0b010)
+            ctx.set(dut.pins[1].stop.i, 0)
+            for i in range(30): # channel 1 stays low, the others keep running
+                self.assertEqual(ctx.get(dut.pins[1].pwm.o), 0)
+                await ctx.tick()
+            await wait_for(ctx, pwm_o, 0b101)
+
+            await regs.write(ctx, "stop_int", 0b010)
+            await wait_for(ctx, pwm_o, 0b111)
+        run_simulation(dut, testbench, name="pwm_bank_stop_test")
+
+    def test_stop_irq(self):
+        dut = PWMBank(pins=[PWMPins() for _ in range(3)])
+        regs = CSRDriver(dut)
+        async def testbench(ctx):
+            await regs.write(ctx, "conf", 0x3) # enabled, stop interrupt enabled
+            ctx.set(dut.pins[0].stop.i, 1)
+            ctx.set(dut.pins[2].stop.i, 1)
+            await wait_for(ctx, dut.irq, 1, timeout=4)
+            ctx.set(dut.pins[0].stop.i, 0)
+            ctx.set(dut.pins[2].stop.i, 0)
+            # raised until every channel has been cleared
+            await regs.write(ctx, "stop_int", 0b001)
+            await ctx.tick().repeat(2)
+            self.assertEqual(ctx.get(dut.irq), 1)
+            await regs.write(ctx, "stop_int", 0b100)
+            await wait_for(ctx, dut.irq, 0, timeout=2)
+        run_simulation(dut, testbench, name="pwm_bank_stop_irq_test")
+
+if __name__ == "__main__":
+    unittest.main()
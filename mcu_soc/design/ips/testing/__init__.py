@@ -0,0 +1,5 @@
+from .csr import CSRDriver, wait_for
+from .sim import TraceConfig, SimResult, run_simulation
+from .wishbone import WishboneMemory
+
+__all__ = ["CSRDriver", "wait_for", "TraceConfig", "SimResult", "run_simulation", "WishboneMemory"]
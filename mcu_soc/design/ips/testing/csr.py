@@ -0,0 +1,137 @@
+from amaranth.hdl import C, Cat, Shape
+from amaranth_soc.csr import action
+
+
+__all__ = ["CSRDriver", "wait_for"]
+
+
+# field actions that hold their value in a register of their own
+_STORAGE_ACTIONS = (action.RW, action.RW1C, action.RW1S)
+
+
+def _register_name(path):
+    return ".".join("_".join(str(part) for part in name) if isinstance(name, tuple) else str(name)
+                    for name in path)
+
+
+class CSRDriver:
+    """Register access for peripheral testbenches.
+
+    Registers are looked up by name in the memory map of ``bus`` (``dut.bus`` by default),
+    e.g. ``"numr"``, or ``"rx.data"`` for a register inside a cluster.
+
+    Writes drive the CSR bus one beat per clock cycle, exactly as the CPU would through the
+    Wishbone bridge, or, for a peripheral built with a Wishbone register bus, issue one Wishbone
+    cycle per register and wait for its acknowledge. The new value can land as late as the clock
+    edge after :meth:`write` returns; testbenches that depend on the exact cycle wait for it on
+    :meth:`value`. Reads go over the bus too, unless made through the back door, which takes no
+    simulated time and samples each field's read port instead. There are no back-door writes:
+    amaranth-soc drives the field ports and storage from the bus, so a testbench cannot set them.
+
+    Parameters
+    ----------
+    dut : :class:`wiring.Component`
+        The peripheral under test.
+    bus : :class:`csr.Interface` or :class:`wishbone.Interface`
+        Bus to use instead of ``dut.bus``.
+    backdoor : bool
+        Default access mode for :meth:`read`.
+    """
+    def __init__(self, dut, bus=None, *, backdoor=False):
+        self._bus = dut.bus if bus is None else bus
+        self.backdoor = backdoor
+        self._registers = {}
+        for info in self._bus.memory_map.all_resources():
+            self._registers[_register_name(info.path)] = info
+
+    @property
+    def names(self):
+        return list(self._registers)
+
+    def register(self, name):
+        """Return the ``csr.Register`` called ``name``."""
+        return self._info(name).resource
+
+    def _info(self, name):
+        try:
+            return self._registers[name]
+        except KeyError:
+            raise KeyError(f"No register '{name}', expected one of: {', '.join(self._registers)}") \
+                from None
+
+    def _fields(self, name):
+        offset = 0
+        for path, field in self.register(name):
+            width = Shape.cast(field.port.shape).width
+            yield path, field, offset, width
+            offset += width
+
+    def value(self, name):
+        """Return the value held by register ``name``: the storage of each ``RW``, ``RW1C`` and
+        ``RW1S`` field, and zeros for the other fields."""
+        return Cat(field.data if isinstance(field, _STORAGE_ACTIONS) else C(0, width)
+                   for _, field, _, width in self._fields(name))
+
+    @property
+    def _is_wishbone(self):
+        return hasattr(self._bus, "cyc")
+
+    async def _wishbone_cycle(self, ctx, info, value=None):
+        ratio = self._bus.data_width // self._bus.granularity
+        ctx.set(self._bus.adr, info.start // ratio)
+        ctx.set(self._bus.sel, (1 << ratio) - 1)
+        ctx.set(self._bus.we, value is not None)
+        ctx.set(self._bus.dat_w, value or 0)
+        ctx.set(self._bus.cyc, 1)
+        ctx.set(self._bus.stb, 1)
+        await ctx.tick()
+        while not ctx.get(self._bus.ack):
+            await ctx.tick()
+        ctx.set(self._bus.cyc, 0)
+        ctx.set(self._bus.stb, 0)
+        return ctx.get(self._bus.dat_r)
+
+    async def write(self, ctx, name, value):
+        """Write ``value`` to register ``name``."""
+        info = self._info(name)
+        if self._is_wishbone:
+            await self._wishbone_cycle(ctx, info, value)
+            return
+        data_width = self._bus.data_width
+        for i in range(info.end - info.start):
+            ctx.set(self._bus.addr, info.start + i)
+            ctx.set(self._bus.w_data, (value >> (data_width * i)) & ((1 << data_width) - 1))
+            ctx.set(self._bus.w_stb, 1)
+            await ctx.tick()
+        ctx.set(self._bus.w_stb, 0)
+
+    async def read(self, ctx, name, *, backdoor=None):
+        """Read register ``name`` and return its value."""
+        if self.backdoor if backdoor is None else backdoor:
+            value = 0
+            for path, field, offset, width in self._fields(name):
+                if field.port.access.readable():
+                    value |= ctx.get(field.port.r_data) << offset
+            return value
+
+        info = self._info(name)
+        if self._is_wishbone:
+            return await self._wishbone_cycle(ctx, info)
+        data_width = self._bus.data_width
+        value = 0
+        for i in range(info.end - info.start):
+            ctx.set(self._bus.addr, info.start + i)
+            ctx.set(self._bus.r_stb, 1)
+            await ctx.tick()
+            value |= ctx.get(self._bus.r_data) << (data_width * i)
+        ctx.set(self._bus.r_stb, 0)
+        return value
+
+
+async def wait_for(ctx, signal, value, *, timeout=10_000):
+    """Tick until ``signal`` equals ``value`` and return the number of cycles waited."""
+    for cycles in range(timeout + 1):
+        if ctx.get(signal) == value:
+            return cycles
+        await ctx.tick()
+    raise AssertionError(f"{signal!r} did not become {value} within {timeout} cycles")
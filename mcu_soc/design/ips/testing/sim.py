@@ -0,0 +1,176 @@
+import os
+import gzip
+import json
+import time
+from collections import namedtuple
+from fnmatch import fnmatchcase
+from pathlib import Path
+
+from amaranth.hdl import Value, ValueLike
+from amaranth.lib import wiring
+from amaranth.sim import Simulator
+
+
+__all__ = ["TraceConfig", "SimResult", "run_simulation"]
+
+
+SimResult = namedtuple("SimResult", ["name", "cycles", "seconds", "trace"])
+SimResult.__doc__ = """Outcome of :func:`run_simulation`: simulated clock cycles, wall-clock
+seconds spent in the simulator, and the path of the trace written (or ``None``)."""
+
+
+def _parse_window(window):
+    start, sep, end = window.partition(":")
+    if not sep:
+        raise ValueError(f"Trace window '{window}' must be of the form START:END (in clock cycles)")
+    return int(start or 0), int(end) if end else None
+
+
+class TraceConfig:
+    """Waveform capture settings.
+
+    Tracing is off unless enabled, and is normally configured from the environment (the
+    ``--sim-trace*`` pytest options set the same variables):
+
+    ``CHIPFLOW_SIM_TRACE``
+        Set to ``1`` to write a trace for every simulation.
+    ``CHIPFLOW_SIM_TRACE_SIGNALS``
+        Comma-separated allow-list of glob patterns matched against signal names such as
+        ``pins.pwm.o`` or ``bus.w_data`` (default: all traceable signals).
+    ``CHIPFLOW_SIM_TRACE_WINDOW``
+        ``START:END`` range of clock cycles to record; either end may be omitted.
+    ``CHIPFLOW_SIM_TRACE_DIR``
+        Output directory (default: ``build/sim_traces``).
+
+    Traces are written as gzip-compressed VCD files, which GTKWave opens directly.
+    """
+    def __init__(self, *, enabled=False, signals=("*",), window=(0, None),
+                 directory="build/sim_traces"):
+        self.enabled = enabled
+        self.signals = tuple(signals)
+        self.window = window
+        self.directory = Path(directory)
+
+    @classmethod
+    def from_env(cls, environ=os.environ):
+        signals = [pattern.strip() for pattern in environ.get("CHIPFLOW_SIM_TRACE_SIGNALS", "").split(",")
+                   if pattern.strip()]
+        return cls(enabled=environ.get("CHIPFLOW_SIM_TRACE", "0") not in ("", "0"),
+                   signals=signals or ("*",),
+                   window=_parse_window(environ.get("CHIPFLOW_SIM_TRACE_WINDOW", ":")),
+                   directory=environ.get("CHIPFLOW_SIM_TRACE_DIR", "build/sim_traces"))
+
+    def select(self, signals):
+        """Filter a ``{name: signal}`` dict down to the allow-listed signals."""
+        return {name: signal for name, signal in signals.items()
+                if any(fnmatchcase(name, pattern) for pattern in self.signals)}
+
+
+def _traceable(obj, prefix=""):
+    if hasattr(obj, "signature") and isinstance(obj.signature, wiring.Signature):
+        for path, member, value in obj.signature.flatten(obj):
+            if isinstance(value, ValueLike):
+                yield prefix + ".".join(str(part) for part in path), Value.cast(value)
+    elif isinstance(obj, dict):
+        for name, value in obj.items():
+            yield from _traceable(value, f"{prefix}{name}.")
+    else:
+        yield prefix.rstrip("."), Value.cast(obj)
+
+
+class _Recorder:
+    def __init__(self, path, signals, period):
+        import vcd
+
+        self._file = gzip.open(path, "wt")
+        self._writer = vcd.VCDWriter(self._file, timescale="1 ps", comment="Generated by design/ips/testing")
+        self._period = round(period * 1e12)
+        self._vars = []
+        self._masks = []
+        for name, signal in signals.items():
+            scope, _, var_name = f"bench.{name}".rpartition(".")
+            self._vars.append(self._writer.register_var(scope, var_name, "wire", size=len(signal)))
+            self._masks.append((1 << len(signal)) - 1)
+        self._last = [None] * len(self._vars)
+
+    def sample(self, cycle, values):
+        timestamp = cycle * self._period
+        for index, value in enumerate(values):
+            if value != self._last[index]:
+                self._writer.change(self._vars[index], timestamp, value & self._masks[index])
+                self._last[index] = value
+
+    def close(self, cycle):
+        self._writer.close(cycle * self._period)
+        self._file.close()
+
+
+def _report(result):
+    rate = result.cycles / result.seconds if result.seconds else float("inf")
+    report_path = os.environ.get("CHIPFLOW_SIM_REPORT")
+    if report_path:
+        with open(report_path, "a") as f:
+            f.write(json.dumps({**result._asdict(), "trace": result.trace and str(result.trace)}) + "\n")
+    else:
+        print(f"{result.name}: {result.cycles} cycles in {result.seconds:.3f} s "
+              f"({rate:,.0f} cycles/s, tracing {'on' if result.trace else 'off'})")
+
+
+def run_simulation(dut, *testbenches, name, period=2e-6, traces=None, domain="sync", config=None,
+                   background=(), clocks=None):
+    """Simulate ``dut`` with a clock of ``period`` seconds until the testbenches finish.
+
+    ``clocks`` maps the names of any other clock domains to their periods.
+
+    Each testbench is an async function taking the simulator context. Those in ``background``
+    (e.g. models of the devices on the other side of a bus) run until the others finish. When tracing is enabled
+    in ``config`` (by default, :meth:`TraceConfig.from_env`), the ports of ``dut`` (if it is a
+    component) and any extra signals or interfaces in the ``traces`` dict are sampled on every
+    clock edge and the allow-listed ones are written to ``<directory>/<name>.vcd.gz``.
+
+    The number of simulated cycles and the wall-clock time are reported to stdout, or, under
+    pytest, collected for the end-of-session summary.
+    """
+    config = TraceConfig.from_env() if config is None else config
+    sim = Simulator(dut)
+    sim.add_clock(period, domain=domain)
+    for clock_domain, clock_period in (clocks or {}).items():
+        sim.add_clock(clock_period, domain=clock_domain)
+    for testbench in testbenches:
+        sim.add_testbench(testbench)
+    for testbench in background:
+        sim.add_testbench(testbench, background=True)
+
+    recorder = None
+    signals = {}
+    trace_path = None
+    if config.enabled:
+        candidates = dict(_traceable(dut)) if isinstance(dut, wiring.Component) else {}
+        if traces is not None:
+            candidates.update(_traceable(traces))
+        signals = config.select(candidates)
+        config.directory.mkdir(parents=True, exist_ok=True)
+        trace_path = config.directory / f"{name}.vcd.gz"
+        recorder = _Recorder(trace_path, signals, period)
+
+    cycles = 0
+    async def monitor(ctx):
+        nonlocal cycles
+        start, end = config.window
+        async for _, _, *values in ctx.tick(domain).sample(*signals.values()):
+            if recorder is not None and cycles >= start and (end is None or cycles < end):
+                recorder.sample(cycles, values)
+            cycles += 1
+    sim.add_testbench(monitor, background=True)
+
+    started = time.perf_counter()
+    try:
+        sim.run()
+    finally:
+        seconds = time.perf_counter() - started
+        if recorder is not None:
+            recorder.close(cycles)
+
+    result = SimResult(name, cycles, seconds, trace_path)
+    _report(result)
+    return result
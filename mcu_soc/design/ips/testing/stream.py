@@ -0,0 +1,154 @@
+import numpy as np
+
+
+__all__ = ["pwm_model", "deadtime_model", "pdm_model", "snr_db", "sine_codes", "pack_words", "capture",
+           "record", "first_mismatch"]
+
+
+def pwm_model(numr, denom, cycles, prescale=0):
+    """Output of :class:`PWMPeripheral` channels enabled at cycle 0 with the counter cleared.
+
+    ``numr``, ``denom`` and ``prescale`` are sequences with one entry per channel (or, for
+    ``prescale``, one for all). Returns a boolean array of shape ``(cycles, channels)``.
+
+    The counter runs from 0 to ``denom`` inclusive, advancing every ``prescale + 1`` cycles,
+    and the output is high while the counter is at most ``numr`` (and ``numr`` is non-zero).
+    """
+    numr = np.asarray(numr, dtype=np.int64)
+    denom = np.asarray(denom, dtype=np.int64)
+    prescale = np.asarray(prescale, dtype=np.int64)
+    count = (np.arange(cycles, dtype=np.int64)[:, np.newaxis] // (prescale + 1)) % (denom + 1)
+    return (numr > 0) & (count <= numr)
+
+
+def deadtime_model(pulse, deadtime):
+    """Complementary outputs of :class:`PWMPeripheral` channels that have been idle for a
+    while, for the PWM signal ``pulse`` (as returned by :func:`pwm_model`).
+
+    ``deadtime`` has one entry per channel. Returns the high side and low side outputs, each
+    high once ``pulse`` has been high (or low) for more than ``deadtime`` cycles.
+    """
+    pulse = np.asarray(pulse, dtype=bool)
+    deadtime = np.asarray(deadtime, dtype=np.int64)
+    held = np.empty(pulse.shape, dtype=np.int64)
+    prev = np.zeros(pulse.shape[1], dtype=bool)
+    count = np.full(pulse.shape[1], 256, dtype=np.int64)
+    for cycle in range(pulse.shape[0]):
+        count = np.where(pulse[cycle] == prev, np.minimum(count + 1, 256), 1)
+        held[cycle] = count
+        prev = pulse[cycle]
+    settled = held > deadtime
+    return pulse & settled, ~pulse & settled
+
+
+def pdm_model(outval, bitwidth, order=1):
+    """Output of enabled :class:`PDMPeripheral` channels, starting from reset.
+
+    ``outval`` is an array of shape ``(cycles, channels)`` holding the sample fed to the
+    modulator during each cycle. Returns a boolean array of the same shape.
+
+    For ``order=1`` this mirrors the pipelined first-order sigma-delta: both candidate next
+    errors are registered one cycle ahead of the comparison that picks one of them, so each
+    step uses the candidates computed from the previous error. For ``order=2`` it mirrors the
+    pair of saturating integrators. The recurrence is sequential in time, and vectorized
+    across channels.
+    """
+    outval = np.asarray(outval, dtype=np.int64)
+    cycles, channels = outval.shape
+    out = np.empty((cycles, channels), dtype=bool)
+
+    if order == 1:
+        mask = (1 << bitwidth) - 1
+        error = np.zeros(channels, dtype=np.int64)
+        error_0 = np.zeros(channels, dtype=np.int64)
+        error_1 = np.zeros(channels, dtype=np.int64)
+        pdm = np.zeros(channels, dtype=bool)
+        for t in range(cycles):
+            val = outval[t]
+            out[t] = pdm
+            pdm = val >= error
+            error, error_1, error_0 = (np.where(pdm, error_1, error_0),
+                                       (error + mask - val) & mask,
+                                       (error - val) & mask)
+        return out
+
+    half = 1 << (bitwidth - 1)
+    limit_1, limit_2 = 1 << (bitwidth + 1), 1 << (bitwidth + 2)
+    x = np.minimum(outval, (1 << bitwidth) - 1) - half
+    integ_1 = np.zeros(channels, dtype=np.int64)
+    integ_2 = np.zeros(channels, dtype=np.int64)
+    for t in range(cycles):
+        pdm = integ_2 >= 0
+        out[t] = pdm
+        fb = np.where(pdm, half, -half)
+        integ_2 = np.clip(integ_2 + integ_1 - 2 * fb, -limit_2, limit_2 - 1)
+        integ_1 = np.clip(integ_1 + x[t] - fb, -limit_1, limit_1 - 1)
+    return out
+
+
+def snr_db(bits, signal_bin, band_bins, *, leakage=3):
+    """In-band signal-to-noise ratio of a captured bit stream, in dB.
+
+    The stream is Hann-windowed; the signal power is taken from ``leakage`` bins either side
+    of ``signal_bin``, and the noise from the other bins up to ``band_bins`` (excluding DC).
+    """
+    y = np.asarray(bits, dtype=np.float64)
+    y = (y - y.mean()) * np.hanning(len(y))
+    power = np.abs(np.fft.rfft(y)) ** 2
+    signal = power[signal_bin - leakage:signal_bin + leakage + 1].sum()
+    noise = power[1:band_bins].sum() - signal
+    return 10 * np.log10(signal / noise)
+
+
+def sine_codes(cycles, bitwidth, signal_bin, *, amplitude=0.5):
+    """Codes of a sine wave completing ``signal_bin`` periods in ``cycles`` samples, at
+    ``amplitude`` relative to full scale, centred on half scale."""
+    half = 1 << (bitwidth - 1)
+    t = np.arange(cycles)
+    codes = np.round(half + amplitude * half * np.sin(2 * np.pi * signal_bin * t / cycles))
+    return np.clip(codes, 0, (1 << bitwidth) - 1).astype(np.int64)
+
+
+def pack_words(bits):
+    """Pack a boolean ``(cycles, channels)`` array into one little-endian word per cycle,
+    channel 0 in the least significant bit, as captured from ``Cat(*outputs)``."""
+    bits = np.asarray(bits, dtype=bool)
+    padded = np.zeros((bits.shape[0], 64), dtype=bool)
+    padded[:, :bits.shape[1]] = bits
+    return np.packbits(padded, axis=1, bitorder="little").view("<u8")[:, 0]
+
+
+async def capture(ctx, value, cycles, *, domain="sync"):
+    """Sample ``value`` (e.g. ``Cat`` of up to 64 outputs) on each of the next ``cycles`` clock
+    edges of ``domain`` and return the samples as a ``uint64`` array, one packed word per cycle."""
+    words = np.empty(cycles, dtype=np.uint64)
+    index = 0
+    if cycles:
+        async for _, _, word in ctx.tick(domain).sample(value):
+            words[index] = word
+            index += 1
+            if index == cycles:
+                break
+    return words
+
+
+def record(*values, domain="sync"):
+    """Return a background testbench sampling ``values`` on every clock edge of ``domain`` from
+    reset, and the list it appends the samples of each edge to (as a tuple)."""
+    samples = []
+    async def testbench(ctx):
+        async for _, _, *sampled in ctx.tick(domain).sample(*values):
+            samples.append(tuple(sampled))
+    return testbench, samples
+
+
+def first_mismatch(actual, expected):
+    """Return ``(cycle, channel)`` of the first difference between two packed captures, or
+    ``None`` if they are identical."""
+    diff = np.bitwise_xor(np.asarray(actual, dtype=np.uint64), np.asarray(expected, dtype=np.uint64))
+    nonzero = np.flatnonzero(diff)
+    if not len(nonzero):
+        return None
+    cycle = int(nonzero[0])
+    word = int(diff[cycle])
+    return cycle, (word & -word).bit_length() - 1
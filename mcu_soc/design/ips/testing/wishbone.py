@@ -0,0 +1,46 @@
+__all__ = ["WishboneMemory"]
+
+
+class WishboneMemory:
+    """Model of a Wishbone target, for testbenches of bus initiators.
+
+    ``data`` maps word addresses to values, and words missing from it read as ``default(addr)``
+    (0 by default). Each access is acknowledged ``latency`` cycles after it is issued, and
+    recorded in ``accesses`` as ``(addr, value)`` for writes or ``(addr, None)`` for reads.
+    Byte selects are honoured for writes. Run :meth:`serve` as a background testbench.
+    """
+    def __init__(self, bus, data=None, *, latency=1, default=None):
+        self.bus = bus
+        self.data = {} if data is None else data
+        self.latency = latency
+        self.default = (lambda addr: 0) if default is None else default
+        self.accesses = []
+
+    def read(self, addr):
+        return self.data.get(addr, self.default(addr))
+
+    async def serve(self, ctx):
+        bus = self.bus
+        granularity = len(bus.dat_w) // len(bus.sel)
+        while True:
+            await ctx.tick()
+            if not (ctx.get(bus.cyc) and ctx.get(bus.stb)) or ctx.get(bus.ack):
+                continue
+            addr = ctx.get(bus.adr)
+            if self.latency > 1:
+                await ctx.tick().repeat(self.latency - 1)
+            if ctx.get(bus.we):
+                value = self.read(addr)
+                sel = ctx.get(bus.sel)
+                for lane in range(len(bus.sel)):
+                    if sel & (1 << lane):
+                        mask = ((1 << granularity) - 1) << (lane * granularity)
+                        value = (value & ~mask) | (ctx.get(bus.dat_w) & mask)
+                self.data[addr] = value
+                self.accesses.append((addr, value))
+            else:
+                ctx.set(bus.dat_r, self.read(addr))
+                self.accesses.append((addr, None))
+            ctx.set(bus.ack, 1)
+            await ctx.tick()
+            ctx.set(bus.ack, 0)
@@ -0,0 +1,69 @@
+from amaranth import *
+from amaranth import Module
+from amaranth.utils import exact_log2
+
+from amaranth.lib import wiring
+from amaranth.lib.wiring import In
+from amaranth_soc import wishbone
+
+
+__all__ = ["WishboneRegisterBridge"]
+
+
+def _submodule_name(path):
+    return "__".join("_".join(map(str, name)) if isinstance(name, tuple) else str(name)
+                     for name in path)
+
+
+class WishboneRegisterBridge(wiring.Component):
+    """Wishbone access to a map of CSR registers, one register per bus cycle.
+
+    This takes the place of a ``csr.Bridge`` behind a ``WishboneCSRBridge``, which serialises
+    every access into one CSR transaction per byte. ``memory_map`` is the byte-addressed map of
+    a ``csr.Builder`` with a data width of 8, so the register offsets (and the C structs
+    describing them) are the same either way. Each register must be aligned to, and no wider
+    than, a bus word.
+
+    Accesses are acknowledged on the cycle after they are issued. Reads return 0 outside of any
+    register, and writes only take effect if they select every byte of the register.
+    """
+    def __init__(self, memory_map, *, data_width=32):
+        assert memory_map.data_width == 8, "memory_map must be byte addressed"
+        ratio = data_width // memory_map.data_width
+        for info in memory_map.all_resources():
+            assert info.start % ratio == 0 and info.end - info.start <= ratio, \
+                f"register {info.path} is not aligned to a {data_width}-bit word"
+
+        super().__init__({
+            "bus": In(wishbone.Signature(addr_width=memory_map.addr_width - exact_log2(ratio),
+                                         data_width=data_width,
+                                         granularity=memory_map.data_width)),
+        })
+        self.bus.memory_map = memory_map
+
+    def elaborate(self, platform):
+        m = Module()
+        ratio = self.bus.data_width // self.bus.granularity
+
+        access = self.bus.cyc & self.bus.stb & ~self.bus.ack
+        m.d.sync += self.bus.ack.eq(access)
+        with m.If(access):
+            m.d.sync += self.bus.dat_r.eq(0)
+
+        for info in self.bus.memory_map.all_resources():
+            reg = info.resource
+            m.submodules[_submodule_name(info.path)] = reg
+
+            selected = access & (self.bus.adr == info.start // ratio)
+            lanes = self.bus.sel[:info.end - info.start]
+            if reg.element.access.readable():
+                m.d.comb += reg.element.r_stb.eq(selected & ~self.bus.we)
+                with m.If(selected):
+                    m.d.sync += self.bus.dat_r.eq(reg.element.r_data)
+            if reg.element.access.writable():
+                m.d.comb += [
+                    reg.element.w_stb.eq(selected & self.bus.we & lanes.all()),
+                    reg.element.w_data.eq(self.bus.dat_w),
+                ]
+
+        return m
@@ -0,0 +1,284 @@
+"""The repeated peripherals of ``MySoC``, as described by ``[chipflow.peripherals]`` in
+``chipflow.toml``.
+
+Each entry of the table names a kind of peripheral from :data:`PERIPHERAL_KINDS` and gives the
+number of them, and where their registers are::
+
+    [chipflow.peripherals]
+    uart = { count = 2, base = 0xb2000000 }
+    motor_pwm = { count = 10, base = 0xb7000000, wide_base = 0xb9000000 }
+    gpio = { count = 2, width = 8 }
+
+``base`` is the address of the first one, and ``stride`` (default: that of the kind) the distance
+between them. Without a ``base``, the first free 16MiB window of the CSR space is allocated.
+With a 32-bit CSR data width, the motor and PDM peripherals are Wishbone targets of their own,
+and use ``wide_base`` if it is given. Any other key is an option of the kind (e.g. the pin count
+of a GPIO bank), see ``MySoC``. Kinds that are left out have no instances.
+
+:class:`PeripheralMap` resolves the table into a list of instances, in table order, with the
+names and addresses ``MySoC`` gives their interfaces, CSR windows and pins, and the C header
+that lets firmware address them and their interrupt sources and DMA request lines by number.
+"""
+
+import os
+import tomllib
+from pathlib import Path
+from collections import namedtuple
+
+from chipflow import ChipFlowError
+
+
+__all__ = ["PeripheralKind", "Peripheral", "PERIPHERAL_KINDS", "FIXED_CSR_BASES",
+           "IRQ_SOURCES", "DMA_REQUESTS", "PeripheralMap", "config_path", "load_peripheral_map"]
+
+
+PeripheralKind = namedtuple("PeripheralKind", ["interface", "csr", "pins", "stride", "wide"])
+PeripheralKind.__doc__ = """Names of the interface, CSR window and pins of an instance, formatted
+with its number; default address stride; and whether it has its own Wishbone target with a 32-bit
+CSR data width."""
+
+PERIPHERAL_KINDS = {
+    "user_spi":  PeripheralKind("user_spi_{}",  "user_spi_{}",  "user_spi{}",  0x100000, False),
+    "i2c":       PeripheralKind("i2c_{}",       "i2c_{}",       "i2c{}",       0x100000, False),
+    "motor_pwm": PeripheralKind("motor_pwm{}",  "motor_pwm{}",  "motor_pwm{}", 0x100,    True),
+    "pdm_ao":    PeripheralKind("pdm_ao_{}",    "pdm{}",        "pdm_ao_{}",   0x100,    True),
+    "uart":      PeripheralKind("uart_{}",      "uart_{}",      "uart{}",      0x100000, False),
+    "gpio":      PeripheralKind("gpio_{}",      "gpio_{}",      "gpio{}",      0x100000, False),
+}
+
+Peripheral = namedtuple("Peripheral", ["kind", "index", "interface", "csr", "pins", "addr"])
+
+# Register windows of the peripherals MySoC always has, by CSR data width. With a 32-bit one,
+# the instruction cache, interrupt and DMA controllers are Wishbone targets of their own.
+FIXED_CSR_BASES = {
+    8: {
+        "spiflash": 0xb0000000,
+        "icache":   0xb3000000,
+        "soc_id":   0xb4000000,
+        "intc":     0xb4100000,
+        "dma":      0xb4200000,
+    },
+    32: {
+        "spiflash": 0xb0000000,
+        "soc_id":   0xb4000000,
+        "icache":   0xba000000,
+        "intc":     0xbb000000,
+        "dma":      0xbc000000,
+    },
+}
+
+# Interrupt controller sources and DMA request lines, in the order MySoC connects them. "dma"
+# is the DMA controller itself. A kind has a source per instance unless that would make more
+# than MAX_IRQ_SOURCES, in which case the instances of motor_pwm, then of the largest kinds,
+# share one.
+IRQ_SOURCES = {
+    "uart":      "received data ready",
+    "user_spi":  "transfer done",
+    "i2c":       "transfer done",
+    "dma":       "a channel with DMA_CTRL_IE set is done",
+    "motor_pwm": "stop or FIFO low",
+}
+DMA_REQUESTS = {
+    "uart":      {"tx": "transmitter ready", "rx": "received data ready"},
+    "user_spi":  {"": "transfer done"},
+}
+MAX_IRQ_SOURCES = 32
+
+CSR_BASE   = 0xb0000000
+CSR_END    = 0xc0000000
+CSR_WINDOW = 0x1000000
+
+
+class PeripheralMap:
+    """The peripherals described by ``config``, the ``[chipflow.peripherals]`` table.
+
+    Iterating over the map gives every :class:`Peripheral`, in table order; ``map[kind]`` gives
+    those of one kind, and ``by_interface`` indexes them by interface name. Options that are
+    not known keys are in ``options[kind]``.
+    """
+    def __init__(self, config, *, csr_data_width=8):
+        self.csr_data_width = csr_data_width
+        self.counts = {kind: 0 for kind in PERIPHERAL_KINDS}
+        self.bases = {}
+        self.strides = {}
+        self.options = {kind: {} for kind in PERIPHERAL_KINDS}
+
+        # everything is 16MiB-aligned in the CSR space: the 8-bit CSR bus covers all of it,
+        # or, with a 32-bit CSR data width, its first half, the rest being Wishbone targets
+        narrow_end = CSR_END if csr_data_width == 8 else CSR_BASE + (CSR_END - CSR_BASE) // 2
+        used = []
+        for name, addr in FIXED_CSR_BASES[csr_data_width].items():
+            start = addr - addr % CSR_WINDOW
+            if (start, start + CSR_WINDOW) not in used:
+                used.append((start, start + CSR_WINDOW))
+
+        pending = []
+        for kind, entry in config.items():
+            if kind not in PERIPHERAL_KINDS:
+                raise ChipFlowError(f"Unknown peripheral kind '{kind}', expected one of: "
+                                    f"{', '.join(PERIPHERAL_KINDS)}")
+            entry = dict(entry)
+            self.counts[kind] = entry.pop("count")
+            self.strides[kind] = entry.pop("stride", PERIPHERAL_KINDS[kind].stride)
+            base, wide_base = entry.pop("base", None), entry.pop("wide_base", None)
+            if self._wide(kind) and wide_base is not None:
+                base = wide_base
+            self.options[kind] = entry
+            if base is None:
+                pending.append(kind)
+            else:
+                self.bases[kind] = base
+                self._reserve(used, kind, base, narrow_end)
+        for kind in pending:
+            start, end = (narrow_end, CSR_END) if self._wide(kind) else (CSR_BASE, narrow_end)
+            size = max(self.counts[kind] * self.strides[kind], 1)
+            for base in range(start, end, CSR_WINDOW):
+                if all(base + size <= lo or base >= hi for lo, hi in used):
+                    break
+            else:
+                raise ChipFlowError(f"No room for {self.counts[kind]} '{kind}' peripherals in "
+                                    f"the CSR space")
+            self.bases[kind] = base
+            self._reserve(used, kind, base, narrow_end)
+
+        self._instances = []
+        self._by_kind = {kind: [] for kind in PERIPHERAL_KINDS}
+        for kind in config:
+            names = PERIPHERAL_KINDS[kind]
+            for index in range(self.counts[kind]):
+                periph = Peripheral(kind, index, names.interface.format(index),
+                                    names.csr.format(index), names.pins.format(index),
+                                    self.bases[kind] + index * self.strides[kind])
+                self._instances.append(periph)
+                self._by_kind[kind].append(periph)
+        self.by_interface = {periph.interface: periph for periph in self._instances}
+
+    def _wide(self, kind):
+        return PERIPHERAL_KINDS[kind].wide and self.csr_data_width == 32
+
+    def _reserve(self, used, kind, base, narrow_end):
+        start, end = (narrow_end, CSR_END) if self._wide(kind) else (CSR_BASE, narrow_end)
+        size = self.counts[kind] * self.strides[kind]
+        if not (start <= base and base + size <= end):
+            raise ChipFlowError(f"'{kind}' peripherals at {base:#x}-{base + size:#x} are "
+                                f"outside {start:#x}-{end:#x}")
+        for lo, hi in used:
+            if base < hi and base + size > lo:
+                raise ChipFlowError(f"'{kind}' peripherals at {base:#x}-{base + size:#x} "
+                                    f"overlap {lo:#x}-{hi:#x}")
+        used.append((base, base + size))
+
+    def __iter__(self):
+        return iter(self._instances)
+
+    def __getitem__(self, kind):
+        return self._by_kind[kind]
+
+    def base(self, kind):
+        return self.bases[kind]
+
+    def irq_layout(self):
+        """Return ``{source: (first, count)}`` for the :data:`IRQ_SOURCES` in order."""
+        counts = {kind: 1 if kind == "dma" else self.counts[kind] for kind in IRQ_SOURCES}
+        if self.options["motor_pwm"].get("bank", False):
+            counts["motor_pwm"] = min(counts["motor_pwm"], 1)
+        # over the limit, the motor drivers share a source first, then the kind with the most
+        # instances, and so on; MySoC ORs the interrupts of a kind that shares one
+        overflowing = ["motor_pwm", *sorted(counts, key=lambda kind: -counts[kind])]
+        while sum(counts.values()) > MAX_IRQ_SOURCES:
+            kind = overflowing.pop(0)
+            counts[kind] = min(counts[kind], 1)
+        layout = {}
+        first = 0
+        for kind, count in counts.items():
+            layout[kind] = (first, count)
+            first += count
+        return layout
+
+    def dma_request_layout(self):
+        """Return ``{kind: first}`` for the :data:`DMA_REQUESTS` in order; each instance has
+        a request line per entry of ``DMA_REQUESTS[kind]``."""
+        layout = {}
+        first = 0
+        for kind, lines in DMA_REQUESTS.items():
+            layout[kind] = first
+            first += self.counts[kind] * len(lines)
+        return layout
+
+    def c_header(self):
+        """Return ``peripherals.h``: counts, addresses and register pointers of the
+        peripherals, and the numbers of their interrupt sources and DMA request lines."""
+        def define(name, value, comment=None):
+            line = f"#define {name:<23} {value}"
+            return line if comment is None else f"{line:<55} // {comment}"
+
+        lines = [
+            "/* Generated from [chipflow.peripherals] in chipflow.toml, do not edit */",
+            "#ifndef PERIPHERALS_H",
+            "#define PERIPHERALS_H",
+            "",
+            '#include "generated/soc.h"',
+            "",
+            "// Instances of a kind are KIND_REGS(0) to KIND_REGS(KIND_COUNT - 1), with the type of",
+            "// the pointers in soc.h",
+        ]
+        for kind, count in self.counts.items():
+            if kind not in self.bases:
+                continue
+            prefix = kind.upper()
+            lines += [
+                define(f"{prefix}_COUNT", count),
+                define(f"{prefix}_BASE", f"{self.bases[kind]:#010x}"),
+                define(f"{prefix}_STRIDE", f"{self.strides[kind]:#x}"),
+            ]
+            if count and not (kind == "motor_pwm" and self.options[kind].get("bank", False)):
+                first = PERIPHERAL_KINDS[kind].csr.format(0).upper()
+                lines.append(define(f"{prefix}_REGS(n)", f"((__typeof__({first}))"
+                                    f"({prefix}_BASE + (n) * {prefix}_STRIDE))"))
+
+        lines += ["", "// Interrupt controller sources"]
+        layout = self.irq_layout()
+        for kind, (first, count) in layout.items():
+            if kind == "dma":
+                lines.append(define("IRQ_DMA", first, IRQ_SOURCES[kind]))
+            elif count < self.counts[kind]:
+                lines.append(define(f"IRQ_{kind.upper()}(n)", first,
+                                    f"{IRQ_SOURCES[kind]}, shared by all"))
+            else:
+                lines.append(define(f"IRQ_{kind.upper()}(n)", f"({first} + (n))", IRQ_SOURCES[kind]))
+        lines.append(define("IRQ_COUNT", sum(count for _, count in layout.values())))
+
+        lines += ["", "// DMA request lines, for DMA_CTRL_REQ_SEL()"]
+        for kind, first in self.dma_request_layout().items():
+            per = len(DMA_REQUESTS[kind])
+            for offset, (line, comment) in enumerate(DMA_REQUESTS[kind].items()):
+                name = "_".join(filter(None, ["DMA_REQ", kind.upper(), line.upper()]))
+                index = "(n)" if per == 1 else f"{per} * (n)"
+                lines.append(define(f"{name}(n)", f"({first + offset} + {index})", comment))
+
+        lines += ["", "#endif", ""]
+        return "\n".join(lines)
+
+
+def config_path():
+    """Return the path of the project's ``chipflow.toml``: that in ``$CHIPFLOW_ROOT`` if it is
+    set, otherwise that of the project this package is in, whatever the working directory."""
+    root = os.environ.get("CHIPFLOW_ROOT") or Path(__file__).resolve().parent.parent
+    return Path(root) / "chipflow.toml"
+
+
+def load_peripheral_map(path=None, *, csr_data_width=8, counts=None):
+    """Return the :class:`PeripheralMap` of the project configuration at ``path`` (default:
+    :func:`config_path`), with the instance counts in ``counts`` (``{kind: count}``)
+    overriding it."""
+    if path is None:
+        path = config_path()
+    with open(path, "rb") as f:
+        config = tomllib.load(f)
+    try:
+        config = config["chipflow"]["peripherals"]
+    except KeyError:
+        raise ChipFlowError(f"No [chipflow.peripherals] table in {path}") from None
+    for kind, count in (counts or {}).items():
+        config[kind] = {**config.get(kind, {}), "count": count}
+    return PeripheralMap(config, csr_data_width=csr_data_width)
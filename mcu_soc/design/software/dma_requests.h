@@ -0,0 +1,9 @@
+/* SPDX-License-Identifier: BSD-2-Clause */
+#ifndef DMA_REQUESTS_H
+#define DMA_REQUESTS_H
+
+// DMA request lines for DMA_CTRL_REQ_SEL(), DMA_REQ_UART_TX(n) etc., numbered as MySoC
+// connects them
+#include "peripherals.h"
+
+#endif
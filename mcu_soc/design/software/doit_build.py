@@ -1,65 +1,119 @@
 import os
+import re
+import json
+import filecmp
 import sys
 from pathlib import Path
 import shutil
 
 from doit import create_after
+from doit.tools import config_changed
 import chipflow.config
 
+from ..peripherals import config_path, load_peripheral_map
+
 
 CHIPFLOW_SOFTWARE_DIR = chipflow.config.get_dir_software()
 BUILD_DIR = "./build/software"
 DESIGN_DIR = os.path.dirname(__file__) + "/.."
 RISCVCC = f"{sys.executable} -m ziglang cc -target riscv32-freestanding-musl"
 CINCLUDES = f"-I. -I{BUILD_DIR} -I{DESIGN_DIR}/software"
-LINKER_SCR = f"{BUILD_DIR}/generated/sections.lds"
+GENERATED_LINKER_SCR = f"{BUILD_DIR}/generated/sections.lds"
+LINKER_SCR = f"{BUILD_DIR}/sections.lds"
 SOFTWARE_START = f"{BUILD_DIR}/generated/start.S"
+# the files staged into BUILD_DIR by the last build, see `_remove_stale`
+STAGED_LIST = f"{BUILD_DIR}/staged.json"
+# peripheral counts, addresses, interrupt sources and DMA request lines, from chipflow.toml
+PERIPHERALS_H = f"{BUILD_DIR}/peripherals.h"
 CFLAGS = "-g -mcpu=baseline_rv32-a-c-d -mabi=ilp32 -Wl,-Bstatic,-T,"
 CFLAGS += f"{LINKER_SCR},--strip-debug -static -ffreestanding -nostdlib {CINCLUDES}"
+# extra preprocessor definitions, e.g. CHIPFLOW_SOFTWARE_DEFINES="BENCH_RAMFUNC"
+CFLAGS += "".join(f" -D{define}" for define in os.environ.get("CHIPFLOW_SOFTWARE_DEFINES", "").split())
+
+# Functions tagged RAMFUNC (software/ramfunc.h) are linked to run from SRAM, and stored in
+# flash after the initialised data, from where ramfunc_init() copies them at boot.
+RAMFUNC_SECTION = """
+    .ramfunc : AT ( _sidata + SIZEOF(.data) )
+    {
+        . = ALIGN(4);
+        _sramfunc = .;
+        *(.ramfunc)
+        *(.ramfunc*)
+        . = ALIGN(4);
+        _eramfunc = .;
+    } >RAM
+    _siramfunc = LOADADDR(.ramfunc);
+"""
 
 
 def task_gather_depencencies():
-    src_files = []
-    target_files = []
-
-    # Project dependencies
-    rel_paths = _get_source_rel_paths(f"{DESIGN_DIR}/software", ["*.*"])
-    for rel_path in rel_paths:
-        src_files.append(f"{DESIGN_DIR}/software{rel_path}")
-        target_files.append(f"{BUILD_DIR}/{rel_path}")
-
-    # ChipFlow lib dependencies
-    rel_paths = _get_source_rel_paths(
-        f"{CHIPFLOW_SOFTWARE_DIR}/drivers", ["*.h", "*.c", "*.S"])
-    for rel_path in rel_paths:
-        src_files.append(f"{CHIPFLOW_SOFTWARE_DIR}/drivers{rel_path}")
-        target_files.append(f"{BUILD_DIR}/drivers{rel_path}")
-
-    def copy_files():
+    # A subtask per file, so that an edit restages only that file; see `_stage`
+    staged = _staged_files()
+    for src_file, target_file in staged:
+        yield {
+            "name": target_file[len(BUILD_DIR) + 1:],
+            "actions": [(_stage, [src_file, target_file])],
+            "file_dep": [src_file],
+            "targets": [target_file],
+        }
+    yield {
+        "name": "stale",
+        "actions": [(_remove_stale, [[target_file for _, target_file in staged]])],
+        "uptodate": [config_changed(" ".join(target_file for _, target_file in staged))],
+    }
+
+
+def task_peripherals_header():
+    csr_data_width = int(os.environ.get("CHIPFLOW_CSR_DATA_WIDTH", 8))
+    header = load_peripheral_map(csr_data_width=csr_data_width).c_header()
+
+    def write_header():
         _create_build_dir()
-        for i in range(len(src_files)):
-            shutil.copyfile(src_files[i - 1], target_files[i - 1])
+        Path(PERIPHERALS_H).write_text(header)
 
     return {
-        "actions": [(copy_files)],
-        "file_dep": src_files,
-        "targets": target_files,
-        "verbosity": 2
+        "actions": [(write_header)],
+        "file_dep": [str(config_path())],
+        "targets": [PERIPHERALS_H],
+        "uptodate": [config_changed(header)],
+    }
+
+
+def task_linker_script():
+    def add_ramfunc_section():
+        script = Path(GENERATED_LINKER_SCR).read_text()
+        # between the initialised data and the bss
+        script, count = re.subn(r"^(?=[ \t]*\.bss\b)", RAMFUNC_SECTION.lstrip("\n") + "\n", script,
+                                count=1, flags=re.MULTILINE)
+        if count == 0:
+            raise RuntimeError(f"no .bss section to insert .ramfunc before in {GENERATED_LINKER_SCR}")
+        Path(LINKER_SCR).write_text(script)
+
+    return {
+        "actions": [(add_ramfunc_section)],
+        "file_dep": [GENERATED_LINKER_SCR],
+        "targets": [LINKER_SCR],
     }
 
 
 @create_after(executed="gather_depencencies", target_regex=".*/software\\.elf")
 def task_build_software_elf():
+    staged = [target_file for _, target_file in _staged_files()]
+    drivers = [target_file for target_file in staged if target_file.startswith(f"{BUILD_DIR}/drivers/")]
     sources = [SOFTWARE_START]
-    sources += _gather_source_paths(f"{BUILD_DIR}/drivers", ["*.c", "*.S"])
-    sources += _gather_source_paths(f"{BUILD_DIR}", ["*.c"])
+    sources += [target_file for target_file in drivers if target_file.endswith((".c", ".S"))]
+    sources += [target_file for target_file in staged
+                if target_file not in drivers and target_file.endswith((".c", ".S"))]
 
     sources_str = " ".join(sources)
 
     return {
         "actions": [f"{RISCVCC} {CFLAGS} -o {BUILD_DIR}/software.elf {sources_str}"],
-        "file_dep": sources + [LINKER_SCR],
+        # headers included, so that editing one rebuilds the firmware
+        "file_dep": sorted(set(sources + staged)) + [LINKER_SCR, PERIPHERALS_H],
         "targets": [f"{BUILD_DIR}/software.elf"],
+        # rebuild when the flags (e.g. CHIPFLOW_SOFTWARE_DEFINES) change
+        "uptodate": [config_changed(CFLAGS)],
         "verbosity": 2
     }
 
@@ -74,6 +128,39 @@ def task_build_software():
     }
 
 
+def _staged_files():
+    """Return ``(source, target)`` pairs for the files staged into the build directory: the
+    project sources and the ChipFlow drivers."""
+    staged = []
+    for rel_path in _get_source_rel_paths(f"{DESIGN_DIR}/software", ["*.*"]):
+        staged.append((f"{DESIGN_DIR}/software{rel_path}", f"{BUILD_DIR}{rel_path}"))
+    for rel_path in _get_source_rel_paths(f"{CHIPFLOW_SOFTWARE_DIR}/drivers", ["*.h", "*.c", "*.S"]):
+        staged.append((f"{CHIPFLOW_SOFTWARE_DIR}/drivers{rel_path}", f"{BUILD_DIR}/drivers{rel_path}"))
+    return staged
+
+
+def _stage(src_file, target_file):
+    # doit runs this only when the source's hash changed; the copy is also skipped when the
+    # target already has this content, so that its mtime is left alone
+    if os.path.exists(target_file) and filecmp.cmp(src_file, target_file, shallow=False):
+        return
+    Path(target_file).parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(src_file, target_file)
+
+
+def _remove_stale(target_files):
+    # the files staged by the previous run are listed in STAGED_LIST; those that are no
+    # longer staged (their source was removed or renamed) are deleted
+    _create_build_dir()
+    try:
+        previous = json.loads(Path(STAGED_LIST).read_text())
+    except (OSError, ValueError):
+        previous = []
+    for target_file in set(previous) - set(target_files):
+        Path(target_file).unlink(missing_ok=True)
+    Path(STAGED_LIST).write_text(json.dumps(sorted(target_files), indent=1))
+
+
 def _create_build_dir():
     Path(f"{BUILD_DIR}/drivers").mkdir(parents=True, exist_ok=True)
 
@@ -88,13 +175,3 @@ def _get_source_rel_paths(source_dir, globs):
             rel_paths.append(dst)
 
     return rel_paths
-
-
-def _gather_source_paths(source_dir, globs):
-    sources = []
-    for glob in globs:
-        source_paths = list(Path(source_dir).glob(glob))
-        for source_path in source_paths:
-            sources.append(f"{source_dir}/" + str(source_path.name))
-
-    return sources
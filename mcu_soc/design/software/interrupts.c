@@ -0,0 +1,62 @@
+#include <stdint.h>
+#include "generated/soc.h"
+#include "interrupts.h"
+
+#define MCAUSE_INTERRUPT        0x80000000
+#define MCAUSE_MACHINE_EXTERNAL 11
+#define MIE_MEIE                (1 << 11)
+#define MSTATUS_MIE             (1 << 3)
+
+extern void trap_entry(void);
+
+static irq_handler_t handlers[32];
+
+void irq_init(void) {
+    for (unsigned i = 0; i < 32; i++)
+        handlers[i] = 0;
+    INTC->enable = 0;
+    INTC->pending = ~0u;
+    asm volatile ("csrw mtvec, %0" :: "r"(trap_entry));
+    asm volatile ("csrs mie, %0" :: "r"(MIE_MEIE));
+    asm volatile ("csrs mstatus, %0" :: "r"(MSTATUS_MIE));
+}
+
+void irq_attach(unsigned source, irq_handler_t handler, unsigned priority) {
+    handlers[source] = handler;
+    INTC->priority[source] = priority;
+    INTC->pending = 1u << source;
+    INTC->enable |= 1u << source;
+}
+
+void irq_detach(unsigned source) {
+    INTC->enable &= ~(1u << source);
+    handlers[source] = 0;
+}
+
+void irq_mask(unsigned source) {
+    INTC->enable &= ~(1u << source);
+}
+
+// called from trap_entry
+void trap_handler(uint32_t mcause, uint32_t mepc) {
+    if (mcause == (MCAUSE_INTERRUPT | MCAUSE_MACHINE_EXTERNAL)) {
+        uint32_t claim;
+        while ((claim = INTC->claim) & INTC_CLAIM_VALID) {
+            unsigned source = claim & INTC_CLAIM_SOURCE;
+            if (handlers[source])
+                handlers[source](source);
+            else
+                irq_mask(source);
+            INTC->pending = 1u << source;
+        }
+        return;
+    }
+
+    puts("Trap: ");
+    puthex(mcause);
+    puts(" at ");
+    puthex(mepc);
+    puts("\n");
+    while (1)
+        ;
+}
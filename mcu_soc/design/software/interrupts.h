@@ -0,0 +1,38 @@
+/* SPDX-License-Identifier: BSD-2-Clause */
+#ifndef INTERRUPTS_H
+#define INTERRUPTS_H
+
+#include <stdint.h>
+
+// Interrupt controller sources, IRQ_UART(n) etc., numbered as MySoC connects them
+#include "peripherals.h"
+
+typedef void (*irq_handler_t)(unsigned source);
+
+// Point the trap vector at trap_entry (trap.S) and enable the external interrupt, with every
+// source disabled
+void irq_init(void);
+// Call handler when source is signalled; the handler deals with the condition in the
+// peripheral, after which its pending bit is cleared
+void irq_attach(unsigned source, irq_handler_t handler, unsigned priority);
+void irq_detach(unsigned source);
+// A handler that only disables its source, for sources used to wake from irq_wait()
+void irq_mask(unsigned source);
+
+// Disable and restore interrupts globally, around code that checks a condition and then
+// sleeps until it changes: irq_wait() still returns once an enabled source is signalled
+static inline uint32_t irq_save(void) {
+    uint32_t mstatus;
+    asm volatile ("csrrci %0, mstatus, 0x8" : "=r"(mstatus));
+    return mstatus;
+}
+
+static inline void irq_restore(uint32_t mstatus) {
+    asm volatile ("csrs mstatus, %0" :: "r"(mstatus & 0x8));
+}
+
+static inline void irq_wait(void) {
+    asm volatile ("wfi");
+}
+
+#endif
@@ -1,5 +1,6 @@
 #include <stdint.h>
 #include "generated/soc.h"
+#include "ramfunc.h"
 
 char uart_getch_block(volatile uart_regs_t *uart) {
     while (!(uart->rx.status & 0x1))
@@ -7,7 +8,42 @@ char uart_getch_block(volatile uart_regs_t *uart) {
     return uart->rx.data;
 }
 
+#ifdef BENCH_RAMFUNC
+// The same loop, run from flash and from SRAM
+#define BENCH_LOOP(n) \
+    uint32_t x = 0; \
+    for (uint32_t i = 0; i < (n); i++) \
+        x = (x << 1) ^ (x >> 3) ^ i; \
+    return x;
+
+__attribute__((noinline)) uint32_t bench_loop_flash(uint32_t n) { BENCH_LOOP(n) }
+RAMFUNC uint32_t bench_loop_sram(uint32_t n) { BENCH_LOOP(n) }
+
+static inline uint32_t rdcycle(void) {
+    uint32_t cycles;
+    asm volatile ("csrr %0, mcycle" : "=r"(cycles));
+    return cycles;
+}
+
+static void bench_ramfunc(void) {
+    asm volatile ("csrw 0x320, zero"); // mcountinhibit: start mcycle
+    uint32_t start = rdcycle();
+    bench_loop_flash(256);
+    uint32_t flash = rdcycle() - start;
+    start = rdcycle();
+    bench_loop_sram(256);
+    uint32_t sram = rdcycle() - start;
+    puts("Loop flash: ");
+    puthex(flash);
+    puts(" SRAM: ");
+    puthex(sram);
+    puts("\n");
+}
+#endif
+
 void main() {
+    ramfunc_init();
+
     uart_init(UART_0, 25000000/115200);
     uart_init(UART_1, 25000000/115200);
 
@@ -28,6 +64,10 @@ void main() {
     spiflash_set_quad_mode(SPIFLASH);
     puts("Quad mode\n");
 
+#ifdef BENCH_RAMFUNC
+    bench_ramfunc();
+#endif
+
     //
 
     GPIO_1->mode = GPIO_PIN4_PUSH_PULL | GPIO_PIN5_PUSH_PULL \
@@ -40,6 +80,15 @@ void main() {
 
     uart_puts(UART_1, "ABCD");
 
+#ifdef MOTOR_PWM_BANK
+    MOTOR_PWM_BANK->denom = 0xFF;
+    MOTOR_PWM_BANK->duty[0] = 0x1F;
+    MOTOR_PWM_BANK->duty[1] = 0x3F;
+    MOTOR_PWM_BANK->duty[9] = 0x7F;
+    MOTOR_PWM_BANK->dir = (1 << 0) | (1 << 1) | (1 << 9);
+    MOTOR_PWM_BANK->conf = 0x1;
+    MOTOR_PWM_BANK->commit = MOTOR_PWM_BANK_COMMIT;
+#else
     MOTOR_PWM0->numr = 0x1F;
     MOTOR_PWM0->denom = 0xFF;
     MOTOR_PWM0->conf = 0x3;
@@ -51,6 +100,7 @@ void main() {
     MOTOR_PWM9->numr = 0x7F;
     MOTOR_PWM9->denom = 0xFF;
     MOTOR_PWM9->conf = 0x3;
+#endif
 
     /*
     PDM0->outval = 0xFF;
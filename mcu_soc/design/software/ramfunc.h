@@ -0,0 +1,21 @@
+/* SPDX-License-Identifier: BSD-2-Clause */
+#ifndef RAMFUNC_H
+#define RAMFUNC_H
+
+#include <stdint.h>
+
+// Run a function from SRAM rather than flash, for code that needs to execute without
+// waiting on flash fetches (interrupt handlers, control loops). These functions are copied
+// into SRAM by ramfunc_init(), which must be called before any of them.
+#define RAMFUNC __attribute__((section(".ramfunc"), noinline))
+
+// defined by the linker script
+extern uint32_t _siramfunc, _sramfunc, _eramfunc;
+
+static inline void ramfunc_init(void) {
+    const uint32_t *src = &_siramfunc;
+    for (uint32_t *dst = &_sramfunc; dst < &_eramfunc; )
+        *dst++ = *src++;
+}
+
+#endif
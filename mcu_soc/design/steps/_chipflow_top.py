@@ -41,31 +41,21 @@ class ChipflowTop(Elaboratable):
 
         _connect_interface(soc.flash, "flash")
 
-        _connect_interface(soc.user_spi_0, "user_spi0")
-        _connect_interface(soc.user_spi_1, "user_spi1")
-        _connect_interface(soc.user_spi_2, "user_spi2")
-
-        _connect_interface(soc.i2c_0, "i2c0")
-        _connect_interface(soc.i2c_1, "i2c1")
-
-        for pwm_idx in range(10):
-            _connect_interface(getattr(soc, f"motor_pwm{pwm_idx}"), f"motor_pwm{pwm_idx}")
-
-        for ao_idx in range(6):
-            m.d.comb += platform.request(f"pdm_ao_{ao_idx}").o.eq(getattr(soc, f"pdm_ao_{ao_idx}"))
-
-        for gpio_bank in range(2):
-            gpio = getattr(soc, f"gpio_{gpio_bank}")
-            for i in range(8):
-                platform_pin = platform.request(f"gpio{gpio_bank}_{i}")
-                m.d.comb += [
-                    platform_pin.o.eq(gpio.o[i]),
-                    platform_pin.oe.eq(gpio.oe[i]),
-                    gpio.i[i].eq(platform_pin.i),
-                ]
-
-        _connect_interface(soc.uart_0, "uart0")
-        _connect_interface(soc.uart_1, "uart1")
+        # the repeated peripherals, with the pin names of the peripheral map
+        for periph in soc.peripherals:
+            interface = getattr(soc, periph.interface)
+            if periph.kind == "pdm_ao":
+                m.d.comb += platform.request(periph.pins).o.eq(interface.o)
+            elif periph.kind == "gpio":
+                for i in range(soc.gpio_width):
+                    platform_pin = platform.request(f"{periph.pins}_{i}")
+                    m.d.comb += [
+                        platform_pin.o.eq(interface.gpio.o[i]),
+                        platform_pin.oe.eq(interface.gpio.oe[i]),
+                        interface.gpio.i[i].eq(platform_pin.i),
+                    ]
+            else:
+                _connect_interface(interface, periph.pins)
 
         _connect_interface(soc.cpu_jtag, "cpu_jtag")
 
@@ -0,0 +1,176 @@
+import os
+import json
+import shutil
+import hashlib
+import importlib.metadata
+from pathlib import Path
+
+
+__all__ = ["ElaborationCache", "design_key"]
+
+
+DESIGN_DIR = Path(__file__).parent.parent
+
+# Only files that can change the elaborated netlist take part in the key. Firmware and the
+# simulation test vectors are deliberately left out, so a software-only change hits the cache.
+DESIGN_GLOBS = ["**/*.py", "**/*.v", "**/*.sv", "**/*.il"]
+DESIGN_EXCLUDES = ["software", "tests"]
+
+# Environment variables the design reads while it is elaborated.
+KEY_ENVIRON = ["CHIPFLOW_CSR_DATA_WIDTH", "CHIPFLOW_ICACHE_WAYS", "CHIPFLOW_CROSSBAR", "CHIPFLOW_SRAM_SIZE",
+               "CHIPFLOW_DEDUP"]
+
+KEY_PACKAGES = [
+    "amaranth", "amaranth-soc", "amaranth-yosys", "amaranth-boards",
+    "chipflow-lib", "chipflow-digital-ip",
+]
+
+DEFAULT_CACHE_DIR = Path.home() / ".cache" / "chipflow-examples" / "elaboration"
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+
+def _design_files(design_dir):
+    files = set()
+    for glob in DESIGN_GLOBS:
+        for path in design_dir.glob(glob):
+            rel_path = path.relative_to(design_dir)
+            if rel_path.parts[0] in DESIGN_EXCLUDES or path.name.startswith("test_"):
+                continue
+            if "__pycache__" in rel_path.parts:
+                continue
+            files.add(rel_path)
+    return sorted(files)
+
+
+def _package_fingerprint(name):
+    try:
+        dist = importlib.metadata.distribution(name)
+    except importlib.metadata.PackageNotFoundError:
+        return f"{name}: not installed"
+    # Git dependencies keep the same version number across commits, so include the
+    # commit recorded by pip/pdm when there is one.
+    direct_url = dist.read_text("direct_url.json") or ""
+    return f"{name}: {dist.version} {direct_url}"
+
+
+def design_key(*extra, design_dir=DESIGN_DIR):
+    """Return the cache key for the design in ``design_dir``.
+
+    The key covers the hardware sources, ``chipflow.toml``, the pin lock, the installed
+    versions of the packages the design is elaborated with and the environment variables that
+    configure it. ``extra`` distinguishes the
+    different consumers of the cache (e.g. the step name and platform).
+    """
+    digest = hashlib.sha256()
+    for rel_path in _design_files(design_dir):
+        digest.update(str(rel_path.as_posix()).encode("utf-8") + b"\0")
+        digest.update(hashlib.sha256((design_dir / rel_path).read_bytes()).digest())
+    for project_file in ("chipflow.toml", "pins.lock"):
+        path = design_dir.parent / project_file
+        if path.exists():
+            digest.update(project_file.encode("utf-8") + b"\0")
+            digest.update(hashlib.sha256(path.read_bytes()).digest())
+    for name in KEY_PACKAGES:
+        digest.update(_package_fingerprint(name).encode("utf-8") + b"\0")
+    for name in KEY_ENVIRON:
+        digest.update(f"{name}={os.environ.get(name, '')}".encode("utf-8") + b"\0")
+    for item in extra:
+        digest.update(str(item).encode("utf-8") + b"\0")
+    return digest.hexdigest()
+
+
+class ElaborationCache:
+    """On-disk cache of elaborated designs.
+
+    Each entry is a set of named files (RTLIL, Verilog added by the platform, build scripts)
+    stored in its own directory. The cache is bounded in size; when it grows past
+    ``max_size`` bytes the least recently used entries are removed.
+
+    The location and size can be overridden with the ``CHIPFLOW_ELAB_CACHE_DIR`` and
+    ``CHIPFLOW_ELAB_CACHE_SIZE`` environment variables, and setting ``CHIPFLOW_ELAB_CACHE=0``
+    disables it.
+    """
+    def __init__(self, root=None, max_size=None):
+        if root is None:
+            root = os.environ.get("CHIPFLOW_ELAB_CACHE_DIR", DEFAULT_CACHE_DIR)
+        if max_size is None:
+            max_size = int(os.environ.get("CHIPFLOW_ELAB_CACHE_SIZE", DEFAULT_MAX_SIZE))
+        self.root = Path(root)
+        self.max_size = max_size
+        self.enabled = os.environ.get("CHIPFLOW_ELAB_CACHE", "1") != "0"
+
+    def _entry_dir(self, key):
+        return self.root / key
+
+    def get(self, key):
+        """Return the files stored under ``key`` as a ``{filename: content}`` dict, or ``None``."""
+        if not self.enabled:
+            return None
+        entry_dir = self._entry_dir(key)
+        try:
+            with open(entry_dir / "index.json", "r") as f:
+                index = json.load(f)
+            files = {}
+            for filename, kind in index.items():
+                path = entry_dir / "files" / filename
+                files[filename] = path.read_bytes() if kind == "bytes" else \
+                    path.read_text(encoding="utf-8")
+        except (OSError, ValueError):
+            return None
+        # mtime of the entry directory is the LRU timestamp
+        os.utime(entry_dir)
+        return files
+
+    def put(self, key, files):
+        """Store ``files`` (a ``{filename: str | bytes}`` dict) under ``key``."""
+        if not self.enabled:
+            return
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp_dir = self.root / f".{key}.{os.getpid()}.tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        index = {}
+        for filename, content in files.items():
+            path = tmp_dir / "files" / filename
+            path.parent.mkdir(parents=True, exist_ok=True)
+            if isinstance(content, bytes):
+                path.write_bytes(content)
+                index[filename] = "bytes"
+            else:
+                path.write_text(content, encoding="utf-8")
+                index[filename] = "str"
+        with open(tmp_dir / "index.json", "w") as f:
+            json.dump(index, f, indent=2)
+        entry_dir = self._entry_dir(key)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        try:
+            os.replace(tmp_dir, entry_dir)
+        except OSError:
+            # Another process stored the same entry first; its content is identical.
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        total_size = 0
+        for entry_dir in self.root.iterdir():
+            if entry_dir.name.startswith(".") or not entry_dir.is_dir():
+                continue
+            size = sum(path.stat().st_size for path in entry_dir.rglob("*") if path.is_file())
+            entries.append((entry_dir.stat().st_mtime, size, entry_dir))
+            total_size += size
+        for _, size, entry_dir in sorted(entries):
+            if total_size <= self.max_size:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total_size -= size
+
+    def elaborate(self, key, convert):
+        """Return the cached files for ``key``, calling ``convert()`` to produce and store them
+        on a miss."""
+        files = self.get(key)
+        if files is None:
+            files = convert()
+            self.put(key, files)
+        else:
+            print(f"elaboration cache hit: {key[:16]}")
+        return files
@@ -1,17 +1,20 @@
-from amaranth_boards.ulx3s import ULX3S_85F_Platform
-
 from chipflow.platform import BoardStep
 
 from amaranth import *
 from amaranth.lib import wiring
 from amaranth.lib.cdc import ResetSynchronizer
 
-from ..design import MySoC
+from ._elaboration_cache import ElaborationCache, design_key
+
+# The board support package and the design itself are imported by the board step when it
+# runs: every chipflow command imports this module.
 
 class BoardSocWrapper(wiring.Component):
     def __init__(self):
         super().__init__({})
     def elaborate(self, platform):
+        from ..design import MySoC
+
         m = Module()
         m.submodules.soc = soc = MySoC()
 
@@ -66,12 +69,23 @@ class BoardSocWrapper(wiring.Component):
 
 class MyBoardStep(BoardStep):
     def __init__(self, config):
+        from amaranth_boards.ulx3s import ULX3S_85F_Platform
 
         platform = ULX3S_85F_Platform()
 
         super().__init__(config, platform)
 
     def build(self):
-        my_design = BoardSocWrapper()
+        def prepare():
+            my_design = BoardSocWrapper()
+            return dict(self.platform.build(my_design, do_build=False).files)
+
+        cache = ElaborationCache()
+        files = cache.elaborate(design_key("board", type(self.platform).__name__), prepare)
+
+        from amaranth.build.run import BuildPlan
 
-        self.platform.build(my_design, do_program=False)
+        plan = BuildPlan(script="build_top")
+        for filename, content in files.items():
+            plan.add_file(filename, content)
+        plan.execute_local()
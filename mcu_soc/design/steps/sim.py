@@ -4,17 +4,13 @@ from contextlib import contextmanager
 from pathlib import Path
 from pprint import pformat
 
-from doit.cmd_base import TaskLoader2, loader
-from doit.doit_cmd import DoitMain
-from doit.task import dict_to_task
-
-from amaranth import *
-from amaranth.back import rtlil
 from chipflow.platform import SimStep
 from chipflow import ChipFlowError
 
-from ..design import MySoC
-from ..sim.doit_build import VARIABLES, TASKS, DOIT_CONFIG
+from ._elaboration_cache import ElaborationCache, design_key
+
+# doit, the Amaranth back end and the design itself are imported by the functions that use
+# them: every chipflow command imports this module, and most never build the simulator.
 
 EXE = ".exe" if os.name == "nt" else ""
 
@@ -40,32 +36,38 @@ def runtime():
         yield f
 
 
-class ContextTaskLoader(TaskLoader2):
-    def __init__(self, config, tasks, context):
-        self.config = config
-        self.tasks = tasks
-        self.subs = context
-        super().__init__()
-
-    def load_doit_config(self):
-        return loader.load_doit_config(self.config)
-
-    def load_tasks(self, cmd, pos_args):
-        task_list = []
-        # substitute
-        for task in self.tasks:
-            d = {}
-            for k,v in task.items():
-                match v:
-                    case str():
-                        d[k.format(**self.subs)] = v.format(**self.subs)
-                    case list():
-                        d[k.format(**self.subs)] = [i.format(**self.subs) for i in v]
-                    case _:
-                        raise ChipFlowError("Unexpected task definition")
-            print(f"adding task: {pformat(d)}")
-            task_list.append(dict_to_task(d))
-        return task_list
+def _context_task_loader(config, tasks, context):
+    from doit.cmd_base import TaskLoader2, loader
+    from doit.task import dict_to_task
+
+    class ContextTaskLoader(TaskLoader2):
+        def __init__(self, config, tasks, context):
+            self.config = config
+            self.tasks = tasks
+            self.subs = context
+            super().__init__()
+
+        def load_doit_config(self):
+            return loader.load_doit_config(self.config)
+
+        def load_tasks(self, cmd, pos_args):
+            task_list = []
+            # substitute
+            for task in self.tasks:
+                d = {}
+                for k,v in task.items():
+                    match v:
+                        case str():
+                            d[k.format(**self.subs)] = v.format(**self.subs)
+                        case list():
+                            d[k.format(**self.subs)] = [i.format(**self.subs) for i in v]
+                        case _:
+                            raise ChipFlowError("Unexpected task definition")
+                print(f"adding task: {pformat(d)}")
+                task_list.append(dict_to_task(d))
+            return task_list
+
+    return ContextTaskLoader(config, tasks, context)
 
 
 class SimPlatform:
@@ -79,10 +81,22 @@ class SimPlatform:
             content = content.read()
         self.extra_files[filename] = content
 
-    def build(self, e):
+    def build(self, e, *, cache=None, cache_key=None):
         Path(self.build_dir).mkdir(parents=True, exist_ok=True)
 
-        output = rtlil.convert(e, name="sim_top", ports=None, platform=self)
+        def convert():
+            from amaranth.back import rtlil
+            output = rtlil.convert(e, name="sim_top", ports=None, platform=self)
+            return {"sim_soc.il": output, **self.extra_files}
+
+        # Files added through `add_file` during elaboration are part of the cache entry, so
+        # they are restored along with the RTLIL on a hit.
+        if cache is not None:
+            files = cache.elaborate(cache_key, convert)
+        else:
+            files = convert()
+        output = files.pop("sim_soc.il")
+        self.extra_files.update(files)
 
         top_rtlil = Path(self.build_dir) / "sim_soc.il"
         with open(top_rtlil, "w") as rtlil_file:
@@ -104,15 +118,24 @@ class SimPlatform:
 
 
 class MySimStep(SimStep):
+    """The simulation step with the elaboration cache of this module.
+
+    It is not registered in ``[chipflow.steps]``, so ``chipflow sim`` (``pdm sim-run``,
+    ``pdm sim-check``) uses ChipFlow's own simulation step and none of this applies there.
+    """
     def __init__(self, config):
         platform = SimPlatform()
 
         super().__init__(config, platform)
 
     def build(self):
+        from doit.doit_cmd import DoitMain
+        from ..design import MySoC
+        from ..sim.doit_build import VARIABLES, TASKS, DOIT_CONFIG
+
         my_design = MySoC()
 
-        self.platform.build(my_design)
+        self.platform.build(my_design, cache=ElaborationCache(), cache_key=design_key("sim"))
         with common() as common_dir, source() as source_dir, runtime() as runtime_dir:
             context = {
                 "COMMON_DIR": common_dir,
@@ -123,4 +146,4 @@ class MySimStep(SimStep):
             for k,v in VARIABLES.items():
                 context[k] = v.format(**context)
             print(f"substituting:\n{pformat(context)}")
-            DoitMain(ContextTaskLoader(DOIT_CONFIG, TASKS, context)).run(["build_sim"])
+            DoitMain(_context_task_loader(DOIT_CONFIG, TASKS, context)).run(["build_sim"])
@@ -1,17 +1,18 @@
-from amaranth_boards.ulx3s import ULX3S_85F_Platform
-
 from chipflow.platform import BoardStep
 
 from amaranth import *
 from amaranth.lib import wiring
 from amaranth.lib.cdc import ResetSynchronizer
 
-from ..design import MySoC
+# The board support package and the design itself are imported by the board step when it
+# runs: every chipflow command imports this module.
 
 class BoardSocWrapper(wiring.Component):
     def __init__(self):
         super().__init__({})
     def elaborate(self, platform):
+        from ..design import MySoC
+
         m = Module()
         m.submodules.soc = soc = MySoC()
 
@@ -66,6 +67,7 @@ class BoardSocWrapper(wiring.Component):
 
 class MyBoardStep(BoardStep):
     def __init__(self, config):
+        from amaranth_boards.ulx3s import ULX3S_85F_Platform
 
         platform = ULX3S_85F_Platform()
 
@@ -1,6 +1,9 @@
 from chipflow.platform import SoftwareStep
-from ..software import doit_build
 
 
 class MySoftwareStep(SoftwareStep):
-    doit_build_module = doit_build
+    # doit and the build tasks are only imported when the software is built
+    @property
+    def doit_build_module(self):
+        from ..software import doit_build
+        return doit_build
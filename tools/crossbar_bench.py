@@ -0,0 +1,44 @@
+"""Reference firmware cycles with the shared Wishbone arbiter and with the crossbar.
+
+For each interconnect, and each instruction cache configuration given with ``--icache-ways``,
+the software and the CXXRTL simulator of ``mcu_soc`` are rebuilt with ``CHIPFLOW_CROSSBAR``
+(and ``CHIPFLOW_ICACHE_WAYS``) set, and the reference scenario is run; the count is the
+timestamp of the last logged event.
+
+    pdm crossbar-bench [--icache-ways 0 2]
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+try:
+    from .csr_bench import firmware_cycles
+except ImportError:
+    from csr_bench import firmware_cycles
+
+repo_dir = Path(__file__).resolve().parent.parent
+
+INTERCONNECTS = {"shared": 0, "crossbar": 1}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--icache-ways", nargs="*", type=int, choices=[0, 1, 2], default=[0],
+                        help="instruction cache configurations to combine with (default: 0)")
+    args = parser.parse_args()
+
+    print("mcu_soc reference firmware")
+    print(f"  {'icache':>6} " + " ".join(f"{name:>12}" for name in INTERCONNECTS) + f" {'change':>8}")
+    for ways in args.icache_ways:
+        cycles = {name: firmware_cycles(repo_dir / "mcu_soc", {"CHIPFLOW_CROSSBAR": value,
+                                                               "CHIPFLOW_ICACHE_WAYS": ways})
+                  for name, value in INTERCONNECTS.items()}
+        change = cycles["crossbar"] / cycles["shared"] - 1
+        print(f"  {ways:>6} " + " ".join(f"{count:>12,}" for count in cycles.values()) +
+              f" {change:>+8.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""Register access latency for each CSR data width.
+
+Two measurements:
+
+* Bus cycles per register access, as the CPU sees them: ``PWMPeripheral`` and
+  ``PDMPeripheral`` are simulated under ``amaranth.sim`` behind the same interconnect as in
+  ``MySoC`` (a ``csr.Decoder`` and ``WishboneCSRBridge`` for an 8-bit CSR bus, the peripheral
+  itself for a 32-bit one), and each register is read and written once over Wishbone. The
+  count runs from the cycle the access is issued to the one it is acknowledged in.
+* Total cycles of the reference firmware: for each width, the software and the CXXRTL
+  simulator of ``mcu_soc`` are rebuilt with ``CHIPFLOW_CSR_DATA_WIDTH`` set, and the reference
+  scenario is run; the count is the timestamp of the last logged event. Skipped with
+  ``--no-soc``.
+
+    pdm csr-bench [--widths 8 32] [--no-soc]
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+from pathlib import Path
+
+try:
+    from .event_log import iter_events
+except ImportError:
+    from event_log import iter_events
+
+repo_dir = Path(__file__).resolve().parent.parent
+
+WIDTHS = [8, 32]
+
+
+async def _access(ctx, bus, addr, value=None):
+    ctx.set(bus.adr, addr)
+    ctx.set(bus.sel, (1 << len(bus.sel)) - 1)
+    ctx.set(bus.we, value is not None)
+    ctx.set(bus.dat_w, value or 0)
+    ctx.set(bus.cyc, 1)
+    ctx.set(bus.stb, 1)
+    cycles = 1
+    await ctx.tick()
+    while not ctx.get(bus.ack):
+        cycles += 1
+        await ctx.tick()
+    ctx.set(bus.cyc, 0)
+    ctx.set(bus.stb, 0)
+    await ctx.tick() # idle cycle between accesses
+    return cycles
+
+
+def access_cycles(ip, data_width):
+    """Return ``{register: (read_cycles, write_cycles)}`` for the peripheral ``ip`` ("pwm" or
+    "pdm") built with ``data_width``."""
+    sys.path.insert(0, str(repo_dir))
+    from amaranth import Module
+    from amaranth_soc import csr
+    from amaranth_soc.csr.wishbone import WishboneCSRBridge
+    from mcu_soc.design.ips.testing import run_simulation
+
+    if ip == "pwm":
+        from mcu_soc.design.ips.pwm import PWMPeripheral, PWMPins
+        dut = PWMPeripheral(pins=PWMPins(), fifo_depth=8, data_width=data_width)
+    else:
+        from mcu_soc.design.ips.pdm import PDMPeripheral
+        dut = PDMPeripheral(bitwidth=10, order=2, fifo_depth=8, data_width=data_width)
+
+    m = Module()
+    m.submodules.dut = dut
+    if data_width == 8:
+        m.submodules.csr_decoder = csr_decoder = csr.Decoder(addr_width=dut.bus.addr_width, data_width=8)
+        csr_decoder.add(dut.bus, name=ip)
+        m.submodules.wb_to_csr = wb_to_csr = WishboneCSRBridge(csr_decoder.bus, data_width=32)
+        bus = wb_to_csr.wb_bus
+    else:
+        bus = dut.bus
+
+    # the same byte offsets through the bridge, whose CSR decoder maps the peripheral at 0
+    registers = [("_".join(map(str, info.path[-1])), info.start)
+                 for info in dut.bus.memory_map.all_resources()]
+    results = {}
+
+    async def testbench(ctx):
+        for name, start in registers:
+            read = await _access(ctx, bus, start // 4)
+            write = await _access(ctx, bus, start // 4, ctx.get(bus.dat_r))
+            results[name] = (read, write)
+
+    run_simulation(m, testbench, name=f"csr_bench/{ip}{data_width}")
+    return results
+
+
+def run_firmware(project_dir, environ):
+    """Rebuild the software and simulator of ``project_dir`` with the design options in
+    ``environ`` (e.g. ``{"CHIPFLOW_CSR_DATA_WIDTH": "32"}``), run the reference scenario and
+    return the path of its event log."""
+    env = {**os.environ, "CHIPFLOW_ROOT": str(project_dir),
+           **{name: str(value) for name, value in environ.items()}}
+    sim_dir = project_dir / "build" / "sim"
+    for step in (["chipflow", "software"], ["chipflow", "sim", "build"]):
+        subprocess.run(step, cwd=project_dir, env=env, check=True, stdout=subprocess.DEVNULL)
+    subprocess.run([str(sim_dir / "sim_soc")], cwd=sim_dir, env=env, check=True,
+                   stdout=subprocess.DEVNULL)
+    return sim_dir / "events.json"
+
+
+def firmware_cycles(project_dir, environ):
+    """As :func:`run_firmware`, returning the cycle count of the reference scenario."""
+    events = run_firmware(project_dir, environ)
+    return max((event["timestamp"] for event in iter_events(events)), default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--widths", nargs="*", type=int, choices=WIDTHS, default=WIDTHS,
+                        help="CSR data widths to measure (default: 8 32)")
+    parser.add_argument("--no-soc", action="store_true",
+                        help="only measure the register accesses, not the reference firmware")
+    args = parser.parse_args()
+
+    for ip in ("pwm", "pdm"):
+        per_width = {width: access_cycles(ip, width) for width in args.widths}
+        print(f"{ip} bus cycles per access (read/write)")
+        print(f"  {'register':<12} " + " ".join(f"{f'{width}-bit':>10}" for width in args.widths))
+        for name in per_width[args.widths[0]]:
+            print(f"  {name:<12} " + " ".join(f"{'{}/{}'.format(*per_width[width][name]):>10}"
+                                             for width in args.widths))
+
+    if not args.no_soc:
+        print("mcu_soc reference firmware")
+        baseline = None
+        for width in args.widths:
+            cycles = firmware_cycles(repo_dir / "mcu_soc", {"CHIPFLOW_CSR_DATA_WIDTH": width})
+            baseline = cycles if baseline is None else baseline
+            print(f"  {width:>2}-bit: {cycles:,} cycles ({cycles / baseline:.1%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
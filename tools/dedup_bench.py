@@ -0,0 +1,91 @@
+"""Elaboration time and netlist size of ``mcu_soc`` with and without peripheral deduplication.
+
+For each motor count, ``MySoC`` is converted to RTLIL with ``CHIPFLOW_DEDUP`` unset and set,
+for a platform that collects the module files the deduplicator adds. The netlist size is the
+total size of the RTLIL and the number of cells in it. With ``--yosys``, the time taken by
+Yosys to read the netlist and flatten it, as ``chipflow sim build`` does, is also reported.
+
+    pdm dedup-bench [--motor-count 10 100] [--yosys]
+"""
+
+import os
+import sys
+import time
+import argparse
+import shutil
+import subprocess
+import tempfile
+from pathlib import Path
+
+repo_dir = Path(__file__).resolve().parent.parent
+
+MODES = {"off": "0", "on": "1"}
+
+
+class BenchPlatform:
+    def __init__(self):
+        self.extra_files = {}
+
+    def add_file(self, filename, content):
+        self.extra_files[filename] = content
+
+
+def convert(motor_count, dedup):
+    """Return ``(elaboration_s, files)``, where ``files`` maps file names to RTLIL text."""
+    from amaranth.back import rtlil
+    from mcu_soc.design.design import MySoC
+
+    os.environ["CHIPFLOW_DEDUP"] = MODES[dedup]
+    platform = BenchPlatform()
+    start = time.perf_counter()
+    output = rtlil.convert(MySoC(motor_count=motor_count), name="sim_top", platform=platform)
+    elapsed = time.perf_counter() - start
+    return elapsed, {"sim_top.il": output, **platform.extra_files}
+
+
+def yosys_time(files):
+    with tempfile.TemporaryDirectory() as build_dir:
+        script = []
+        for filename, content in files.items():
+            Path(build_dir, filename).write_text(content)
+            script.append(f"read_rtlil {filename}")
+        script += ["hierarchy -top sim_top", "flatten", "proc"]
+        start = time.perf_counter()
+        subprocess.run(["yosys", "-q", "-p", "; ".join(script)], cwd=build_dir, check=True)
+        return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--motor-count", nargs="*", type=int, default=[10, 100],
+                        help="motor counts to measure (default: 10 100)")
+    parser.add_argument("--yosys", action="store_true",
+                        help="also time Yosys reading and flattening the netlist")
+    args = parser.parse_args()
+    if args.yosys and shutil.which("yosys") is None:
+        parser.error("yosys is not on the PATH")
+
+    # MySoC finds its software sources relative to the project directory
+    sys.path.insert(0, str(repo_dir))
+    os.chdir(repo_dir / "mcu_soc")
+
+    print("mcu_soc elaboration")
+    print(f"  {'motors':>6} {'dedup':>5} {'elab s':>8} {'RTLIL KiB':>10} {'cells':>8} {'modules':>7}" +
+          (f" {'yosys s':>8}" if args.yosys else ""))
+    for motor_count in args.motor_count:
+        for dedup in MODES:
+            elapsed, files = convert(motor_count, dedup)
+            text = "".join(files.values())
+            size = sum(len(content.encode("utf-8")) for content in files.values())
+            cells = sum(line.lstrip().startswith("cell ") for line in text.splitlines())
+            modules = sum(line.startswith("module ") for line in text.splitlines())
+            line = (f"  {motor_count:>6} {dedup:>5} {elapsed:>8.2f} {size / 1024:>10,.0f} "
+                    f"{cells:>8,} {modules:>7,}")
+            if args.yosys:
+                line += f" {yosys_time(files):>8.2f}"
+            print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
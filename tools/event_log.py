@@ -0,0 +1,281 @@
+"""Reading and writing simulation event logs.
+
+Event logs come in two formats with the same content:
+
+* JSON, as written by the simulator: ``{"events": [{"timestamp": ..., "peripheral": ...,
+  "event": ..., "payload": ...}, ...]}``.
+* A compact columnar binary format (conventionally ``.evl``), laid out so that it can be
+  memory-mapped and its columns used in place::
+
+      magic        8 bytes   b"CFEVLOG1"
+      n_strings    u32
+      reserved     u32
+      n_events     u64
+      strings      (n_strings + 1) x u32 end offsets into the UTF-8 blob that follows,
+                   padded to a multiple of 8 bytes
+      timestamp    n_events x u64
+      payload      n_events x i64    integer value, or string table index
+      peripheral   n_events x u32    string table index
+      event        n_events x u32    string table index
+      payload_kind n_events x u8     one of the PAYLOAD_* constants
+
+  All integers are little-endian. Peripheral and event names, and string payloads, are
+  interned in the string table. Payloads that are not strings or 64-bit integers are stored
+  as their JSON encoding, so conversion is lossless in both directions.
+
+Convert between the formats with::
+
+    python tools/event_log.py to-binary events.json events.evl
+    python tools/event_log.py to-json events.evl events.json
+"""
+
+import os
+import sys
+import json
+import mmap
+import struct
+import argparse
+from array import array
+from pathlib import Path
+
+MAGIC = b"CFEVLOG1"
+HEADER = struct.Struct("<8sIIQ")
+
+PAYLOAD_INT = 0
+PAYLOAD_STR = 1
+PAYLOAD_JSON = 2
+
+CHUNK_SIZE = 1 << 20
+
+EVENT_KEYS = ("timestamp", "peripheral", "event", "payload")
+
+working_dir = Path(os.environ["PDM_RUN_CWD"] if "PDM_RUN_CWD" in os.environ else "./")
+
+
+def is_binary(path):
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def _pad8(n):
+    return (n + 7) & ~7
+
+
+def _column(buf, offset, typecode, count):
+    size = array(typecode).itemsize * count
+    view = memoryview(buf)[offset:offset + size]
+    if sys.byteorder == "little":
+        return view.cast(typecode), offset + size
+    column = array(typecode, view.tobytes())
+    column.byteswap()
+    return column, offset + size
+
+
+class EventLog:
+    """A memory-mapped binary event log.
+
+    The columns (``timestamp``, ``payload``, ``peripheral``, ``event``, ``payload_kind``) are
+    exposed as sequences of integers backed directly by the file, and ``strings`` holds the
+    interned strings. Iterating over the log yields events as dictionaries, as they appear in
+    the JSON format.
+    """
+    def __init__(self, path):
+        self._file = open(path, "rb")
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file
+            self._file.close()
+            raise ValueError(f"{path}: not a binary event log")
+        magic, n_strings, _, n_events = HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path}: not a binary event log")
+
+        offset = HEADER.size
+        ends, offset = _column(self._mmap, offset, "I", n_strings + 1)
+        blob = self._mmap[offset:offset + ends[n_strings]]
+        self.strings = [blob[start:end].decode("utf-8")
+                        for start, end in zip([0, *ends[:n_strings]], ends[:n_strings])]
+        offset = _pad8(offset + ends[n_strings])
+
+        self.timestamp, offset = _column(self._mmap, offset, "Q", n_events)
+        self.payload, offset = _column(self._mmap, offset, "q", n_events)
+        self.peripheral, offset = _column(self._mmap, offset, "I", n_events)
+        self.event, offset = _column(self._mmap, offset, "I", n_events)
+        self.payload_kind, offset = _column(self._mmap, offset, "B", n_events)
+
+    def close(self):
+        for name in ("timestamp", "payload", "peripheral", "event", "payload_kind"):
+            column = self.__dict__.pop(name, None)
+            if isinstance(column, memoryview):
+                column.release()
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def _payload(self, index):
+        kind = self.payload_kind[index]
+        value = self.payload[index]
+        if kind == PAYLOAD_INT:
+            return value
+        if kind == PAYLOAD_STR:
+            return self.strings[value]
+        return json.loads(self.strings[value])
+
+    def __iter__(self):
+        strings = self.strings
+        for index in range(len(self)):
+            yield {
+                "timestamp": self.timestamp[index],
+                "peripheral": strings[self.peripheral[index]],
+                "event": strings[self.event[index]],
+                "payload": self._payload(index),
+            }
+
+
+def iter_json_events(path):
+    """Yield the entries of the ``events`` array in the JSON event log at ``path`` one at a
+    time, holding at most one read chunk and one event in memory."""
+    decoder = json.JSONDecoder()
+    with open(path, "r") as f:
+        buf, pos = "", 0
+
+        def refill():
+            nonlocal buf, pos
+            chunk = f.read(CHUNK_SIZE)
+            buf, pos = buf[pos:] + chunk, 0
+            return bool(chunk)
+
+        # find the opening bracket of the events array
+        while True:
+            key = buf.find('"events"')
+            start = buf.find("[", key) if key >= 0 else -1
+            if start >= 0:
+                break
+            if not refill():
+                raise ValueError(f"{path}: no \"events\" array found")
+        pos = start + 1
+
+        while True:
+            while True:
+                while pos < len(buf) and (buf[pos].isspace() or buf[pos] == ","):
+                    pos += 1
+                if pos < len(buf) or not refill():
+                    break
+            if pos >= len(buf):
+                raise ValueError(f"{path}: unterminated \"events\" array")
+            if buf[pos] == "]":
+                return
+            try:
+                event, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                # an event straddles the end of the buffer
+                if not refill():
+                    raise
+                continue
+            yield event
+            pos = end
+
+
+def iter_events(path):
+    """Yield the events of a log in either format."""
+    if is_binary(path):
+        with EventLog(path) as log:
+            yield from log
+    else:
+        yield from iter_json_events(path)
+
+
+def write_binary(events, path):
+    """Write the ``events`` iterable to ``path`` in the binary format."""
+    strings = {}
+
+    def intern(s):
+        index = strings.get(s)
+        if index is None:
+            index = strings[s] = len(strings)
+        return index
+
+    timestamp, payload = array("Q"), array("q")
+    peripheral, event, payload_kind = array("I"), array("I"), array("B")
+    for ev in events:
+        if set(ev) != set(EVENT_KEYS):
+            raise ValueError(f"Cannot store event {ev}: expected exactly the keys {', '.join(EVENT_KEYS)}")
+        timestamp.append(ev["timestamp"])
+        peripheral.append(intern(ev["peripheral"]))
+        event.append(intern(ev["event"]))
+        value = ev["payload"]
+        if type(value) is int and -2**63 <= value < 2**63:
+            payload_kind.append(PAYLOAD_INT)
+            payload.append(value)
+        elif isinstance(value, str):
+            payload_kind.append(PAYLOAD_STR)
+            payload.append(intern(value))
+        else:
+            payload_kind.append(PAYLOAD_JSON)
+            payload.append(intern(json.dumps(value)))
+
+    blob = bytearray()
+    ends = array("I")
+    for s in strings:
+        blob += s.encode("utf-8")
+        ends.append(len(blob))
+    ends.append(len(blob))
+    if sys.byteorder == "big":
+        for column in (ends, timestamp, payload, peripheral, event):
+            column.byteswap()
+
+    tmp_path = Path(f"{path}.tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(strings), 0, len(timestamp)))
+        f.write(ends.tobytes())
+        f.write(blob)
+        f.write(b"\0" * (_pad8(f.tell()) - f.tell()))
+        for column in (timestamp, payload, peripheral, event, payload_kind):
+            f.write(column.tobytes())
+    os.replace(tmp_path, path)
+
+
+def write_json(events, path):
+    """Write the ``events`` iterable to ``path`` in the layout used by the simulator."""
+    with open(path, "w") as f:
+        f.write('{\n"events": [\n')
+        first = True
+        for ev in events:
+            if not first:
+                f.write(",\n")
+            fields = ", ".join(f"{json.dumps(key)}: {json.dumps(value, ensure_ascii=False)}"
+                               for key, value in ev.items())
+            f.write(f"{{ {fields} }}")
+            first = False
+        f.write("\n]\n}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert event logs between JSON and binary")
+    parser.add_argument("direction", choices=["to-binary", "to-json"])
+    parser.add_argument("input", type=Path)
+    parser.add_argument("output", type=Path)
+    args = parser.parse_args()
+
+    input_path = args.input if args.input.is_absolute() else working_dir / args.input
+    output_path = args.output if args.output.is_absolute() else working_dir / args.output
+
+    if args.direction == "to-binary":
+        write_binary(iter_events(input_path), output_path)
+    else:
+        write_json(iter_events(input_path), output_path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
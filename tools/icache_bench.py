@@ -0,0 +1,111 @@
+"""Instruction fetch cycles with and without the instruction cache.
+
+Two measurements:
+
+* A fetch trace under ``amaranth.sim``: a loop of ``--loop-words`` sequential instructions
+  executed ``--iterations`` times is fetched from a Wishbone memory model answering after
+  ``--latency`` cycles (the flash), either directly or through an ``ICache`` of each
+  configuration, counting cycles and the cache's hits and misses.
+* Total cycles of the reference firmware: for each configuration, the software and the CXXRTL
+  simulator of ``mcu_soc`` are rebuilt with ``CHIPFLOW_ICACHE_WAYS`` set, and the reference
+  scenario is run; the count is the timestamp of the last logged event. Skipped with
+  ``--no-soc``.
+
+    pdm icache-bench [--ways 0 1 2] [--latency 20] [--no-soc]
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+try:
+    from .csr_bench import firmware_cycles
+except ImportError:
+    from csr_bench import firmware_cycles
+
+repo_dir = Path(__file__).resolve().parent.parent
+
+WAYS = [0, 1, 2]
+
+
+def trace_cycles(ways, *, loop_words, iterations, latency, sets):
+    """Return ``(cycles, hits, misses)`` for the fetch trace with ``ways`` (0 for no cache)."""
+    sys.path.insert(0, str(repo_dir))
+    from amaranth import Module, ClockDomain
+    from amaranth_soc import wishbone
+    from mcu_soc.design.ips.icache import ICache
+    from mcu_soc.design.ips.testing import CSRDriver, WishboneMemory, run_simulation
+
+    if ways:
+        dut = ICache(base=0, size=1 << 24, ways=ways, sets=sets)
+        bus, mem_bus = dut.bus, dut.mem
+        regs = CSRDriver(dut, bus=dut.csr_bus, backdoor=True)
+    else:
+        # nothing between the fetches and the memory model
+        dut = Module()
+        dut.domains.sync = ClockDomain()
+        bus = mem_bus = wishbone.Signature(addr_width=30, data_width=32, granularity=8).create()
+    mem = WishboneMemory(mem_bus, latency=latency)
+    results = []
+
+    async def testbench(ctx):
+        cycles = 0
+        for _ in range(iterations):
+            for addr in range(loop_words):
+                ctx.set(bus.adr, addr)
+                ctx.set(bus.sel, 0b1111)
+                ctx.set(bus.cyc, 1)
+                ctx.set(bus.stb, 1)
+                cycles += 1
+                await ctx.tick()
+                while not ctx.get(bus.ack):
+                    cycles += 1
+                    await ctx.tick()
+                ctx.set(bus.cyc, 0)
+                ctx.set(bus.stb, 0)
+        if ways:
+            results.append((cycles, await regs.read(ctx, "hits"), await regs.read(ctx, "misses")))
+        else:
+            results.append((cycles, 0, iterations * loop_words))
+
+    run_simulation(dut, testbench, name=f"icache_bench/ways{ways}", background=[mem.serve])
+    return results[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--ways", nargs="*", type=int, choices=WAYS, default=WAYS,
+                        help="cache configurations, 0 for none (default: 0 1 2)")
+    parser.add_argument("--sets", type=int, default=64, help="sets per way (default: 64)")
+    parser.add_argument("--loop-words", type=int, default=192,
+                        help="instructions in the loop of the fetch trace (default: 192)")
+    parser.add_argument("--iterations", type=int, default=16,
+                        help="times the loop is executed (default: 16)")
+    parser.add_argument("--latency", type=int, default=20,
+                        help="cycles for the memory model to answer a fetch (default: 20)")
+    parser.add_argument("--no-soc", action="store_true",
+                        help="only measure the fetch trace, not the reference firmware")
+    args = parser.parse_args()
+
+    print(f"fetch trace: {args.loop_words} words x {args.iterations}, latency {args.latency}")
+    print(f"  {'ways':>4} {'cycles':>10} {'hits':>8} {'misses':>8} {'speedup':>8}")
+    baseline = None
+    for ways in args.ways:
+        cycles, hits, misses = trace_cycles(ways, loop_words=args.loop_words,
+                                            iterations=args.iterations, latency=args.latency,
+                                            sets=args.sets)
+        baseline = cycles if baseline is None else baseline
+        print(f"  {ways:>4} {cycles:>10,} {hits:>8,} {misses:>8,} {baseline / cycles:>7.2f}x")
+
+    if not args.no_soc:
+        print("mcu_soc reference firmware")
+        baseline = None
+        for ways in args.ways:
+            cycles = firmware_cycles(repo_dir / "mcu_soc", {"CHIPFLOW_ICACHE_WAYS": ways})
+            baseline = cycles if baseline is None else baseline
+            print(f"  {ways} ways: {cycles:,} cycles ({cycles / baseline:.1%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Import time of the chipflow step modules, checked against a budget.
+
+Every ``chipflow`` command imports the step modules of the project (``design/steps/*.py``),
+so what they import at module level is paid for by each invocation. Each module is imported
+under ``python -X importtime`` in its project directory, after ``chipflow.platform``, which
+every step needs anyway; what it costs on top of that is its import time. The run fails if that
+is over the budget, or if a step module pulls in one of the :data:`DEFERRED` modules, which
+must only be imported by the step that uses them.
+
+    pdm import-bench [--projects mcu_soc minimal] [--budget-ms 50] [--runs 5]
+"""
+
+import sys
+import argparse
+import subprocess
+from pathlib import Path
+
+repo_dir = Path(__file__).resolve().parent.parent
+
+BASELINE = "chipflow.platform"
+
+# heavy modules that step modules import where they use them, not at module level
+DEFERRED = [
+    "doit",
+    "amaranth_boards",
+    "amaranth.back.rtlil",
+    "amaranth_soc",
+    "chipflow_digital_ip",
+    "design.design",
+]
+
+
+def step_modules(project_dir):
+    return [f"design.steps.{path.stem}" for path in sorted((project_dir / "design" / "steps").glob("*.py"))
+            if not path.stem.startswith("_")]
+
+
+def import_cost(project_dir, module):
+    """Return ``(seconds, modules)``: the time taken to import ``module`` after
+    :data:`BASELINE`, and the modules that imported."""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c",
+                             f"import {BASELINE}; import {module}"],
+                            cwd=project_dir, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{result.stderr}")
+    entries = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, _, name = line[len("import time:"):].split("|")
+        # nested imports are indented further than the single space before top-level ones
+        nested = len(name) - len(name.lstrip()) > 1
+        entries.append((name.strip(), nested, int(self_us)))
+    # the baseline is the last top-level entry before the module's own imports
+    start = max(i for i, (name, nested, _) in enumerate(entries) if name == BASELINE and not nested)
+    entries = entries[start + 1:]
+    return sum(self_us for _, _, self_us in entries) / 1e6, [name for name, _, _ in entries]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", nargs="*", default=["mcu_soc", "minimal"],
+                        help="projects whose step modules to import (default: mcu_soc minimal)")
+    parser.add_argument("--budget-ms", type=float, default=50,
+                        help="import time allowed per step module (default: 50)")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="imports per module, the fastest counts (default: 5)")
+    args = parser.parse_args()
+
+    failures = []
+    print(f"step module import time, after {BASELINE}")
+    for project in args.projects:
+        project_dir = repo_dir / project
+        for module in step_modules(project_dir):
+            results = [import_cost(project_dir, module) for _ in range(args.runs)]
+            seconds = min(seconds for seconds, _ in results)
+            deferred = sorted({name for name in results[0][1]
+                               for heavy in DEFERRED
+                               if name == heavy or name.startswith(f"{heavy}.")})
+            over = seconds * 1e3 > args.budget_ms
+            status = "FAIL" if over or deferred else "ok"
+            print(f"  {project + ':' + module:<32} {seconds * 1e3:>8.1f} ms  {status}")
+            if over:
+                failures.append(f"{project}: {module} takes {seconds * 1e3:.1f} ms to import, "
+                                f"over the budget of {args.budget_ms:g} ms")
+            if deferred:
+                failures.append(f"{project}: {module} imports {', '.join(deferred)}")
+
+    for failure in failures:
+        print(f"FAIL {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
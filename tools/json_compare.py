@@ -1,42 +1,177 @@
-import json
 import os
 import sys
+import json
+import hashlib
+import argparse
+import itertools
+import collections
 from pathlib import Path
-from pprint import pformat
-
-working_dir = Path(os.environ["PDM_RUN_CWD"] if "PDM_RUN_CWD" in os.environ else "./")
+from concurrent.futures import ProcessPoolExecutor
 
-gold_path = Path(sys.argv[1])
-gate_path = Path(sys.argv[2])
+try:
+    from .event_log import iter_events
+except ImportError:
+    from event_log import iter_events
 
-gold_path = gold_path if gold_path.is_absolute() else working_dir / gold_path
-gate_path = gate_path if gate_path.is_absolute() else working_dir / gate_path
+working_dir = Path(os.environ["PDM_RUN_CWD"] if "PDM_RUN_CWD" in os.environ else "./")
 
 def on_ci():
     if "CI" in os.environ and os.environ["CI"]:
         return True
     return False
 
+def summarize(path):
+    """Return the number of events, a digest of the order in which peripherals appear and a
+    ``{peripheral: (count, digest)}`` summary of each peripheral's events."""
+    order = hashlib.sha256()
+    order_pending = []
+    peripherals = {}
+    count = 0
+
+    # Hashing in batches keeps the per-event cost to a list append.
+    def flush(digest, pending):
+        digest.update("".join(pending).encode("utf-8"))
+        pending.clear()
+
+    for event in iter_events(path):
+        name = event["peripheral"]
+        order_pending.append(name + "\0")
+        if len(order_pending) == 4096:
+            flush(order, order_pending)
+        if name not in peripherals:
+            peripherals[name] = [0, hashlib.sha256(), []]
+        entry = peripherals[name]
+        entry[0] += 1
+        # canonical, so that payloads equal as JSON values hash the same regardless of key
+        # order; numbers equal across types (1, 1.0, true) still differ, see compare()
+        entry[2].append(json.dumps([event["event"], event["payload"]], sort_keys=True) + "\0")
+        if len(entry[2]) == 4096:
+            flush(entry[1], entry[2])
+        count += 1
+
+    flush(order, order_pending)
+    summary = {}
+    for name, (n, digest, pending) in peripherals.items():
+        flush(digest, pending)
+        summary[name] = (n, digest.hexdigest())
+    return count, order.hexdigest(), summary
+
+def _same_event(ev_gold, ev_gate):
+    return ev_gold["peripheral"] == ev_gate["peripheral"] and \
+           ev_gold["event"] == ev_gate["event"] and \
+           ev_gold["payload"] == ev_gate["payload"]
+
+def _peripheral_events(path, name):
+    return (event for event in iter_events(path) if event["peripheral"] == name)
+
+def peripheral_mismatches(gold_path, gate_path, name, limit):
+    """Compare the events of peripheral ``name`` in two logs, streaming both, and return up to
+    ``limit`` mismatching pairs, with ``None`` standing in for an event missing from one of the
+    logs."""
+    mismatches = []
+    for ev_gold, ev_gate in itertools.zip_longest(_peripheral_events(gold_path, name),
+                                                  _peripheral_events(gate_path, name)):
+        if ev_gold is None or ev_gate is None or not _same_event(ev_gold, ev_gate):
+            mismatches.append((ev_gold, ev_gate))
+            if len(mismatches) == limit:
+                break
+    return mismatches
+
+def order_mismatch(gold_path, gate_path):
+    """Return the first pair of events at which the order of peripherals diverges."""
+    for ev_gold, ev_gate in zip(iter_events(gold_path), iter_events(gate_path)):
+        if ev_gold["peripheral"] != ev_gate["peripheral"]:
+            return ev_gold, ev_gate
+    return None
+
+def _timestamp(mismatch):
+    ev_gold, ev_gate = mismatch
+    return (ev_gold or ev_gate).get("timestamp", 0)
+
+class _NullPool:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *exc_info):
+        return False
+
+def _map(pool, fn, *iterables):
+    if pool is None:
+        return list(map(fn, *iterables))
+    return list(pool.map(fn, *iterables))
+
+def _print_region(path, timestamp, context=10):
+    """Print the events of the log at ``path`` around ``timestamp``: up to ``context`` events
+    before it and ``context`` events from it on."""
+    before = collections.deque(maxlen=context)
+    after = []
+    for event in iter_events(path):
+        if after or event.get("timestamp", 0) >= timestamp:
+            after.append(event)
+            if len(after) == context:
+                break
+        else:
+            before.append(event)
+    for event in itertools.chain(before, after):
+        print(f"  {json.dumps(event)}")
+    print()
+
+def compare(gold_path, gate_path, *, max_mismatches=10, jobs=None):
+    jobs = jobs or os.cpu_count() or 1
+    with ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else _NullPool() as pool:
+        (gold_count, gold_order, gold_periphs), (gate_count, gate_order, gate_periphs) = \
+            _map(pool, summarize, [gold_path, gate_path])
+
+        if gold_count == gate_count and gold_order == gate_order and gold_periphs == gate_periphs:
+            print("Success! Event logs are identical")
+            return 0
+
+        if gold_count != gate_count:
+            print(f"Failed! Event mismatch: {gold_count} events in reference, {gate_count} in test output")
+
+        # Each peripheral whose digests differ is compared event by event in its own worker,
+        # which streams both logs and keeps only its first few mismatches: digests that differ
+        # only through values that are equal in Python (1 and 1.0) are not mismatches.
+        names = sorted(name for name in gold_periphs.keys() | gate_periphs.keys()
+                       if gold_periphs.get(name) != gate_periphs.get(name))
+        mismatches = list(itertools.chain.from_iterable(
+            _map(pool, peripheral_mismatches, itertools.repeat(gold_path),
+                 itertools.repeat(gate_path), names, itertools.repeat(max_mismatches))))
+        if not mismatches and gold_order != gate_order:
+            mismatches.append(order_mismatch(gold_path, gate_path))
+        mismatches = sorted(filter(None, mismatches), key=_timestamp)[:max_mismatches]
+
+    if not mismatches:
+        print("Success! Event logs are identical")
+        return 0
+
+    print(f"Failed! First {len(mismatches)} mismatching events:")
+    for ev_gold, ev_gate in mismatches:
+        print(f"  at {_timestamp((ev_gold, ev_gate))}: reference event {ev_gold} mismatches test event {ev_gate}")
+    if gold_count != gate_count and on_ci():
+        # The logs can be millions of events long, and either may be binary: show only the
+        # events around the first mismatch, one JSON object per line.
+        print("Test output around the first mismatch:")
+        _print_region(gate_path, _timestamp(mismatches[0]))
+        print("Reference events around the first mismatch:")
+        _print_region(gold_path, _timestamp(mismatches[0]))
+    return 1
+
 def main():
-    with open(gold_path, "r") as f:
-        gold = json.load(f)
-    with open(gate_path, "r") as f:
-        gate = json.load(f)
-    if len(gold["events"]) != len(gate["events"]):
-        print(f"Failed! Event mismatch: {len(gold['events'])} events in reference, {len(gate['events'])} in test output")
-        if on_ci():
-            print(f"Test Output:\n{pformat(gate)}\n")
-            print(f"Reference events:\n{pformat(gold)}\n")
-        return 1
-    for ev_gold, ev_gate in zip(gold["events"], gate["events"]):
-        if ev_gold["peripheral"] != ev_gate["peripheral"] or \
-           ev_gold["event"] != ev_gate["event"] or \
-           ev_gold["payload"] != ev_gate["payload"]:
-            print(f"Failed! Reference event {ev_gold} mismatches test event {ev_gate}")
-            return 1
-
-    print("Success! Event logs are identical")
-    return 0
+    parser = argparse.ArgumentParser(description="Compare a simulation event log against a reference. "
+                                                 "Either log may be JSON or binary (see event_log.py).")
+    parser.add_argument("reference", type=Path)
+    parser.add_argument("test", type=Path)
+    parser.add_argument("-n", "--max-mismatches", type=int, default=10,
+                        help="number of mismatching events to report (default: 10)")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="number of worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    gold_path = args.reference if args.reference.is_absolute() else working_dir / args.reference
+    gate_path = args.test if args.test.is_absolute() else working_dir / args.test
+
+    return compare(gold_path, gate_path, max_mismatches=args.max_mismatches, jobs=args.jobs)
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
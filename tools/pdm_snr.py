@@ -0,0 +1,101 @@
+"""Spectral benchmark of the PDM modulators.
+
+Simulates ``PDMPeripheral`` of each order with a sine streamed through its sample FIFO, one
+sample every ``--osr`` cycles, captures the output bit stream and reports its in-band SNR
+(Hann-windowed FFT, band up to half the sample rate) and the equivalent number of bits,
+alongside that of the quantised samples themselves, which bounds what any modulator can reach.
+With ``--min-snr``, fails if the highest order measured falls short of it.
+
+    pdm pdm-snr [--orders 1 2] [--cycles 262144] [--osr 64] [--min-snr 50]
+"""
+
+import sys
+import argparse
+from pathlib import Path
+
+repo_dir = Path(__file__).resolve().parent.parent
+
+
+def capture_stream(order, *, bitwidth, cycles, osr, signal_bin, amplitude):
+    """Simulate a modulator of ``order`` fed with a sine of ``signal_bin`` periods over
+    ``cycles``, and return the captured output as a boolean array."""
+    sys.path.insert(0, str(repo_dir))
+    from mcu_soc.design.ips.pdm import PDMPeripheral
+    from mcu_soc.design.ips.testing import CSRDriver, wait_for, run_simulation
+    from mcu_soc.design.ips.testing.stream import sine_codes, capture
+
+    fifo_depth = 16
+    dut = PDMPeripheral(bitwidth=bitwidth, order=order, fifo_depth=fifo_depth)
+    regs = CSRDriver(dut)
+    level = regs.register("fifo_status").f.level.r_data
+    samples = sine_codes(cycles // osr, bitwidth, signal_bin, amplitude=amplitude)
+    words = []
+
+    async def feeder(ctx):
+        # the only one on the bus: enables the stream once the FIFO is half full
+        await regs.write(ctx, "divider", osr - 1)
+        await regs.write(ctx, "conf", 0x2) # streaming, disabled
+        for index, sample in enumerate(samples):
+            if index == fifo_depth // 2:
+                await regs.write(ctx, "conf", 0x3) # streaming, enabled
+            while ctx.get(level) >= fifo_depth - 2:
+                await ctx.tick()
+            await regs.write(ctx, "fifo", int(sample))
+
+    async def testbench(ctx):
+        await wait_for(ctx, regs.value("conf"), 0x3)
+        words.append(await capture(ctx, dut.pdm.o, cycles))
+
+    run_simulation(dut, testbench, feeder, name=f"pdm_snr/order{order}")
+    return words[0].astype(bool)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--orders", nargs="*", type=int, choices=[1, 2], default=[1, 2],
+                        help="modulator orders to measure (default: 1 2)")
+    parser.add_argument("--bitwidth", type=int, default=10, help="sample width (default: 10)")
+    parser.add_argument("--cycles", type=int, default=1 << 18,
+                        help="length of the captured stream (default: 262144)")
+    parser.add_argument("--osr", type=int, default=64,
+                        help="oversampling ratio, cycles per FIFO sample (default: 64)")
+    parser.add_argument("--amplitude", type=float, default=0.5,
+                        help="sine amplitude relative to full scale (default: 0.5, -6 dBFS)")
+    parser.add_argument("--min-snr", type=float, metavar="DB",
+                        help="fail if the highest order's SNR is below this")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(repo_dir))
+    import numpy as np
+    from mcu_soc.design.ips.testing.stream import snr_db, sine_codes
+
+    band = args.cycles // (2 * args.osr)
+    # an odd number of periods over the capture, a fifth of the way into the band
+    signal_bin = band // 5 | 1
+
+    # the samples themselves, held for `osr` cycles each
+    samples = sine_codes(args.cycles // args.osr, args.bitwidth, signal_bin, amplitude=args.amplitude)
+    rows = {"samples": snr_db(np.repeat(samples, args.osr), signal_bin, band)}
+
+    results = {}
+    for order in sorted(args.orders):
+        print(f"Simulating order {order}...")
+        bits = capture_stream(order, bitwidth=args.bitwidth, cycles=args.cycles, osr=args.osr,
+                              signal_bin=signal_bin, amplitude=args.amplitude)
+        results[order] = rows[f"order {order}"] = snr_db(bits, signal_bin, band)
+
+    print(f"{'source':>8} {'snr_db':>8} {'enob':>6}")
+    for source, snr in rows.items():
+        print(f"{source:>8} {snr:>8.1f} {(snr - 1.76) / 6.02:>6.1f}")
+
+    if args.min_snr is not None and results:
+        order, snr = max(results.items())
+        if snr < args.min_snr:
+            print(f"Failed! Order {order} SNR of {snr:.1f} dB is below {args.min_snr:.1f} dB")
+            return 1
+        print("Success!")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,61 @@
+"""Cycles of a tight loop run from flash and from SRAM.
+
+The ``mcu_soc`` software is built with ``BENCH_RAMFUNC`` defined, which times the same loop
+compiled into flash and into SRAM (tagged ``RAMFUNC`` and copied there at boot) with the
+``mcycle`` counter, and prints both counts on ``uart_0``. The simulator is rebuilt with
+``CHIPFLOW_SRAM_SIZE`` and, optionally, ``CHIPFLOW_ICACHE_WAYS`` set, and the reference
+scenario is run for each instruction cache configuration.
+
+    pdm ramfunc-bench [--sram-size 0x800] [--icache-ways 0 2]
+"""
+
+import re
+import sys
+import argparse
+from pathlib import Path
+
+try:
+    from .csr_bench import run_firmware
+    from .event_log import iter_events
+except ImportError:
+    from csr_bench import run_firmware
+    from event_log import iter_events
+
+repo_dir = Path(__file__).resolve().parent.parent
+
+RESULT = re.compile(r"Loop flash: ([0-9a-fA-F]+) SRAM: ([0-9a-fA-F]+)")
+
+
+def loop_cycles(sram_size, icache_ways):
+    """Return the ``(flash, sram)`` cycle counts printed by the firmware."""
+    events = run_firmware(repo_dir / "mcu_soc", {
+        "CHIPFLOW_SOFTWARE_DEFINES": "BENCH_RAMFUNC",
+        "CHIPFLOW_SRAM_SIZE": hex(sram_size),
+        "CHIPFLOW_ICACHE_WAYS": icache_ways,
+    })
+    text = "".join(chr(event["payload"]) for event in iter_events(events)
+                   if event["peripheral"] == "uart_0" and event["event"] == "tx")
+    match = RESULT.search(text)
+    if match is None:
+        raise RuntimeError(f"no loop cycle counts in the uart_0 output: {text!r}")
+    return int(match[1], 16), int(match[2], 16)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sram-size", type=lambda value: int(value, 0), default=0x800,
+                        help="SRAM size in bytes (default: 0x800)")
+    parser.add_argument("--icache-ways", nargs="*", type=int, choices=[0, 1, 2], default=[0],
+                        help="instruction cache configurations (default: 0)")
+    args = parser.parse_args()
+
+    print(f"256-iteration loop, {args.sram_size:#x} bytes of SRAM")
+    print(f"  {'icache':>6} {'flash':>10} {'sram':>10} {'speedup':>8}")
+    for ways in args.icache_ways:
+        flash, sram = loop_cycles(args.sram_size, ways)
+        print(f"  {ways:>6} {flash:>10,} {sram:>10,} {flash / sram:>7.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
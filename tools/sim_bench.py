@@ -0,0 +1,291 @@
+"""Simulation throughput benchmarks with regression gating.
+
+Benchmarks:
+
+* ``ip/pwm``, ``ip/pdm``: ``PWMPeripheral`` and ``PDMPeripheral`` under ``amaranth.sim``, using
+  the harness in ``mcu_soc/design/ips/testing``.
+* ``<project>/soc``: a clean ``chipflow sim build`` of the project, then the CXXRTL simulator
+  running the reference scenario (``design/tests/input.json``); the software must already be
+  built with ``chipflow software``. The cycle count is the timestamp of the last logged event.
+
+Each benchmark runs in its own process, and records simulated cycles per second, build time
+(SoC only), peak RSS and simulator binary size (SoC only). The results are appended to a JSON
+history file, and compared against the median of the previous runs on the same host: the
+run fails if any metric is worse than that by more than the threshold.
+
+    pdm sim-bench [--projects mcu_soc minimal] [--history sim_bench_history.json]
+                  [--threshold 0.25] [--threshold build_s=0.5] [--no-record]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import argparse
+import statistics
+import subprocess
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    from .event_log import iter_events
+except ImportError:
+    from event_log import iter_events
+
+working_dir = Path(os.environ["PDM_RUN_CWD"] if "PDM_RUN_CWD" in os.environ else "./")
+repo_dir = Path(__file__).resolve().parent.parent
+
+EXE = ".exe" if os.name == "nt" else ""
+
+# metric: True if higher is better
+METRICS = {
+    "cycles_per_s": True,
+    "build_s": False,
+    "peak_rss_kb": False,
+    "binary_bytes": False,
+}
+
+IP_CYCLES = {
+    "pwm": 200_000,
+    "pdm": 200_000,
+}
+
+
+def _ip_bench(name, cycles):
+    # Runs in a child process, see `_run_measured`.
+    sys.path.insert(0, str(repo_dir))
+    from mcu_soc.design.ips.testing import CSRDriver, run_simulation
+
+    if name == "pwm":
+        from mcu_soc.design.ips.pwm import PWMPeripheral, PWMPins
+        dut = PWMPeripheral(pins=PWMPins())
+        config = {"numr": 0x1F, "denom": 0xFF, "conf": 0x1}
+    else:
+        from mcu_soc.design.ips.pdm import PDMPeripheral
+        dut = PDMPeripheral(bitwidth=10)
+        config = {"outval": 0x155, "conf": 0x1}
+    regs = CSRDriver(dut)
+
+    async def testbench(ctx):
+        for reg, value in config.items():
+            await regs.write(ctx, reg, value)
+        await ctx.tick().repeat(cycles)
+
+    # the harness appends its result to CHIPFLOW_SIM_REPORT, which the parent reads
+    run_simulation(dut, testbench, name=f"ip/{name}")
+
+
+# Runs a command and writes its wall-clock time and peak RSS to the file descriptor given first.
+# ru_maxrss of RUSAGE_CHILDREN is the largest of all the children a process has waited for, so
+# every measured command gets a process of its own to report it.
+_MEASURE = """\
+import os, sys, time, resource, subprocess
+start = time.perf_counter()
+returncode = subprocess.call(sys.argv[2:])
+elapsed = time.perf_counter() - start
+maxrss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+os.write(int(sys.argv[1]), f"{elapsed} {maxrss}".encode())
+sys.exit(returncode)
+"""
+
+
+def _run_measured(args, **kwargs):
+    """Run a command to completion and return its wall-clock time and peak RSS in KiB. The
+    peak RSS is None where it cannot be measured (Windows)."""
+    if resource is None:
+        start = time.perf_counter()
+        subprocess.run(args, check=True, **kwargs)
+        return time.perf_counter() - start, None
+
+    read_fd, write_fd = os.pipe()
+    with os.fdopen(read_fd, "rb") as report:
+        try:
+            # -I: the command's working directory must not shadow the modules _MEASURE imports
+            proc = subprocess.Popen([sys.executable, "-I", "-S", "-c", _MEASURE, str(write_fd),
+                                     *args], pass_fds=(write_fd,), **kwargs)
+        finally:
+            os.close(write_fd)
+        measured = report.read().split()
+    if proc.wait() != 0:
+        raise subprocess.CalledProcessError(proc.returncode, args)
+    elapsed, maxrss = measured
+    # ru_maxrss is in bytes on macOS, KiB elsewhere
+    peak_rss_kb = int(maxrss) // 1024 if sys.platform == "darwin" else int(maxrss)
+    return float(elapsed), peak_rss_kb
+
+
+def bench_ip(name):
+    fd, report = tempfile.mkstemp(prefix="sim-bench-", suffix=".jsonl")
+    os.close(fd)
+    try:
+        _, peak_rss_kb = _run_measured(
+            [sys.executable, __file__, "--ip", name],
+            env={**os.environ, "CHIPFLOW_SIM_REPORT": report, "CHIPFLOW_SIM_TRACE": "0"})
+        with open(report) as f:
+            result = json.loads(f.readlines()[-1])
+    finally:
+        os.unlink(report)
+    return {
+        "cycles_per_s": result["cycles"] / result["seconds"],
+        "build_s": None,
+        "peak_rss_kb": peak_rss_kb,
+        "binary_bytes": None,
+    }
+
+
+def bench_soc(project_dir):
+    env = {**os.environ, "CHIPFLOW_ROOT": str(project_dir)}
+    sim_dir = project_dir / "build" / "sim"
+    if not (project_dir / "build" / "software" / "software.bin").exists():
+        raise FileNotFoundError(f"{project_dir}/build/software/software.bin not found, "
+                                f"run `chipflow software` first")
+
+    shutil.rmtree(sim_dir, ignore_errors=True)
+    build_s, _ = _run_measured(["chipflow", "sim", "build"], cwd=project_dir, env=env,
+                               stdout=subprocess.DEVNULL)
+    binary = sim_dir / f"sim_soc{EXE}"
+    run_s, peak_rss_kb = _run_measured([str(binary)], cwd=sim_dir, env=env,
+                                       stdout=subprocess.DEVNULL)
+    cycles = max((event["timestamp"] for event in iter_events(sim_dir / "events.json")), default=0)
+    return {
+        "cycles_per_s": cycles / run_s,
+        "build_s": build_s,
+        "peak_rss_kb": peak_rss_kb,
+        "binary_bytes": binary.stat().st_size,
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=repo_dir, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _load_history(path):
+    if not path.exists():
+        return {"runs": []}
+    with open(path) as f:
+        return json.load(f)
+
+
+def _save_history(path, history):
+    tmp_path = path.with_name(f"{path.name}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(history, f, indent=2)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def _parse_thresholds(values):
+    thresholds = dict.fromkeys(METRICS, 0.25)
+    for value in values:
+        metric, sep, fraction = value.rpartition("=")
+        if sep and metric not in METRICS:
+            raise ValueError(f"Unknown metric '{metric}', expected one of: {', '.join(METRICS)}")
+        for name in ([metric] if sep else METRICS):
+            thresholds[name] = float(fraction)
+    return thresholds
+
+
+def regressions(results, previous_runs, thresholds, *, window=5):
+    """Compare ``results`` against the median of the last ``window`` previous runs and return
+    a list of ``(benchmark, metric, baseline, value)`` for each metric that is worse than the
+    baseline by more than its threshold."""
+    found = []
+    for bench, metrics in results.items():
+        for metric, higher_is_better in METRICS.items():
+            value = metrics.get(metric)
+            history = [run["results"][bench][metric] for run in previous_runs
+                       if run["results"].get(bench, {}).get(metric) is not None][-window:]
+            if value is None or not history:
+                continue
+            baseline = statistics.median(history)
+            if higher_is_better:
+                regressed = value < baseline * (1 - thresholds[metric])
+            else:
+                regressed = value > baseline * (1 + thresholds[metric])
+            if regressed:
+                found.append((bench, metric, baseline, value))
+    return found
+
+
+def _format(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:,.2f}"
+    return f"{value:,}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--projects", nargs="*", default=["mcu_soc", "minimal"],
+                        help="projects whose full-SoC simulation to benchmark (default: mcu_soc minimal)")
+    parser.add_argument("--ips", nargs="*", choices=list(IP_CYCLES), default=list(IP_CYCLES),
+                        help="amaranth.sim benchmarks to run (default: all)")
+    parser.add_argument("--history", type=Path, default=Path("sim_bench_history.json"),
+                        help="JSON history file (default: sim_bench_history.json)")
+    parser.add_argument("--threshold", action="append", default=[], metavar="[METRIC=]FRACTION",
+                        help="allowed regression against the baseline, for all metrics or one "
+                             "(default: 0.25)")
+    parser.add_argument("--window", type=int, default=5,
+                        help="number of previous runs the baseline is the median of (default: 5)")
+    parser.add_argument("--no-record", action="store_true", help="do not append this run to the history")
+    parser.add_argument("--ip", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.ip:
+        _ip_bench(args.ip, IP_CYCLES[args.ip])
+        return 0
+
+    thresholds = _parse_thresholds(args.threshold)
+    history_path = args.history if args.history.is_absolute() else working_dir / args.history
+
+    results = {}
+    for name in args.ips:
+        print(f"Running ip/{name}...")
+        results[f"ip/{name}"] = bench_ip(name)
+    for project in args.projects:
+        print(f"Running {project}/soc...")
+        results[f"{project}/soc"] = bench_soc(repo_dir / project)
+
+    print(f"{'benchmark':<16} " + " ".join(f"{metric:>14}" for metric in METRICS))
+    for bench, metrics in results.items():
+        print(f"{bench:<16} " + " ".join(f"{_format(metrics[metric]):>14}" for metric in METRICS))
+
+    history = _load_history(history_path)
+    host = socket.gethostname()
+    previous_runs = [run for run in history["runs"] if run.get("host") == host]
+    found = regressions(results, previous_runs, thresholds, window=args.window)
+
+    if not args.no_record:
+        history["runs"].append({
+            "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "host": host,
+            "revision": _git_revision(),
+            "results": results,
+        })
+        _save_history(history_path, history)
+
+    if found:
+        print(f"Failed! {len(found)} metrics regressed:")
+        for bench, metric, baseline, value in found:
+            print(f"  {bench} {metric}: {_format(value)} against a baseline of {_format(baseline)} "
+                  f"(threshold {thresholds[metric]:.0%})")
+        return 1
+    print("Success! No regressions")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
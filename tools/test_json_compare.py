@@ -0,0 +1,93 @@
+import io
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+from contextlib import redirect_stdout
+
+from tools.event_log import write_binary, write_json
+from tools.json_compare import compare
+
+
+def make_events(n, *, peripheral="uart_0"):
+    return [{"timestamp": 10 * i, "peripheral": peripheral, "event": "tx", "payload": i % 256}
+            for i in range(n)]
+
+
+class CompareTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def run_compare(self, gold, gate, *, ci=False, jobs=1):
+        output = io.StringIO()
+        with mock.patch.dict(os.environ), redirect_stdout(output):
+            os.environ.pop("CI", None)
+            if ci:
+                os.environ["CI"] = "1"
+            result = compare(gold, gate, jobs=jobs)
+        return result, output.getvalue()
+
+    def test_identical(self):
+        write_json(make_events(100), self.dir / "gold.json")
+        write_binary(make_events(100), self.dir / "gate.evl")
+        result, output = self.run_compare(self.dir / "gold.json", self.dir / "gate.evl")
+        self.assertEqual(result, 0)
+        self.assertIn("Success!", output)
+
+    def test_count_mismatch_binary_on_ci(self):
+        gold = make_events(10000)
+        gate = gold[:5000] + gold[5001:]
+        write_json(gold, self.dir / "gold.json")
+        write_binary(gate, self.dir / "gate.evl")
+        result, output = self.run_compare(self.dir / "gold.json", self.dir / "gate.evl", ci=True)
+        self.assertEqual(result, 1)
+        self.assertIn("10000 events in reference, 9999 in test output", output)
+        self.assertIn("Test output around the first mismatch:", output)
+        self.assertIn('"timestamp": 50010', output)
+        # only the region around the mismatch is printed, not the whole log
+        self.assertNotIn('"timestamp": 0,', output)
+        self.assertLess(len(output.splitlines()), 100)
+
+    def test_count_mismatch_off_ci(self):
+        gold = make_events(100)
+        write_json(gold, self.dir / "gold.json")
+        write_binary(gold[:-1], self.dir / "gate.evl")
+        result, output = self.run_compare(self.dir / "gold.json", self.dir / "gate.evl")
+        self.assertEqual(result, 1)
+        self.assertNotIn("around the first mismatch", output)
+
+    def test_payload_mismatch(self):
+        gold = make_events(100)
+        gate = [dict(event) for event in gold]
+        gate[42]["payload"] = 0
+        write_binary(gold, self.dir / "gold.evl")
+        write_binary(gate, self.dir / "gate.evl")
+        result, output = self.run_compare(self.dir / "gold.evl", self.dir / "gate.evl")
+        self.assertEqual(result, 1)
+        self.assertIn("at 420:", output)
+
+    def test_mismatches_per_peripheral(self):
+        gold = sorted(make_events(1000, peripheral="uart_0") + make_events(1000, peripheral="gpio_0"),
+                      key=lambda event: event["timestamp"])
+        gate = [dict(event) for event in gold]
+        for event in gate:
+            if event["peripheral"] == "gpio_0" and event["timestamp"] >= 5000:
+                event["payload"] = -1
+        write_binary(gold, self.dir / "gold.evl")
+        write_json(gate, self.dir / "gate.json")
+        result, output = self.run_compare(self.dir / "gold.evl", self.dir / "gate.json", jobs=2)
+        self.assertEqual(result, 1)
+        self.assertIn("First 10 mismatching events:", output)
+        self.assertIn("at 5000:", output)
+        self.assertIn("at 5090:", output)
+        self.assertNotIn("at 5100:", output)
+        self.assertNotIn("'uart_0'", output)
+
+
+if __name__ == "__main__":
+    unittest.main()